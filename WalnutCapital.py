@@ -1,26 +1,103 @@
+import time
+STARTED = time.perf_counter()
+
 import tkinter as tk
-import pulp
-from tkinter import ttk, messagebox, Canvas
-from pulp import LpProblem, LpVariable, LpMaximize, lpSum
+from tkinter import ttk, messagebox, Canvas, filedialog, simpledialog
 from tkinter import PhotoImage
-from PIL import Image, ImageTk
-import webbrowser
-from pulp import COIN_CMD
+import json
+import multiprocessing
 import os
-import sys
-from pulp import COIN_CMD
-
-# Determine if we're running in a bundle or a normal Python environment
-is_bundle = getattr(sys, 'frozen', False)
-
-# Set the path to the CBC binary accordingly
-if is_bundle:
-    cbc_path = os.path.join(sys._MEIPASS, 'cbc')
-else:
-    cbc_path = '/opt/homebrew/bin/cbc'  # Default path for development
-
-# Use the CBC binary path for PuLP
-my_solver = COIN_CMD(path=cbc_path)
+import tempfile
+import threading
+import diagnostics
+import grid
+
+# NumPy, SciPy and PuLP make up most of a cold start, so the modules that need
+# them are imported by load_modules() in the background once the splash is up
+ami = background = cache = montecarlo = optimizer = None
+solve_cache = None
+modules_loaded = threading.Event()
+module_error = None
+
+# Startup timings (s), reported with the 'startup' diagnostics record
+startup = {}
+
+# How often the GUI checks on background solves (ms)
+POLL_INTERVAL = 250
+
+# Scenarios behind the Risk Analysis window
+RISK_SCENARIOS = 1000000
+
+# Columns of the unit and AMI grids; the unit columns are named as in batch
+# parcel CSVs, so those import as they are
+UNIT_COLUMNS = (
+    ('unit', "Unit Type", str, ''),
+    ('sqft', "Sq. Ft.", float, 0),
+    ('rent', "Monthly Rent", float, 0),
+    ('people', "Min People", grid.int_cell, 1),
+    ('min_units', "Min Units (%)", float, 0),
+    ('max_units', "Max Units (%)", float, 100),
+)
+AMI_COLUMNS = (
+    ('people', "Household Size", grid.int_cell, None),
+    ('income', "100% AMI Income", float, 0),
+)
+AMI_VISIBLE_ROWS = 8
+
+LOGO_PATH = "Walnut/WalnutLogo.png"  # Update this path
+LOGO_SIZE = (300, 300)
+
+# Set WALNUT_LOG to a file to record timings and solver statistics of every solve as JSON lines
+diagnostics.log_from_environment()
+
+
+def load_modules():
+    global ami, background, cache, montecarlo, optimizer, solve_cache, module_error
+    start = time.perf_counter()
+    try:
+        import ami
+        import background
+        import cache
+        import montecarlo
+        import optimizer
+
+        # Solve results are memoized for the session; set WALNUT_CACHE to a file to keep them across launches
+        solve_cache = cache.SolveCache(path=os.environ.get('WALNUT_CACHE'))
+    except Exception as e:
+        module_error = e
+    finally:
+        startup['modules_loaded'] = time.perf_counter() - start
+        modules_loaded.set()
+    diagnostics.emit('startup', **startup)
+
+
+def scaled_logo(path=LOGO_PATH, size=LOGO_SIZE):
+    """Path of a PNG copy of the logo scaled to `size`.
+
+    The copy is made once with PIL and kept next to the original, or in the
+    temp directory when that is not writable (as in the bundle). It is
+    remade when the original is newer, and Tk reads it directly, so later
+    launches need neither PIL nor the resize.
+    """
+    name = "{}_{}x{}.png".format(os.path.splitext(os.path.basename(path))[0], *size)
+    directories = [os.path.dirname(path) or '.', os.path.join(tempfile.gettempdir(), 'walnut')]
+    source_time = os.path.getmtime(path) if os.path.exists(path) else 0
+    for directory in directories:
+        scaled = os.path.join(directory, name)
+        if os.path.exists(scaled) and os.path.getmtime(scaled) >= source_time:
+            return scaled
+
+    from PIL import Image
+    image = Image.open(path).resize(size, Image.Resampling.LANCZOS)
+    for directory in directories:
+        scaled = os.path.join(directory, name)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            image.save(scaled)
+            return scaled
+        except OSError:
+            continue
+    raise IOError(f"cannot write the scaled logo {name}")
 
 
 class ScrollableFrame(ttk.Frame):
@@ -60,14 +137,12 @@ class OptimizationApp:
         self.canvas.pack()
 
 
-        # Load and resize the logo image
+        # Load the logo, pre-scaled and cached after the first launch
         try:
-            original_image = Image.open("Walnut/WalnutLogo.png")  # Update this path
-            resized_image = original_image.resize((300, 300), Image.Resampling.LANCZOS)  # Resize as needed
-            self.logo_image = ImageTk.PhotoImage(resized_image)
+            self.logo_image = PhotoImage(file=scaled_logo())
             self.canvas.create_image(300, 150, image=self.logo_image)  # Adjust the position as needed
-        except IOError as e:
-            print(f"Error loading the logo image: {e}")
+        except (IOError, ImportError, tk.TclError) as e:
+            diagnostics.emit('warning', message=f"Error loading the logo image: {e}")
         self.setup_ui()
 
     def setup_ui(self):
@@ -113,6 +188,16 @@ class OptimizationApp:
         )
 
     def initialize_main_interface(self):
+        # The solver modules may still be loading in the background; carry on once they are in
+        if not modules_loaded.is_set():
+            self.root.config(cursor='watch')
+            self.root.after(50, self.initialize_main_interface)
+            return
+        self.root.config(cursor='')
+        if module_error is not None:
+            messagebox.showerror("Error", f"Failed to load the optimizer: {module_error}")
+            return
+
         # Hide the canvas and show the main interface
         self.canvas.pack_forget()
         self.main_frame = ScrollableFrame(self.root)
@@ -132,17 +217,34 @@ class OptimizationApp:
         self.submit_button.grid(column=0, row=2, columnspan=2)
 
         self.current_row = 3
-        self.unit_details = []
-        self.ami_vars = {}
-        self.min_units_vars = {}
-        self.max_units_vars = {}
+        # Unit catalog and AMI table, edited in grids that only draw the visible rows
+        self.unit_table = grid.Table(UNIT_COLUMNS, key=0)
+        self.ami_table = grid.Table(AMI_COLUMNS)
+        self.unit_grid = None
+        self.ami_grid = None
         self.derived_inputs = []
         self.min_annual_salaries = []
 
+        # Solver processes for the ILP and the LP relaxation, so both run at once
+        # without blocking the window; each keeps its model between runs
+        self.ilp_worker = background.SolveWorker()
+        self.lp_worker = background.SolveWorker()
+        # In race mode the ILP runs on every backend at once, from the rounded LP mix
+        self.race_worker = background.SolveRace()
+        self.jobs = {}
+        self.progress_window = None
+        self.lp_result = None
+        self.ilp_result = None
+        self.heuristic_result = None
+        self.derived_inputs_seconds = None
+        self.show_sa_when_ready = False
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+
     def open_manual(self):
         # This function opens a web link to the manual in the user's default browser
         manual_url = "https://docs.google.com/document/d/1ib_omownMryn7IKk0UvBdDzMI-sflr131sHJf4WEt7g/edit?usp=sharing"  
         try:
+            import webbrowser
             webbrowser.open_new(manual_url)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to open the manual: {e}")
@@ -152,52 +254,70 @@ class OptimizationApp:
         messagebox.showinfo("Report Issue", "If the program runs with errors or fails to produce any results, please contact raymondpeterdavid@gmail.com")    
     
     def get_unit_names(self):
-        num_unit_types = self.num_unit_types_var.get()
-        self.unit_details = []  # Reset to ensure clean start
-        for i in range(num_unit_types):
-            name_var = tk.StringVar()
-            ttk.Label(self.main_frame.scrollable_frame, text=f"Name for Unit Type {i+1}:").grid(column=0, row=3 + i)
-            ttk.Entry(self.main_frame.scrollable_frame, textvariable=name_var).grid(column=1, row=3 + i)
-            self.unit_details.append({'name_var': name_var})
+        # One grid for the whole catalog: type into it, paste cells from a spreadsheet or import a CSV
+        self.unit_table.resize(self.num_unit_types_var.get())
+        self.sync_ami_rows()
+        if self.unit_grid is None:
+            self.unit_grid = grid.DataGrid(self.main_frame.scrollable_frame, self.unit_table, on_change=self.sync_ami_rows)
+            self.unit_grid.grid(column=0, row=3, columnspan=2, pady=5)
+            ttk.Button(self.main_frame.scrollable_frame, text="Export Units CSV...", command=self.unit_grid.export_csv).grid(column=0, row=4)
+            ttk.Button(self.main_frame.scrollable_frame, text="Import Units CSV...", command=self.import_units).grid(column=1, row=4)
+        else:
+            self.unit_grid.refresh()
+        self.current_row = 5
 
         self.submit_button.configure(text="Next", command=self.get_unit_details)
 
+    def import_units(self):
+        # A CSV with a Unit Type column updates the matching rows, so a file of mix limits alone fills those in
+        if self.unit_grid.import_csv():
+            self.num_unit_types_var.set(len(self.unit_table.rows))
+
+    def unit_records(self):
+        # Rows of the unit grid, or None once the first problem has been reported
+        try:
+            units = self.unit_table.records()
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid unit data: {e}")
+            return None
+        names = [optimizer.unit_key(unit['unit']) for unit in units]
+        if not units or "" in names or len(set(names)) < len(names):
+            messagebox.showerror("Error", "Every unit type needs a name, and no two may share one.")
+            return None
+        return units
+
     def get_unit_details(self):
-        self.current_row += len(self.unit_details)
-        for detail in self.unit_details:
-            unit_name = detail['name_var'].get().strip().replace(' ', '_')
-
-            sqft_var = tk.DoubleVar()
-            ttk.Label(self.main_frame.scrollable_frame, text=f"Square Footage for {unit_name}:").grid(column=0, row=self.current_row)
-            ttk.Entry(self.main_frame.scrollable_frame, textvariable=sqft_var).grid(column=1, row=self.current_row)
-            detail['sqft_var'] = sqft_var
-            self.current_row += 1
-
-            rent_var = tk.DoubleVar()
-            ttk.Label(self.main_frame.scrollable_frame, text=f"Monthly Rent for {unit_name}:").grid(column=0, row=self.current_row)
-            ttk.Entry(self.main_frame.scrollable_frame, textvariable=rent_var).grid(column=1, row=self.current_row)
-            detail['rent_var'] = rent_var
-            self.current_row += 1
-
-            people_var = tk.IntVar()
-            ttk.Label(self.main_frame.scrollable_frame, text=f"Min People for {unit_name}:").grid(column=0, row=self.current_row)
-            ttk.Entry(self.main_frame.scrollable_frame, textvariable=people_var).grid(column=1, row=self.current_row)
-            detail['people_var'] = people_var
-            self.current_row += 1
-        
-        self.submit_button.configure(text="Next", command=self.get_ami_and_min_unit_req)
+        if self.unit_records() is not None:
+            self.get_ami_and_min_unit_req()
+
+    def sync_ami_rows(self):
+        # One AMI row per household size up to the largest unit's, kept in step with
+        # the unit grid; incomes already entered stay with their household size
+        people = [key for key, _, _, _ in UNIT_COLUMNS].index('people')
+        max_people = 1
+        for row in self.unit_table.rows:
+            try:
+                max_people = max(max_people, grid.int_cell(row[people].replace(',', '')))
+            except ValueError:
+                continue
+        incomes = {row[0].strip(): row[1] for row in self.ami_table.rows}
+        rows = [[str(size), incomes.get(str(size), '0')] for size in range(1, max_people + 1)]
+        if rows != self.ami_table.rows:
+            self.ami_table.rows = rows
+            if self.ami_grid is not None:
+                self.ami_grid.refresh()
 
     def get_ami_and_min_unit_req(self):
-        max_people = max(detail['people_var'].get() for detail in self.unit_details)
+        ttk.Label(self.main_frame.scrollable_frame, text="100% AMI Income by Household Size:").grid(column=0, row=self.current_row, columnspan=2)
+        self.current_row += 1
+        self.sync_ami_rows()
+        self.ami_grid = grid.DataGrid(self.main_frame.scrollable_frame, self.ami_table, visible_rows=AMI_VISIBLE_ROWS, width=16)
+        self.ami_grid.grid(column=0, row=self.current_row, columnspan=2, pady=5)
+        self.current_row += 1
 
-        ttk.Label(self.main_frame.scrollable_frame, text="100% AMI Income by Household Size:").grid(column=0, row=self.current_row)
+        ttk.Button(self.main_frame.scrollable_frame, text="Import AMI CSV...", command=self.ami_grid.import_csv).grid(column=0, row=self.current_row)
+        ttk.Button(self.main_frame.scrollable_frame, text="Load AMI Table...", command=self.load_ami_table).grid(column=1, row=self.current_row)
         self.current_row += 1
-        for i in range(1, max_people + 1):
-            ami_var = tk.DoubleVar()
-            ttk.Label(self.main_frame.scrollable_frame, text=f"{i} Household:").grid(column=0, row=self.current_row)
-            ttk.Entry(self.main_frame.scrollable_frame, textvariable=ami_var).grid(column=1, row=self.current_row)
-            self.ami_vars[i] = ami_var
-            self.current_row += 1
 
         ttk.Label(self.main_frame.scrollable_frame, text="AMI (%) Limit for Affordable Housing:").grid(column=0, row=self.current_row)
         self.ami_percentage_var = tk.DoubleVar()
@@ -210,111 +330,240 @@ class OptimizationApp:
         self.min_aff_housing_percentage_var = tk.DoubleVar()
         ttk.Entry(self.main_frame.scrollable_frame, textvariable=self.min_aff_housing_percentage_var).grid(column=1, row=self.current_row)
         self.current_row += 1
-        
-        ttk.Label(self.main_frame.scrollable_frame, text="Min/Max Units Requirement: (in %)").grid(column=0, row=self.current_row)
+
+        # Solver limits: stop after this many seconds (0 for none) or once within this % of the best possible profit
+        ttk.Label(self.main_frame.scrollable_frame, text="Solver Time Limit (s):").grid(column=0, row=self.current_row)
+        self.time_limit_var = tk.DoubleVar(value=60)
+        ttk.Entry(self.main_frame.scrollable_frame, textvariable=self.time_limit_var).grid(column=1, row=self.current_row)
+        self.current_row += 1
+
+        ttk.Label(self.main_frame.scrollable_frame, text="Solver MIP Gap (%):").grid(column=0, row=self.current_row)
+        self.mip_gap_var = tk.DoubleVar(value=0)
+        ttk.Entry(self.main_frame.scrollable_frame, textvariable=self.mip_gap_var).grid(column=1, row=self.current_row)
+        self.current_row += 1
+
+        # Race mode: solve the LP relaxation first, round it to a feasible mix and race the solvers from there
+        self.race_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.main_frame.scrollable_frame, text="Race Solvers from Rounded LP", variable=self.race_var).grid(column=1, row=self.current_row)
         self.current_row += 1
-        
-        for detail in self.unit_details:
-            unit_name = detail['name_var'].get().strip().replace(' ', '_')
-            min_units_var = tk.IntVar()
-            max_units_var = tk.IntVar()
-            
-            ttk.Label(self.main_frame.scrollable_frame, text=f"Min Units for {unit_name} (Market + Aff.):").grid(column=0, row=self.current_row)
-            ttk.Entry(self.main_frame.scrollable_frame, textvariable=min_units_var).grid(column=1, row=self.current_row)
-            self.min_units_vars[unit_name] = min_units_var
-            self.current_row += 1
-
-            ttk.Label(self.main_frame.scrollable_frame, text=f"Max Units for {unit_name} (Market + Aff.):").grid(column=0, row=self.current_row)
-            ttk.Entry(self.main_frame.scrollable_frame, textvariable=max_units_var).grid(column=1, row=self.current_row)
-            self.max_units_vars[unit_name] = max_units_var
-            self.current_row += 1
 
         self.submit_button.configure(text="Calculate Derived Inputs", command=self.calculate_derived_inputs)
 
+    def load_ami_table(self):
+        # Fill the 100% AMI entries from a HUD-style income limits CSV
+        path = filedialog.askopenfilename(title="HUD Income Limits", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            table = ami.AmiTable.load_csv(path)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"Failed to load the AMI table: {e}")
+            return
+        area = table.areas[0]
+        if len(table.areas) > 1:
+            area = simpledialog.askstring("AMI Area", "Area name:", initialvalue=area, parent=self.root)
+            if area not in table.area_index:
+                messagebox.showerror("Error", f"Area not found in the AMI table: {area}")
+                return
+        try:
+            incomes = table.ami_values(area, 100)
+        except ValueError as e:
+            messagebox.showerror("Error", f"Failed to load the AMI table: {e}")
+            return
+        for row in self.ami_table.rows:
+            try:
+                row[1] = str(incomes.get(grid.int_cell(row[0]), 0))
+            except ValueError:
+                continue
+        self.ami_grid.refresh()
+
+    def ami_incomes(self):
+        # 100% AMI income by household size, from the AMI grid
+        return {record['people']: record['income'] for record in self.ami_table.records()}
+
     def calculate_derived_inputs(self):
-        ami_values = {size: var.get() * self.ami_percentage_var.get() * 0.01 for size, var in self.ami_vars.items()}
+        if self.unit_records() is None:
+            return
+        try:
+            ami_incomes = self.ami_incomes()
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid AMI table: {e}")
+            return
+        ami_values = {size: income * self.ami_percentage_var.get() * 0.01 for size, income in ami_incomes.items()}
+        self.ami_values = ami_values
         self.calculate_derived_inputs_logic(ami_values)
         messagebox.showinfo("Derived Inputs Calculated", "Derived inputs have been calculated. Ready to run optimization.")
         self.submit_button.configure(text="Run Optimization", command=self.setup_optimization_problem)
 
-    def calculate_derived_inputs_logic(self, ami_values):
-        rent_reduction = 100
-        rent_percentage = 0.30
-        
-        for detail in self.unit_details:
-            unit_name = detail['name_var'].get().strip().replace(' ', '_')
-            sq_ft = detail['sqft_var'].get()
-            rent = detail['rent_var'].get()
-            people = detail['people_var'].get()
-
-            ami_income = ami_values.get(people, 0)
-            monthly_ami_rent = max(0, (ami_income * rent_percentage / 12) - rent_reduction)
-
-            sq_ft_rule = sq_ft / 12
-            rule_50 = rent * 0.5
-            max_cost = max(sq_ft_rule, rule_50)
-
-            self.derived_inputs.append({
-                'Unit Type': f"{unit_name}",
-                'Sq. Ft.': sq_ft,
-                'Avg. Rent': rent,
-                'Sq. Ft. Rule': sq_ft_rule,
-                '50% Rule': rule_50,
-                'Max': max_cost,
-                'MinAnnualSalary': rent * 12 * 3
+    def unit_data(self):
+        # Plain-data view of the unit grid, as consumed by the optimizer module
+        units = []
+        for unit in self.unit_table.records():
+            units.append({
+                'name': optimizer.unit_key(unit['unit']),
+                'sqft': unit['sqft'],
+                'rent': unit['rent'],
+                'people': unit['people'],
+                'min_units': unit['min_units'],
+                'max_units': unit['max_units'],
             })
+        return units
 
-            # Repeat for affordable housing with adjusted rent
-            self.derived_inputs.append({
-                'Unit Type': f"Aff_{unit_name}",
-                'Sq. Ft.': sq_ft,
-                'Avg. Rent': monthly_ami_rent,
-                'Sq. Ft. Rule': sq_ft_rule,
-                '50% Rule': rule_50,  # Use same rule_50 as market for consistency
-                'Max': max_cost,  # Use same max_cost as market for consistency
-                'MinAnnualSalary': rent * 12 * 3
-            })
+    def calculate_derived_inputs_logic(self, ami_values):
+        start = time.perf_counter()
+        self.derived_inputs = optimizer.calculate_derived_inputs(self.unit_data(), ami_values)
+        self.derived_inputs_seconds = time.perf_counter() - start
+
+    def scenario(self):
+        # Plain-data description of the current inputs, as sent to the solver processes
+        return {
+            'derived_inputs': list(self.derived_inputs),
+            'units': self.unit_data(),
+            'net_residential_area': self.net_residential_area_var.get(),
+            'set_aside_percentage': self.min_aff_housing_percentage_var.get(),
+        }
+
+    def start_solve(self, relaxed, on_done, warm_start=None, race=False):
+        # Answer from the cache when these inputs were solved before, otherwise solve in the background
+        scenario = self.scenario()
+        worker = self.lp_worker if relaxed else self.race_worker if race else self.ilp_worker
+        # A race's ILP comes from whichever backend finishes first, so it is cached apart from either
+        backend = 'race' if worker is self.race_worker else worker.backend
+        key = cache.scenario_key(scenario['derived_inputs'], scenario['units'], scenario['net_residential_area'],
+                                 scenario['set_aside_percentage'], ami_values=self.ami_values, relaxed=relaxed,
+                                 backend=backend)
+        result = solve_cache.get(key)
+        # A cached LP from outside race mode was never rounded, and one from an older cache file never ranged;
+        # ranging works on the matrix model, which needs SciPy
+        with_ranging = relaxed and optimizer.HAS_SCIPY
+        if result is not None and not (race and relaxed and 'heuristic' not in result) \
+                and not (with_ranging and result['status'] == 'Optimal' and 'ranging' not in result):
+            self.record_solve(result, relaxed, cached=True)
+            on_done(result)
+            return
+        mip_gap = self.mip_gap_var.get() * 0.01 or None
+        worker.submit(scenario, relaxed=relaxed, time_limit=self.time_limit_var.get() or None, mip_gap=mip_gap,
+                      warm_start=warm_start, round_lp=race and relaxed, with_ranging=with_ranging)
+        # A solve stopped early on the gap is not the optimum for these inputs, so it is not cached
+        self.jobs[relaxed] = (worker, key if relaxed or mip_gap is None else None, on_done)
+        self.show_progress()
+
+    def record_solve(self, result, relaxed, cached=False):
+        # Timings and solver statistics go to the diagnostics panel and any JSON-lines log
+        result.setdefault('diagnostics', diagnostics.new_diagnostics())
+        result['diagnostics']['phases']['derived_inputs'] = self.derived_inputs_seconds
+        if 'backend' in result and self.heuristic_result is not None:
+            # A raced ILP started from the rounded LP mix
+            result['diagnostics']['phases']['heuristic'] = self.heuristic_result['seconds']
+            result['diagnostics']['solver']['heuristic_gap'] = self.heuristic_result['gap']
+        diagnostics.emit('solve', relaxed=relaxed, status=result['status'], cached=cached,
+                         diagnostics=result['diagnostics'])
+
+    def show_progress(self):
+        if self.progress_window is not None:
+            return
+        self.progress_window = tk.Toplevel(self.root)
+        self.progress_window.title("Solving")
+        self.progress_window.protocol("WM_DELETE_WINDOW", self.cancel_solve)
+        progress_bar = ttk.Progressbar(self.progress_window, mode='indeterminate', length=300)
+        progress_bar.pack(padx=10, pady=10)
+        progress_bar.start(10)
+        self.progress_label = tk.Label(self.progress_window, text="Starting solver...", font=("Arial", 12), justify="left", anchor="w")
+        self.progress_label.pack(fill='x', padx=10, pady=5)
+        ttk.Button(self.progress_window, text="Cancel", command=self.cancel_solve).pack(pady=10)
+        self.root.after(POLL_INTERVAL, self.poll_solves)
+
+    def poll_solves(self):
+        if self.progress_window is None:
+            return
+        for relaxed, (worker, key, on_done) in list(self.jobs.items()):
+            result = worker.poll()
+            if result is None:
+                continue
+            del self.jobs[relaxed]
+            self.record_solve(result, relaxed)
+            if key is not None:
+                solve_cache.put(key, result)
+            on_done(result)
+        if not self.jobs:
+            self.close_progress()
+            return
+
+        # Best mix found so far, the bound on what is still possible and the gap between them
+        progress_text = f"Elapsed: {time.time() - self.solve_started:.0f} s"
+        if False in self.jobs:
+            progress = self.jobs[False][0].progress()
+            if 'incumbent' in progress:
+                progress_text += f"\nBest Mix Found: ${progress['incumbent']:,.2f}"
+            if 'bound' in progress:
+                progress_text += f"\nBest Possible: ${progress['bound']:,.2f}"
+            if 'gap' in progress:
+                progress_text += f"\nGap: {progress['gap']:.2f}%"
+            if 'nodes' in progress:
+                progress_text += f"\nNodes Explored: {progress['nodes']:,}"
+        progress_text += "\nLP Relaxation: " + ("running" if True in self.jobs else "done")
+        self.progress_label.configure(text=progress_text)
+        self.root.after(POLL_INTERVAL, self.poll_solves)
+
+    def close_progress(self):
+        if self.progress_window is not None:
+            self.progress_window.destroy()
+            self.progress_window = None
+
+    def cancel_solve(self):
+        # Kill whatever is still solving; the workers restart on the next run
+        for worker, _, _ in self.jobs.values():
+            worker.cancel()
+        self.jobs = {}
+        self.show_sa_when_ready = False
+        self.close_progress()
+
+    def close(self):
+        self.cancel_solve()
+        self.ilp_worker.close()
+        self.lp_worker.close()
+        self.race_worker.close()
+        self.root.destroy()
 
     def setup_optimization_problem(self):
-        aff_housing_percent = self.min_aff_housing_percentage_var.get() * 0.01
-        self.problem = LpProblem("Optimal_Unit_Mix", LpMaximize)
-
-        # Create decision variables
-        unit_vars = {di['Unit Type']: LpVariable(f"units_{di['Unit Type']}", lowBound=0, cat='Integer') for di in self.derived_inputs}
-        total_units_var = LpVariable("TotalUnits", lowBound=0, cat='Integer')
-
-        # Define revenue and costs for the objective function
-        revenue = lpSum([di['Avg. Rent'] * unit_vars[di['Unit Type']] for di in self.derived_inputs]) * 12
-        worst_case_costs = lpSum([di['Max'] * unit_vars[di['Unit Type']] for di in self.derived_inputs]) * 12
-        self.problem += revenue - worst_case_costs, "Total_Annual_Profit_Worst_Case"
-
-        # Define constraints
-        self.problem += total_units_var == lpSum([unit_vars[di['Unit Type']] for di in self.derived_inputs]), "TotalUnitsConstraint"
-        self.problem += lpSum([di['Sq. Ft.'] * unit_vars[di['Unit Type']] for di in self.derived_inputs]) <= self.net_residential_area_var.get(), "Land_Size_Constraint" 
-        self.problem += lpSum([di['Sq. Ft.'] * unit_vars[di['Unit Type']] for di in self.derived_inputs]) >= 0.9 * self.net_residential_area_var.get(), "Land_Utilization_Constraint"
-        for detail in self.unit_details:   
-            unit_name = detail['name_var'].get().strip().replace(' ', '_')
-            self.problem += (unit_vars[unit_name] + unit_vars[f"Aff_{unit_name}"]) >= 0.01 * self.min_units_vars[unit_name].get() * total_units_var, f"Min_Units_Constraint_{unit_name}"
-            self.problem += (unit_vars[unit_name] + unit_vars[f"Aff_{unit_name}"]) <= 0.01 * self.max_units_vars[unit_name].get() * total_units_var, f"Max_Units_Constraint_{unit_name}"
-            self.problem += unit_vars[f"Aff_{unit_name}"] >= aff_housing_percent * (unit_vars[unit_name] + unit_vars[f"Aff_{unit_name}"]), f"Affordable_{unit_name}"
-            
-        # Solve the LP problem
-        self.problem.solve(my_solver)
-
-        # Calculate land utilization rate and total units after obtaining the optimal solution
-        total_land_used = sum(di['Sq. Ft.'] * unit_vars[di['Unit Type']].varValue for di in self.derived_inputs)
-        land_utilization_rate = (total_land_used / self.net_residential_area_var.get()) * 100
-        total_units = sum(unit_vars[di['Unit Type']].varValue for di in self.derived_inputs)
-
-        # Calculate best case profit
-        best_case_costs = sum(di['Sq. Ft. Rule'] * unit_vars[di['Unit Type']].varValue * 12 for di in self.derived_inputs)
-        annual_profit_best_case = (revenue.value() - best_case_costs) * 0.95524
-        annual_profit_worst_case = (revenue.value() - worst_case_costs.value()) * 0.95524
-        self.ilp_annual_profit_best_case = annual_profit_best_case
-
+        # The ILP and the LP relaxation used by the sensitivity analysis are solved side by side
+        self.cancel_solve()
+        self.lp_result = None
+        self.heuristic_result = None
+        self.solve_started = time.time()
+        if self.race_var.get():
+            self.start_solve(True, self.start_race, race=True)
+            return
+        self.start_solve(False, self.show_ilp_result)
+        self.start_solve(True, self.store_lp_result)
+
+    def start_race(self, result):
+        # The LP relaxation is in: round it to a feasible mix and race the ILP solvers from that mix
+        self.store_lp_result(result)
+        warm_start = self.heuristic_result['quantities'] if self.heuristic_result else None
+        self.start_solve(False, self.show_ilp_result, warm_start=warm_start, race=True)
+
+    def show_ilp_result(self, result):
+        if 'quantities' not in result:
+            messagebox.showerror("Optimization Failed", f"The solver returned status: {result['status']}\n{result.get('error', '')}")
+            return
+        if result['status'] != 'Optimal':
+            messagebox.showwarning("Solver Stopped", "The solver stopped before proving this unit mix optimal; showing the best mix found.")
+        self.ilp_result = result
+        self.ilp_annual_profit_best_case = result['annual_profit_best_case']
+        self.ilp_quantities = result['quantities']
 
         # Pass calculated metrics to display function
-        self.display_results_window([(di['Unit Type'], unit_vars[di['Unit Type']].varValue, di['MinAnnualSalary']) for di in self.derived_inputs], annual_profit_worst_case, annual_profit_best_case, land_utilization_rate, total_units)
+        self.display_results_window([(di['Unit Type'], result['quantities'][di['Unit Type']], di['MinAnnualSalary']) for di in self.derived_inputs], result['annual_profit_worst_case'], result['annual_profit_best_case'], result['land_utilization_rate'], result['total_units'])
+
+    def store_lp_result(self, result):
+        self.lp_result = result
+        # In race mode the LP worker also rounds the relaxation to a feasible mix;
+        # its gap to the LP bounds how much solving can add
+        self.heuristic_result = result.get('heuristic')
+        if self.show_sa_when_ready:
+            self.show_sa_when_ready = False
+            self.display_sensitivity_analysis()
 
 
 
@@ -323,62 +572,145 @@ class OptimizationApp:
         results_window.title("Optimization Results")
         results_window.geometry("600x600")
 
-        tree = ttk.Treeview(results_window, columns=("Unit Type", "Quantity", "MinAnnualSalary"), show="headings")
-        tree.heading("Unit Type", text="Unit Type")
-        tree.heading("Quantity", text="Quantity")
-        tree.heading("MinAnnualSalary", text = "Minimum Annual Salary")
-        for unit_type, quantity, min_annual_salary in results_data:
-            tree.insert('', 'end', values=(unit_type, round(quantity, 2),round(min_annual_salary,0)))
-        tree.pack(expand=True, fill='both')
+        # Paged, so a large catalog only puts one page of rows into the window
+        rows = [(unit_type, round(quantity, 2), round(min_annual_salary, 0)) for unit_type, quantity, min_annual_salary in results_data]
+        grid.PagedTree(results_window, ("Unit Type", "Quantity", "Minimum Annual Salary"), rows).pack(expand=True, fill='both')
 
         tk.Label(results_window, text=f"Minimum Expected Returns: ${annual_profit_worst_case:,.2f}", font=("Arial", 14)).pack(pady=5)
         tk.Label(results_window, text=f"Maximum Expected Returns: ${annual_profit_best_case:,.2f}", font=("Arial", 14)).pack(pady=5)
         tk.Label(results_window, text=f"Land Utilization Rate: {land_utilization_rate:.2f}%", font=("Arial", 14)).pack(pady=5)
         tk.Label(results_window, text=f"Total Number of Units: {total_units}", font=("Arial", 14)).pack(pady=5)
+        tk.Label(results_window, text="Solve cache: {hits} hits, {disk_hits} disk hits, {misses} misses".format(**solve_cache.stats()), font=("Arial", 9), fg="gray").pack(pady=2)
 
         self.sa_button = ttk.Button(results_window, text="Show Sensitivity Analysis", command=self.display_sensitivity_analysis)
         self.sa_button.pack(pady=10)
         self.sa_button.configure(text="Show Sensitivity Analysis", command=self.display_sensitivity_analysis)
+
+        ttk.Button(results_window, text="Risk Analysis", command=self.display_risk_analysis).pack(pady=5)
+        ttk.Button(results_window, text="Diagnostics", command=self.display_diagnostics).pack(pady=5)
+
+    def display_diagnostics(self):
+        # Phase timings and solver statistics of the last ILP and LP relaxation solves
+        diag_window = tk.Toplevel(self.root)
+        diag_window.title("Diagnostics")
+        diag_window.geometry("550x450")
+
+        def value(result, group, name, fmt):
+            number = ((result or {}).get('diagnostics') or {}).get(group, {}).get(name)
+            return "" if number is None else fmt(number)
+
+        tree = ttk.Treeview(diag_window, columns=("Item", "ILP", "LP Relaxation"), show="headings")
+        for column in ("Item", "ILP", "LP Relaxation"):
+            tree.heading(column, text=column)
+        ms = lambda seconds: f"{seconds * 1000:,.1f}"
+        for phase in diagnostics.PHASES:
+            tree.insert('', 'end', values=(f"{phase} (ms)", value(self.ilp_result, 'phases', phase, ms), value(self.lp_result, 'phases', phase, ms)))
+        statistics = (
+            ('status', "Status", str),
+            ('backend', "Solver", str),
+            ('heuristic_gap', "Heuristic Gap (%)", "{:.4f}".format),
+            ('nodes', "B&B Nodes", "{:,}".format),
+            ('iterations', "LP Iterations", "{:,}".format),
+            ('gap', "Gap (%)", "{:.4f}".format),
+            ('objective', "Objective (before vacancy)", "${:,.2f}".format),
+            ('lp_objective', "Root LP Objective", "${:,.2f}".format),
+        )
+        for name, label, fmt in statistics:
+            tree.insert('', 'end', values=(label, value(self.ilp_result, 'solver', name, fmt), value(self.lp_result, 'solver', name, fmt)))
+        tree.pack(expand=True, fill='both')
+
+        # How much the integer requirement costs against the LP relaxation
+        ilp_objective = value(self.ilp_result, 'solver', 'objective', float)
+        lp_objective = value(self.lp_result, 'solver', 'objective', float)
+        if ilp_objective and lp_objective != "":
+            gap = (lp_objective - ilp_objective) / abs(ilp_objective) * 100
+            tk.Label(diag_window, text=f"LP Relaxation exceeds the ILP by {gap:.2f}%", font=("Arial", 12)).pack(pady=5)
+        if 'first_window' in startup:
+            tk.Label(diag_window, text=f"Startup: first window in {startup['first_window'] * 1000:,.0f} ms, "
+                                       f"optimizer loaded {startup['modules_loaded'] * 1000:,.0f} ms later", font=("Arial", 9), fg="gray").pack(pady=2)
+
+    def display_risk_analysis(self):
+        # Profit distribution of the optimal mix under the distributions in a spec file (fixed inputs if none is chosen)
+        try:
+            ami_incomes = self.ami_incomes()
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid AMI table: {e}")
+            return
+        spec = None
+        path = filedialog.askopenfilename(title="Risk Distributions (Cancel for defaults)", filetypes=[("JSON files", "*.json"), ("All files", "*.*")])
+        if path:
+            try:
+                with open(path) as f:
+                    spec = json.load(f)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Error", f"Failed to load the distributions: {e}")
+                return
+        risk_window = tk.Toplevel(self.root)
+        risk_window.title("Risk Analysis")
+        label = tk.Label(risk_window, text=f"Simulating {RISK_SCENARIOS:,} scenarios...", font=("Arial", 12), justify="left", anchor="w")
+        label.pack(fill='x', padx=10, pady=10)
+        progress_bar = ttk.Progressbar(risk_window, mode='indeterminate', length=300)
+        progress_bar.pack(padx=10, pady=10)
+        progress_bar.start(10)
+
+        # The simulation is NumPy work that takes seconds, so it runs in a thread while the window stays live
+        outcome = {}
+        inputs = (self.unit_data(), ami_incomes, self.ami_percentage_var.get(), [self.ilp_quantities])
+
+        def simulate():
+            try:
+                outcome['result'] = montecarlo.simulate(*inputs, spec=spec, scenarios=RISK_SCENARIOS)[0]
+            except Exception as e:
+                outcome['error'] = e
+
+        thread = threading.Thread(target=simulate, daemon=True)
+        thread.start()
+        self.root.after(POLL_INTERVAL, self.poll_risk_analysis, thread, outcome, risk_window, label, progress_bar)
+
+    def poll_risk_analysis(self, thread, outcome, risk_window, label, progress_bar):
+        if thread.is_alive():
+            self.root.after(POLL_INTERVAL, self.poll_risk_analysis, thread, outcome, risk_window, label, progress_bar)
+            return
+        if not risk_window.winfo_exists():
+            return
+        progress_bar.destroy()
+        if 'error' in outcome:
+            label.configure(text=f"Risk analysis failed: {outcome['error']}")
+            return
+        result = outcome['result']
+        risk_text = f"Annual Returns over {RISK_SCENARIOS:,} Scenarios:\n" \
+                    f"P5: ${result['p5']:,.2f}\n" \
+                    f"P50: ${result['p50']:,.2f}\n" \
+                    f"P95: ${result['p95']:,.2f}\n" \
+                    f"Mean: ${result['mean']:,.2f}\n" \
+                    f"Probability of Loss: {result['probability_of_loss'] * 100:.2f}%"
+        label.configure(text=risk_text)
     
     
     def display_sensitivity_analysis(self):
-        # Setup a new LP problem for sensitivity analysis based on the original inputs but without integer constraints
-        sa_problem = LpProblem("Sensitivity_Analysis", LpMaximize)
-    
-        # Use the same structure as in setup_optimization_problem but with continuous variables
-        unit_vars = {di['Unit Type']: LpVariable(f"sa_units_{di['Unit Type']}", lowBound=0, cat='Continuous') for di in self.derived_inputs}
-        total_units_var = LpVariable("sa_TotalUnits", lowBound=0, cat='Continuous')
-
-        # Reuse the objective function and constraints with the new variables
-        revenue = lpSum([di['Avg. Rent'] * unit_vars[di['Unit Type']] for di in self.derived_inputs]) * 12
-        worst_case_costs = lpSum([di['Max'] * unit_vars[di['Unit Type']] for di in self.derived_inputs]) * 12
-        sa_problem += revenue - worst_case_costs, "Total_Annual_Profit_Worst_Case"
-
-        # Define constraints similar to the integer problem, but for the LP version
-        sa_problem += total_units_var == lpSum([unit_vars[di['Unit Type']] for di in self.derived_inputs]), "TotalUnitsConstraint"
-        sa_problem += lpSum([di['Sq. Ft.'] * unit_vars[di['Unit Type']] for di in self.derived_inputs]) <= self.net_residential_area_var.get(), "Land_Size_Constraint" 
-        sa_problem += lpSum([di['Sq. Ft.'] * unit_vars[di['Unit Type']] for di in self.derived_inputs]) >= 0.9 * self.net_residential_area_var.get(), "Land_Utilization_Constraint"
-        for detail in self.unit_details:   
-            unit_name = detail['name_var'].get().strip().replace(' ', '_')
-            sa_problem += (unit_vars[unit_name] + unit_vars[f"Aff_{unit_name}"]) >= 0.01 * self.min_units_vars[unit_name].get() * total_units_var, f"Min_Units_Constraint_{unit_name}"
-            sa_problem += (unit_vars[unit_name] + unit_vars[f"Aff_{unit_name}"]) <= 0.01 * self.max_units_vars[unit_name].get() * total_units_var, f"Max_Units_Constraint_{unit_name}"
-            aff_housing_percent = self.min_aff_housing_percentage_var.get() * 0.01
-            sa_problem += unit_vars[f"Aff_{unit_name}"] >= aff_housing_percent * (unit_vars[unit_name] + unit_vars[f"Aff_{unit_name}"]), f"Affordable_{unit_name}"
-
-        # Solve the relaxed LP problem
-        sa_problem.solve(my_solver)
-
-        # Calculate metrics for the LP version
-        total_land_used = sum(di['Sq. Ft.'] * unit_vars[di['Unit Type']].varValue for di in self.derived_inputs)
-        land_utilization_rate = (total_land_used / self.net_residential_area_var.get()) * 100
-        total_units = sum(unit_vars[di['Unit Type']].varValue for di in self.derived_inputs)
-
-        best_case_costs = sum(di['Sq. Ft. Rule'] * unit_vars[di['Unit Type']].varValue * 12 for di in self.derived_inputs)
-        annual_profit_best_case = (revenue.value() - best_case_costs) * 0.95524
-        annual_profit_worst_case = (revenue.value() - worst_case_costs.value()) * 0.95524
-
-        # Calculate Precision (%)
-        precision = (self.ilp_annual_profit_best_case / annual_profit_best_case) * 100 if annual_profit_best_case else 0
+        # The LP relaxation was started alongside the ILP; if it is still running, open once it is done
+        if self.lp_result is None:
+            self.show_sa_when_ready = True
+            if True not in self.jobs:
+                self.solve_started = time.time()
+                self.start_solve(True, self.store_lp_result)
+            return
+        result = self.lp_result
+        if result['status'] != 'Optimal':
+            messagebox.showerror("Sensitivity Analysis Failed", f"The solver returned status: {result['status']}\n{result.get('error', '')}")
+            return
+        annual_profit_worst_case = result['annual_profit_worst_case']
+        annual_profit_best_case = result['annual_profit_best_case']
+        land_utilization_rate = result['land_utilization_rate']
+        total_units = result['total_units']
+
+        # Heuristic gap: how far the mix rounded from this LP solution falls short of it
+        if self.heuristic_result is not None:
+            heuristic_gap_text = f"Heuristic Gap (%): {self.heuristic_result['gap']:.2f}%"
+        elif 'heuristic' not in result:
+            heuristic_gap_text = "Heuristic Gap (%): n/a (rounded in race mode only)"
+        else:
+            heuristic_gap_text = "Heuristic Gap (%): n/a (rounding found no feasible mix)"
 
         sa_window = tk.Toplevel(self.root)
         sa_window.title("Sensitivity Analysis & LP Metrics")
@@ -390,44 +722,56 @@ class OptimizationApp:
                    f"Maximum Expected Returns: ${annual_profit_best_case:,.2f}\n" \
                    f"Land Utilization Rate: {land_utilization_rate:.2f}%\n" \
                    f"Total Number of Units: {total_units}\n" \
-                   f"Precision (%): {precision:.2f}%"
+                   f"{heuristic_gap_text}"
 
         # Display LP Metrics with aligned text
         metrics_label = tk.Label(sa_window, text=metrics_text, font=("Arial", 12), justify="left", anchor="w")
         metrics_label.pack(fill='x', padx=10, pady=10)
 
-        # Text for LP Variable Quantities
-        lp_vars_text = "\n\nLP Variable Quantities:\n"
-        for di in self.derived_inputs:
-            unit_type = di['Unit Type']
-            quantity = unit_vars[unit_type].varValue  # Access the LP solution variable value
-            lp_vars_text += f"{unit_type}: {quantity:.2f}\n"
+        # LP Variable Quantities
+        lp_vars = [(di['Unit Type'], f"{result['quantities'][di['Unit Type']]:.2f}") for di in self.derived_inputs]
+        tk.Label(sa_window, text="LP Variable Quantities:", font=("Arial", 12), justify="left", anchor="w").pack(fill='x', padx=10)
+        grid.PagedTree(sa_window, ("Unit Type", "LP Quantity"), lp_vars, height=6).pack(expand=True, fill='both', padx=10, pady=5)
 
-        # Display LP Variable Quantities with aligned text
-        lp_vars_label = tk.Label(sa_window, text=lp_vars_text, font=("Arial", 12), justify="left", anchor="w")
-        lp_vars_label.pack(fill='x', padx=10, pady=10)
+        # Shadow Prices for constraints and Reduced Costs for variables
+        duals = [(name, "Shadow Price", pi) for name, pi in result['shadow_prices'].items()]
+        duals += [(name, "Reduced Cost", dj) for name, dj in result['reduced_costs'].items()]
+        grid.PagedTree(sa_window, ("Variable", "Type", "Shadow Price/Reduced Cost"), duals, height=8).pack(expand=True, fill='both', padx=10, pady=5)
 
+        if result.get('ranging'):
+            self.display_ranging(sa_window, result['ranging'])
 
-        tree = ttk.Treeview(sa_window, columns=("Variable", "Shadow Price/Reduced Cost"), show="headings")
-        tree.heading("Variable", text="Variable")
-        tree.heading("Shadow Price/Reduced Cost", text="Shadow Price/Reduced Cost")
+    def display_ranging(self, sa_window, report):
+        # Allowable increase/decrease of each rent and constraint before the optimal LP basis changes,
+        # as the LP worker ranged them from the basis of its solve
+        if report['status'] != 'Optimal':
+            return
 
-        # Shadow Prices for constraints and Reduced Costs for variables
-        for name, constraint in sa_problem.constraints.items():
-            tree.insert('', 'end', values=(name, f"Shadow Price: {constraint.pi}"))
-        for variable in sa_problem.variables():
-            tree.insert('', 'end', values=(variable.name, f"Reduced Cost: {variable.dj}"))
+        def fmt(value):
+            return "Unlimited" if value == float('inf') else f"{value:,.2f}"
 
-        tree.pack(expand=True, fill='both')
+        rows = []
+        for row in report['objective']:
+            rows.append((f"Rent {row['unit_type']}", fmt(row['rent']), fmt(row['rent_increase']), fmt(row['rent_decrease'])))
+        for row in report['rhs']:
+            rows.append((row['constraint'], fmt(row['rhs']), fmt(row['allowable_increase']), fmt(row['allowable_decrease'])))
+        grid.PagedTree(sa_window, ("Item", "Current", "Allowable Increase", "Allowable Decrease"), rows, height=8).pack(expand=True, fill='both', padx=10, pady=5)
 
 
 
 
 
 def main():
+    # Solver processes are started from the bundled executable too
+    multiprocessing.freeze_support()
     root = tk.Tk()
     root.geometry("600x800")
     app = OptimizationApp(root)
+
+    # Time to first window: from the start of this module until the splash is drawn
+    root.update()
+    startup['first_window'] = time.perf_counter() - STARTED
+    threading.Thread(target=load_modules, daemon=True).start()
     root.mainloop()
 
 if __name__ == "__main__":
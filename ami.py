@@ -0,0 +1,126 @@
+import csv
+import re
+
+import numpy as np
+
+import optimizer
+
+# HUD income limit files name their columns l50_1 .. l80_8 (limit at 50% / 80%
+# AMI for a household of 1 .. 8) and ELI_1 .. ELI_8 (extremely low income, 30%)
+HUD_LIMIT_COLUMN = re.compile(r'^l(\d+)_(\d+)$', re.IGNORECASE)
+HUD_ELI_COLUMN = re.compile(r'^eli_(\d+)$', re.IGNORECASE)
+# The area median family income (a household of 4) is in a median2024-style column
+HUD_MEDIAN_COLUMN = re.compile(r'^median(\d{4}|_income)?$', re.IGNORECASE)
+AREA_COLUMNS = ('area', 'areaname', 'area_name', 'hud_area_name')
+
+# HUD's family size adjustment of the median income, by household size
+HUD_SIZE_ADJUSTMENTS = {1: 0.7, 2: 0.8, 3: 0.9, 4: 1.0, 5: 1.08, 6: 1.16, 7: 1.24, 8: 1.32}
+
+
+class AmiTable:
+    """AMI income limits indexed by (area, household size, AMI %).
+
+    Limits are held in a dense (area, household size, AMI %) array so whole
+    catalogs can be looked up in one indexing operation. A percentage that
+    the source file does not list is scaled linearly from the 100% limit,
+    which is how the tool has always derived affordable incomes from the
+    100% table. HUD's 30% to 80% limits are capped and adjusted, so they are
+    not linear in the median and nothing is scaled from them.
+    """
+
+    def __init__(self, limits):
+        self.areas = sorted({area for area, _, _ in limits})
+        self.sizes = sorted({size for _, size, _ in limits})
+        self.percentages = sorted({pct for _, _, pct in limits})
+        self.area_index = {area: i for i, area in enumerate(self.areas)}
+        self.values = np.full((len(self.areas), max(self.sizes, default=0) + 1, len(self.percentages)), np.nan)
+        for (area, size, pct), income in limits.items():
+            self.values[self.area_index[area], size, self.percentages.index(pct)] = income
+
+    @classmethod
+    def load_csv(cls, path):
+        """Read a HUD-style income limits CSV.
+
+        Both the wide HUD layout (one row per area with l50_1, ELI_1, ...
+        columns) and a long layout with area, household_size, ami_percentage
+        and income columns are accepted. In the wide layout, 100% limits
+        come from l100_ columns or else from the median column, adjusted
+        for household size as HUD does.
+        """
+        limits = {}
+        with open(path, newline='') as f:
+            reader = csv.DictReader(f)
+            area_column = next((c for c in reader.fieldnames if c.lower() in AREA_COLUMNS), None)
+            if area_column is None:
+                raise ValueError(f"{path}: no area column (expected one of {', '.join(AREA_COLUMNS)})")
+            long_format = {'household_size', 'ami_percentage', 'income'} <= set(reader.fieldnames)
+            for row in reader:
+                area = row[area_column].strip()
+                if long_format:
+                    limits[(area, int(row['household_size']), float(row['ami_percentage']))] = float(row['income'])
+                    continue
+                median = None
+                for column, value in row.items():
+                    if not value:
+                        continue
+                    if HUD_MEDIAN_COLUMN.match(column):
+                        median = float(value.replace(',', ''))
+                        continue
+                    match = HUD_LIMIT_COLUMN.match(column)
+                    if match:
+                        limits[(area, int(match.group(2)), float(match.group(1)))] = float(value.replace(',', ''))
+                        continue
+                    match = HUD_ELI_COLUMN.match(column)
+                    if match:
+                        limits[(area, int(match.group(1)), 30.0)] = float(value.replace(',', ''))
+                if median is not None:
+                    for size, adjustment in HUD_SIZE_ADJUSTMENTS.items():
+                        limits.setdefault((area, size, 100.0), median * adjustment)
+        return cls(limits)
+
+    def limits(self, areas, ami_percentage, sizes=None):
+        """Income limits at `ami_percentage`, shape (len(areas), len(sizes)).
+
+        `sizes` are household sizes, by default every size in the file.
+        Raises ValueError naming the area, household size and AMI % when a
+        limit is neither listed nor scalable from a listed 100% limit.
+        """
+        sizes = self.sizes if sizes is None else list(sizes)
+        pct = float(ami_percentage)
+        reference = pct if pct in self.percentages else 100.0
+        if reference not in self.percentages:
+            raise ValueError(f"the AMI table lists no {pct:g}% limits and no 100% limits to scale them from")
+        unknown = [area for area in areas if area not in self.area_index]
+        if unknown:
+            raise ValueError(f"area not found in the AMI table: {unknown[0]}")
+
+        rows = self.values[[self.area_index[area] for area in areas], :, self.percentages.index(reference)]
+        result = np.full((len(areas), len(sizes)), np.nan)
+        listed = np.array([0 < size < rows.shape[1] for size in sizes], dtype=bool)
+        result[:, listed] = rows[:, np.array(sizes, dtype=int)[listed]] * (pct / reference)
+        missing = np.argwhere(np.isnan(result))
+        if len(missing):
+            i, j = missing[0]
+            raise ValueError(f"the AMI table has no {reference:g}% limit for a household of {sizes[j]} in {areas[i]}")
+        return result
+
+    def ami_values(self, area, ami_percentage):
+        # {household size: income} for one area, as consumed by optimizer.calculate_derived_inputs
+        row = self.limits([area], ami_percentage)[0]
+        return {size: float(income) for size, income in zip(self.sizes, row)}
+
+
+def regional_derived_inputs(units, table, areas, ami_percentage):
+    """Derived inputs for one unit catalog in every area, in a single pass.
+
+    Returns {area: optimizer.DerivedInputs}. The affordable rents for all
+    areas and unit types are computed as one (areas x units) array.
+    """
+    names = [optimizer.unit_key(unit['name']) for unit in units]
+    sq_ft = np.array([unit['sqft'] for unit in units], dtype=float)
+    rent = np.array([unit['rent'] for unit in units], dtype=float)
+    people = np.array([unit['people'] for unit in units], dtype=int)
+
+    aff_rents = optimizer.affordable_rents(table.limits(areas, ami_percentage, sizes=people))
+
+    return {area: optimizer.DerivedInputs.from_arrays(names, sq_ft, rent, aff_rents[i]) for i, area in enumerate(areas)}
@@ -0,0 +1,375 @@
+import multiprocessing
+import os
+import re
+import signal
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import diagnostics
+import heuristic
+import optimizer
+
+# CBC progress lines; CBC solves -max, so objective values are negated profits
+CBC_NODE_LINE = re.compile(r'Cbc0010I After (\d+) nodes, \d+ on tree, (\S+) best solution, best possible (\S+)')
+CBC_SOLUTION_LINE = re.compile(r'Cbc00(?:04|12)I Integer solution of (\S+)')
+# HiGHS MIP table rows: [Src] Proc. InQueue Leaves Expl.% BestBound BestSol Gap ...; HiGHS minimizes -profit
+HIGHS_NODE_LINE = re.compile(r'^\s*[A-Za-z]?\s+(\d+)\s+\d+\s+\d+\s+[\d.]+%\s+(\S+)\s+(\S+)')
+
+NO_SOLUTION = 1e49
+
+# A race returns the best mix found this long after its time limit even if a
+# solver is still running; HiGHS can overrun the limit in presolve (s)
+RACE_GRACE = 2.0
+
+
+def _number(text):
+    try:
+        value = float(text.rstrip('%'))
+    except ValueError:
+        return None
+    return None if abs(value) >= NO_SOLUTION else value
+
+
+def parse_progress(line, progress):
+    """Update `progress` (incumbent, bound, gap %, nodes) from one solver log line.
+
+    Incumbent and bound are annual worst case profits, vacancy included, so
+    they read like 'annual_profit_worst_case' in the results.
+    """
+    match = CBC_NODE_LINE.search(line)
+    if match:
+        nodes, incumbent, bound = match.group(1), match.group(2), match.group(3)
+    else:
+        match = HIGHS_NODE_LINE.match(line)
+        if match:
+            nodes, bound, incumbent = match.group(1), match.group(2), match.group(3)
+    if match:
+        incumbent, bound = _number(incumbent), _number(bound)
+        progress['nodes'] = int(nodes)
+        if incumbent is not None:
+            progress['incumbent'] = -incumbent * optimizer.VACANCY_FACTOR
+        if bound is not None:
+            progress['bound'] = -bound * optimizer.VACANCY_FACTOR
+    else:
+        match = CBC_SOLUTION_LINE.search(line)
+        if not match or _number(match.group(1)) is None:
+            return progress
+        progress['incumbent'] = -_number(match.group(1)) * optimizer.VACANCY_FACTOR
+
+    incumbent, bound = progress.get('incumbent'), progress.get('bound')
+    if incumbent is not None and bound is not None:
+        progress['gap'] = abs(bound - incumbent) / max(abs(incumbent), 1e-9) * 100
+    return progress
+
+
+def _copy_output(master, log):
+    while True:
+        try:
+            data = os.read(master, 65536)
+        except OSError:
+            # EIO once the last writer has closed the terminal
+            break
+        if not data:
+            break
+        log.write(data)
+    os.close(master)
+
+
+@contextmanager
+def redirect_output(path):
+    # Point fds 1 and 2 at the log so the CBC subprocess and HiGHS's C code write
+    # there too. Through a pseudo-terminal where there is one: CBC buffers its
+    # output in blocks when writing to a plain file, which would hide progress
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    log = open(path, 'wb', buffering=0)
+    copier = None
+    if hasattr(os, 'openpty'):
+        master, target = os.openpty()
+        copier = threading.Thread(target=_copy_output, args=(master, log), daemon=True)
+        copier.start()
+    else:
+        target = log.fileno()
+    os.dup2(target, 1)
+    os.dup2(target, 2)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        os.close(saved[0])
+        os.close(saved[1])
+        if copier is not None:
+            os.close(target)
+            copier.join()
+        log.close()
+
+
+def solve_scenario(model, scenario, relaxed=False, time_limit=None, mip_gap=None, backend=None, cbc=None,
+                   warm_start=None):
+    """Bring `model` in line with `scenario` and solve it.
+
+    The model is rebuilt only when the derived inputs, unit types or AMI
+    tier rules ('ami_tiers', 'income_average') change; land area, set-aside %
+    and mix limits are edited in place. `warm_start` is a known feasible mix
+    the ILP search starts from. Returns the (possibly new) model and the result.
+    """
+    derived_inputs = scenario['derived_inputs']
+    units = scenario['units']
+    ami_tiers, income_average = scenario.get('ami_tiers'), scenario.get('income_average')
+    start = time.perf_counter()
+    if (model is None or list(model.derived_inputs) != list(derived_inputs)
+            or model.unit_names != [optimizer.unit_key(unit['name']) for unit in units]
+            or (model.ami_tiers, model.income_average) != (ami_tiers, income_average)):
+        model = optimizer.build_model(derived_inputs, units, scenario['net_residential_area'],
+                                      scenario['set_aside_percentage'], backend=backend, ami_tiers=ami_tiers,
+                                      income_average=income_average)
+    else:
+        model.set_net_residential_area(scenario['net_residential_area'])
+        model.set_set_aside_percentage(scenario['set_aside_percentage'])
+        for unit in units:
+            model.set_mix_limits(optimizer.unit_key(unit['name']), unit['min_units'], unit['max_units'])
+    build_seconds = time.perf_counter() - start
+
+    if isinstance(model, optimizer.UnitMixModel):
+        solver = optimizer.make_solver(cbc, msg=True, warm_start=bool(warm_start) and not relaxed,
+                                       time_limit=time_limit, mip_gap=mip_gap)
+        result = model.solve(relaxed=relaxed, solver=solver, warm_start=warm_start)
+    else:
+        result = model.solve(relaxed=relaxed, warm_start=warm_start, time_limit=time_limit, mip_gap=mip_gap, disp=True)
+    result['diagnostics']['phases']['build'] = build_seconds
+    return model, result
+
+
+def ranging_report(model, scenario):
+    """Ranging of the LP relaxation `model` has just solved for `scenario`,
+    from that solve's basis. A CBC model has no basis to hand over, so a
+    matrix model is solved here instead; None without SciPy."""
+    if not optimizer.HAS_SCIPY:
+        return None
+    import matrix_solver
+    import ranging
+    if isinstance(model, matrix_solver.MatrixModel):
+        return ranging.ranging_report(model, ranging.last_basis(model))
+    model = matrix_solver.MatrixModel(scenario['derived_inputs'], scenario['units'], scenario['net_residential_area'],
+                                      scenario['set_aside_percentage'], ami_tiers=scenario.get('ami_tiers'),
+                                      income_average=scenario.get('income_average'))
+    return ranging.ranging_report(model)
+
+
+def _worker_main(conn, backend, cbc):
+    # Own process group, so cancelling also takes down a running CBC subprocess
+    if hasattr(os, 'setsid'):
+        os.setsid()
+    model = None
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        job_id, scenario, relaxed, time_limit, mip_gap, warm_start, round_lp, with_ranging, log_path = message
+        with redirect_output(log_path):
+            try:
+                model, result = solve_scenario(model, scenario, relaxed, time_limit, mip_gap, backend, cbc, warm_start)
+                # Rounding handles a single AMI level only
+                if round_lp and result['status'] == 'Optimal' and not scenario.get('ami_tiers'):
+                    result['heuristic'] = heuristic.rounded_result(scenario, result)
+                if with_ranging and relaxed and result['status'] == 'Optimal':
+                    result['ranging'] = ranging_report(model, scenario)
+            except Exception as e:
+                model, result = None, {'status': 'Error', 'error': str(e)}
+        # The log is complete once the output is restored; read the solver's statistics from it
+        if 'diagnostics' in result:
+            with open(log_path) as log:
+                diagnostics.apply_solver_log(result['diagnostics'], log.read())
+        conn.send((job_id, result))
+
+
+class SolveWorker:
+    """A solver in a child process that keeps its model between jobs.
+
+    One job runs at a time. With `round_lp`, an optimal LP relaxation is
+    also rounded to a feasible mix, returned as the result's 'heuristic'
+    (see heuristic.rounded_result), and with `with_ranging` its ranging
+    report is returned as 'ranging' (see ranging_report). The solver log is written to a temporary
+    file that progress() reads incrementally; cancel() kills the process (and
+    any CBC it started), and the next submit starts a fresh one.
+    """
+
+    def __init__(self, backend=None, cbc=None):
+        self.backend = backend
+        self.cbc = cbc
+        self.process = None
+        self.conn = None
+        self.job_id = 0
+        self.running = False
+        self.log_path = None
+        self.log_offset = 0
+        self.progress_state = {}
+
+    def _start(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_main, args=(child_conn, self.backend, self.cbc), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def submit(self, scenario, relaxed=False, time_limit=None, mip_gap=None, warm_start=None, round_lp=False,
+               with_ranging=False):
+        if self.process is None or not self.process.is_alive():
+            self._start()
+        self.job_id += 1
+        fd, self.log_path = tempfile.mkstemp(prefix='walnut-solve-', suffix='.log')
+        os.close(fd)
+        self.log_offset = 0
+        self.progress_state = {}
+        self.running = True
+        self.conn.send((self.job_id, scenario, relaxed, time_limit, mip_gap, warm_start, round_lp, with_ranging,
+                        self.log_path))
+        return self.job_id
+
+    def poll(self):
+        # The result of the running job once it has finished, otherwise None
+        if not self.running or not self.conn.poll():
+            return None
+        job_id, result = self.conn.recv()
+        if job_id != self.job_id:
+            return None
+        self.progress()
+        self.running = False
+        self._remove_log()
+        return result
+
+    def progress(self):
+        if self.log_path is None or not os.path.exists(self.log_path):
+            return self.progress_state
+        with open(self.log_path) as log:
+            log.seek(self.log_offset)
+            text = log.read()
+        # Keep a partial last line for the next read
+        complete, _, _ = text.rpartition('\n')
+        self.log_offset += len(complete) + 1 if complete else 0
+        for line in complete.splitlines():
+            parse_progress(line, self.progress_state)
+        return self.progress_state
+
+    def cancel(self):
+        if self.process is not None and self.process.is_alive():
+            if hasattr(os, 'killpg'):
+                try:
+                    os.killpg(self.process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    # Cancelled before the worker made its own group: it has started no CBC yet
+                    self.process.kill()
+            else:
+                self.process.terminate()
+            self.process.join()
+        self.process = None
+        self.running = False
+        self._remove_log()
+
+    def close(self):
+        if self.process is not None and self.process.is_alive() and not self.running:
+            self.conn.send(None)
+            self.process.join(timeout=1)
+        self.cancel()
+
+    def _remove_log(self):
+        if self.log_path is not None:
+            try:
+                os.remove(self.log_path)
+            except OSError:
+                pass
+            self.log_path = None
+
+
+class SolveRace:
+    """SolveWorkers on every available backend solving the same ILP at once.
+
+    The first proven-optimal result wins and the other solves are cancelled.
+    When none proves optimality (time limit or gap), the most profitable
+    mix found is returned once all have stopped, or RACE_GRACE after the
+    time limit. Each result is tagged with
+    the 'backend' that produced it. Drop-in for a SolveWorker in the GUI.
+    """
+
+    def __init__(self, backends=None, cbc=None):
+        if backends is None:
+            backends = [backend for backend in optimizer.BACKENDS if backend != 'highs' or optimizer.HAS_SCIPY]
+        self.workers = {backend: SolveWorker(backend, cbc) for backend in backends}
+        self.results = {}
+        self.running = False
+        self.deadline = None
+        self.start_progress = {}
+
+    def submit(self, scenario, relaxed=False, time_limit=None, mip_gap=None, warm_start=None, round_lp=False,
+               with_ranging=False):
+        self.results = {}
+        self.running = True
+        self.deadline = time.time() + time_limit + RACE_GRACE if time_limit else None
+        # A warm start is the incumbent until a solver reports a better one
+        self.start_progress = {}
+        if warm_start:
+            start = optimizer.extract_results(scenario['derived_inputs'], warm_start, scenario['net_residential_area'])
+            self.start_progress['incumbent'] = start['annual_profit_worst_case']
+        for worker in self.workers.values():
+            worker.submit(scenario, relaxed=relaxed, time_limit=time_limit, mip_gap=mip_gap, warm_start=warm_start,
+                          round_lp=round_lp, with_ranging=with_ranging)
+
+    def poll(self):
+        if not self.running:
+            return None
+        for backend, worker in self.workers.items():
+            if backend in self.results:
+                continue
+            result = worker.poll()
+            if result is None:
+                continue
+            result['backend'] = backend
+            if 'diagnostics' in result:
+                result['diagnostics']['solver']['backend'] = backend
+            self.results[backend] = result
+            if result['status'] == 'Optimal':
+                self.cancel()
+                return result
+        found = [result for result in self.results.values() if 'quantities' in result]
+        if len(self.results) < len(self.workers):
+            if not found or self.deadline is None or time.time() < self.deadline:
+                return None
+            self.cancel()
+        self.running = False
+        if found:
+            return max(found, key=lambda result: result['annual_profit_worst_case'])
+        return next(iter(self.results.values()))
+
+    def progress(self):
+        # Best incumbent and tightest bound over the solvers still running
+        progress = dict(self.start_progress)
+        for backend, worker in self.workers.items():
+            if backend in self.results:
+                continue
+            state = worker.progress()
+            if state.get('incumbent') is not None:
+                progress['incumbent'] = max(progress.get('incumbent', state['incumbent']), state['incumbent'])
+            if state.get('bound') is not None:
+                progress['bound'] = min(progress.get('bound', state['bound']), state['bound'])
+            if 'nodes' in state:
+                progress['nodes'] = progress.get('nodes', 0) + state['nodes']
+        if 'incumbent' in progress and 'bound' in progress:
+            progress['gap'] = abs(progress['bound'] - progress['incumbent']) / max(abs(progress['incumbent']), 1e-9) * 100
+        return progress
+
+    def cancel(self):
+        for backend, worker in self.workers.items():
+            if backend not in self.results:
+                worker.cancel()
+        self.running = False
+
+    def close(self):
+        for worker in self.workers.values():
+            worker.close()
+        self.running = False
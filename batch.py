@@ -0,0 +1,201 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import ami
+import cache
+import diagnostics
+import optimizer
+
+# Columns of the long-format parcel CSV (one row per parcel and unit type).
+# 100% AMI incomes go in ami_1, ami_2, ... columns, one per household size,
+# or in an AMI table file looked up through an ami_area column. Instead of
+# ami_percentage a parcel may fill ami_tiers (see parse_ami_tiers) and
+# optionally income_average.
+PARCEL_COLUMNS = ('parcel', 'net_residential_area', 'ami_percentage', 'set_aside_percentage')
+UNIT_COLUMNS = ('unit', 'sqft', 'rent', 'people', 'min_units', 'max_units')
+
+# Per-process solver settings, set once by the pool initializer
+_worker_solver = None
+_worker_backend = None
+
+
+def parse_ami_tiers(spec):
+    # "30:10;60:40;80" lists AMI tiers as AMI %[:minimum share %], separated by semicolons
+    tiers = []
+    for part in spec.split(';'):
+        level, _, min_share = part.strip().partition(':')
+        tier = {'ami_percentage': float(level)}
+        if min_share.strip():
+            tier['min_share'] = float(min_share)
+        tiers.append(tier)
+    optimizer.check_ami_tiers(tiers)
+    return tiers
+
+
+def load_parcels_csv(path):
+    parcels = {}
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            name = row['parcel']
+            if name not in parcels:
+                parcels[name] = {
+                    'name': name,
+                    'net_residential_area': float(row['net_residential_area']),
+                    'set_aside_percentage': float(row['set_aside_percentage']),
+                    'ami_incomes': {int(key[4:]): float(value) for key, value in row.items()
+                                    if key.startswith('ami_') and key[4:].isdigit() and value},
+                    'units': [],
+                }
+                if row.get('ami_tiers'):
+                    parcels[name]['ami_tiers'] = parse_ami_tiers(row['ami_tiers'])
+                    if row.get('income_average'):
+                        parcels[name]['income_average'] = float(row['income_average'])
+                elif row.get('ami_percentage'):
+                    parcels[name]['ami_percentage'] = float(row['ami_percentage'])
+                else:
+                    raise ValueError(f"parcel {name!r} needs an ami_percentage or ami_tiers")
+                if row.get('ami_area'):
+                    parcels[name]['ami_area'] = row['ami_area']
+            parcels[name]['units'].append({
+                'name': row['unit'],
+                'sqft': float(row['sqft']),
+                'rent': float(row['rent']),
+                'people': int(row['people']),
+                'min_units': float(row['min_units']),
+                'max_units': float(row['max_units']),
+            })
+    return list(parcels.values())
+
+
+def load_parcels_json(path):
+    with open(path) as f:
+        data = json.load(f)
+    parcels = data['parcels'] if isinstance(data, dict) else data
+    for i, parcel in enumerate(parcels):
+        parcel.setdefault('name', f"parcel_{i + 1}")
+        parcel['ami_incomes'] = {int(size): income for size, income in parcel.get('ami_incomes', {}).items()}
+        if parcel.get('ami_tiers'):
+            optimizer.check_ami_tiers(parcel['ami_tiers'])
+    return parcels
+
+
+def load_parcels(path, ami_table=None):
+    parcels = load_parcels_csv(path) if path.lower().endswith('.csv') else load_parcels_json(path)
+    if ami_table is not None:
+        # Parcels naming an AMI area take their 100% incomes from the table
+        for parcel in parcels:
+            if parcel.get('ami_area'):
+                parcel['ami_incomes'] = ami_table.ami_values(parcel['ami_area'], 100)
+    return parcels
+
+
+def _init_worker(cbc, backend):
+    global _worker_solver, _worker_backend
+    _worker_solver = optimizer.make_solver(cbc, msg=False)
+    _worker_backend = backend
+
+
+def _solve_one(parcel):
+    try:
+        result = optimizer.solve_parcel(parcel, solver=_worker_solver, backend=_worker_backend)
+    except Exception as e:
+        result = {'status': 'Error', 'error': str(e)}
+    result['parcel'] = parcel['name']
+    return result
+
+
+def run_batch(parcels, output, workers=None, cbc=None, backend=None, solve_cache=None):
+    """Solve `parcels` across a process pool, streaming JSON lines to `output`.
+
+    Results are written in completion order and flushed as each parcel
+    finishes. With `solve_cache`, parcels seen before are answered from the
+    cache without reaching the pool. Each parcel is also reported to the
+    diagnostics hooks as a 'solve' record. Returns the number of parcels
+    that solved to optimality.
+    """
+    solved = 0
+
+    def emit(result, cached=False):
+        nonlocal solved
+        if result['status'] == 'Optimal':
+            solved += 1
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+        diagnostics.emit('solve', parcel=result['parcel'], status=result['status'], cached=cached,
+                         diagnostics=result.get('diagnostics'))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cbc, backend)) as pool:
+        futures = {}
+        for parcel in parcels:
+            key = None
+            if solve_cache is not None:
+                # A parcel too malformed to key fails on its own, as it would in a worker
+                try:
+                    key = cache.parcel_key(parcel, backend=backend)
+                except Exception as e:
+                    emit({'status': 'Error', 'error': str(e), 'parcel': parcel.get('name')})
+                    continue
+            result = solve_cache.get(key) if key is not None else None
+            if result is not None:
+                result['parcel'] = parcel['name']
+                emit(result, cached=True)
+                continue
+            futures[pool.submit(_solve_one, parcel)] = key
+        for future in as_completed(futures):
+            result = future.result()
+            if solve_cache is not None:
+                solve_cache.put(futures[future], result)
+            emit(result)
+    return solved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve the optimal unit mix for a file of parcels.")
+    parser.add_argument('parcels', help="CSV or JSON file of parcels")
+    parser.add_argument('-o', '--output', default='-', help="JSON-lines output file (default: stdout)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--cbc', default=None, help="path to the CBC binary")
+    parser.add_argument('--backend', choices=optimizer.BACKENDS, default=optimizer.DEFAULT_BACKEND,
+                        help="solver backend (default: %(default)s)")
+    parser.add_argument('--cache', default=None, help="SQLite file to reuse results across runs")
+    parser.add_argument('--ami-table', default=None, help="HUD-style income limits CSV for parcels with an ami_area")
+    parser.add_argument('--log', default=None, help="JSON-lines file for per-parcel timings and solver statistics")
+    args = parser.parse_args(argv)
+
+    log = diagnostics.add_hook(diagnostics.JsonLinesLog(args.log)) if args.log else None
+    aggregator = diagnostics.add_hook(diagnostics.Aggregator())
+    try:
+        parcels = load_parcels(args.parcels, ami.AmiTable.load_csv(args.ami_table) if args.ami_table else None)
+    except ValueError as e:
+        parser.error(str(e))
+    solve_cache = cache.SolveCache(maxsize=len(parcels), path=args.cache) if args.cache else None
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        solved = run_batch(parcels, output, workers=args.workers, cbc=args.cbc, backend=args.backend,
+                           solve_cache=solve_cache)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"Solved {solved} of {len(parcels)} parcels", file=sys.stderr)
+    summary = aggregator.summary()
+    solve_time = summary['totals'].get('phases.solve')
+    if solve_time:
+        print(f"Solver time: {solve_time['total']:.2f}s total, {solve_time['mean'] * 1000:.1f}ms mean, "
+              f"{solve_time['max'] * 1000:.1f}ms max", file=sys.stderr)
+    diagnostics.remove_hook(aggregator)
+    if log is not None:
+        diagnostics.emit('batch', parcels=len(parcels), solved=solved, summary=summary)
+        diagnostics.remove_hook(log)
+        log.close()
+    if solve_cache is not None:
+        print("Cache: {hits} hits, {disk_hits} disk hits, {misses} misses".format(**solve_cache.stats()), file=sys.stderr)
+        solve_cache.close()
+    return 0 if solved == len(parcels) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+from pulp import LpStatus, LpSolutionIntegerFeasible
+
+import optimizer
+
+DEFAULT_SIZES = (2, 5, 10, 20, 50, 100, 200, 500)
+PHASES = ('derived_inputs', 'build', 'solve_ilp', 'extract', 'solve_lp')
+
+# A run is interactive when inputs to results takes less than this (s)
+INTERACTIVE_SECONDS = 1.0
+
+# HUD scales the 4-person income limit by household size
+HUD_SIZE_FACTORS = {1: 0.7, 2: 0.8, 3: 0.9, 4: 1.0, 5: 1.08, 6: 1.16, 7: 1.24, 8: 1.32}
+AMI_PERCENTAGES = (30, 50, 60, 80)
+
+# Timings below this are noise and never flagged as regressions (s)
+MIN_REGRESSION_DELTA = 0.005
+
+
+def generate_parcel(rng, unit_types, name=None):
+    """A random but plausible parcel with `unit_types` unit types.
+
+    Unit sizes grow with household size, rents run $1.50-$4.00 per sq. ft.
+    and the mix limits always leave a feasible mix: minimums sum to at most
+    50% and maximums to more than 100%. The land area is sized for 20 to
+    1,000 units, and the AMI table follows HUD's household size factors.
+    """
+    people = rng.integers(1, 7, unit_types)
+    sqft = np.round((300 + 250 * people) * rng.lognormal(0, 0.2, unit_types))
+    rent = np.round(sqft * rng.uniform(1.5, 4.0, unit_types))
+    min_units = np.floor(rng.uniform(0, 50 / unit_types, unit_types))
+    max_units = min_units + np.ceil(rng.uniform(100 / unit_types, 300 / unit_types, unit_types)) + 1
+
+    units = []
+    for i in range(unit_types):
+        units.append({
+            'name': f"Unit{i + 1}",
+            'sqft': float(sqft[i]),
+            'rent': float(rent[i]),
+            'people': int(people[i]),
+            'min_units': int(min_units[i]),
+            'max_units': int(min(max_units[i], 100)),
+        })
+
+    median_income = float(np.round(rng.uniform(60000, 150000), -2))
+    return {
+        'name': name or f"synthetic-{unit_types}",
+        'net_residential_area': float(np.round(sqft.mean() * 10 ** rng.uniform(1.3, 3))),
+        'ami_incomes': {size: round(median_income * factor, -2) for size, factor in HUD_SIZE_FACTORS.items()},
+        'ami_percentage': float(rng.choice(AMI_PERCENTAGES)),
+        'set_aside_percentage': float(np.round(rng.uniform(10, 40))),
+        'units': units,
+    }
+
+
+def generate_parcels(sizes=DEFAULT_SIZES, cases=3, seed=0):
+    # Each parcel has its own stream keyed by (seed, size, case), so a parcel
+    # is the same whatever other sizes and case counts are run with it
+    return [generate_parcel(np.random.default_rng([seed, size, case]), size, name=f"n{size}-c{case}")
+            for size in sizes for case in range(cases)]
+
+
+def _solve(model, relaxed, solver, time_limit):
+    # The solver call alone, without result extraction
+    if isinstance(model, optimizer.UnitMixModel):
+        model.set_relaxed(relaxed)
+        model.problem.solve(solver)
+        status = LpStatus[model.problem.status]
+        if model.problem.sol_status == LpSolutionIntegerFeasible:
+            status = 'Not Solved'
+        quantities = {unit_type: var.varValue or 0 for unit_type, var in model.unit_vars.items()}
+    else:
+        status, x, _ = model.solve_lp() if relaxed else model.solve_milp(time_limit=time_limit)
+        quantities = {unit_type: float(x[j]) for j, unit_type in enumerate(model.unit_types)} if x is not None else None
+    return status, quantities
+
+
+def _objective(derived_inputs, quantities):
+    # Worst case annual profit before vacancy, the quantity both backends maximize
+    q = derived_inputs.quantity_vector(quantities)
+    return float((derived_inputs.rent - derived_inputs.max_cost) @ q * 12)
+
+
+def run_case(parcel, backend, cbc=None, time_limit=60, repeat=1):
+    """Time each phase of one parcel on one backend.
+
+    Phases are timed `repeat` times and the fastest run is kept. The ILP is
+    compared against its LP relaxation by objective; 'integrality_gap' is
+    the LP objective's excess over the ILP in %.
+    """
+    timings = {phase: [] for phase in PHASES}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ami_values = optimizer.ami_limits(parcel['ami_incomes'], parcel['ami_percentage'])
+        derived_inputs = optimizer.calculate_derived_inputs(parcel['units'], ami_values)
+        timings['derived_inputs'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        model = optimizer.build_model(derived_inputs, parcel['units'], parcel['net_residential_area'],
+                                      parcel['set_aside_percentage'], backend=backend)
+        timings['build'].append(time.perf_counter() - start)
+
+        solver = optimizer.make_solver(cbc, msg=False, time_limit=time_limit)
+        start = time.perf_counter()
+        ilp_status, ilp_quantities = _solve(model, False, solver, time_limit)
+        timings['solve_ilp'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        if ilp_quantities is not None:
+            optimizer.extract_results(derived_inputs, ilp_quantities, parcel['net_residential_area'])
+        timings['extract'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        lp_status, lp_quantities = _solve(model, True, solver, time_limit)
+        timings['solve_lp'].append(time.perf_counter() - start)
+
+    phases = {phase: min(values) for phase, values in timings.items()}
+    result = {
+        'name': parcel['name'],
+        'backend': backend,
+        'unit_types': len(parcel['units']),
+        'net_residential_area': parcel['net_residential_area'],
+        'ami_percentage': parcel['ami_percentage'],
+        'set_aside_percentage': parcel['set_aside_percentage'],
+        'phases': phases,
+        # Inputs to the results window: everything but the LP relaxation
+        'interactive_seconds': sum(phases[phase] for phase in ('derived_inputs', 'build', 'solve_ilp', 'extract')),
+        'ilp_status': ilp_status,
+        'lp_status': lp_status,
+        'ilp_objective': None,
+        'lp_objective': None,
+        'integrality_gap': None,
+    }
+    if ilp_status == 'Optimal':
+        result['ilp_objective'] = _objective(derived_inputs, ilp_quantities)
+    if lp_status == 'Optimal':
+        result['lp_objective'] = _objective(derived_inputs, lp_quantities)
+    if result['ilp_objective'] and result['lp_objective'] is not None:
+        result['integrality_gap'] = (result['lp_objective'] - result['ilp_objective']) / abs(result['ilp_objective']) * 100
+    return result
+
+
+def summarize(cases):
+    """Median interactive time per backend and unit type count, and the
+    unit type count up to which every size solves in INTERACTIVE_SECONDS."""
+    summary = {}
+    for backend in sorted({case['backend'] for case in cases}):
+        by_size = {}
+        for case in cases:
+            if case['backend'] == backend:
+                by_size.setdefault(case['unit_types'], []).append(case['interactive_seconds'])
+        medians = {size: statistics.median(times) for size, times in sorted(by_size.items())}
+        interactive_up_to = None
+        for size, seconds in medians.items():
+            if seconds >= INTERACTIVE_SECONDS:
+                break
+            interactive_up_to = size
+        summary[backend] = {
+            'median_interactive_seconds': {str(size): seconds for size, seconds in medians.items()},
+            'interactive_up_to': interactive_up_to,
+        }
+    return summary
+
+
+def compare(report, baseline, tolerance=0.25):
+    """Regressions of `report` against a stored `baseline` report.
+
+    A phase regresses when it is more than `tolerance` (25%) and
+    MIN_REGRESSION_DELTA slower than in the baseline; a status or objective
+    that differs is always flagged. Returns a list of messages.
+    """
+    previous = {(case['name'], case['backend']): case for case in baseline['cases']}
+    regressions = []
+    for case in report['cases']:
+        old = previous.get((case['name'], case['backend']))
+        if old is None:
+            continue
+        label = f"{case['name']} [{case['backend']}]"
+        for phase, seconds in case['phases'].items():
+            before = old['phases'].get(phase)
+            if before is not None and seconds > before * (1 + tolerance) and seconds - before > MIN_REGRESSION_DELTA:
+                regressions.append(f"{label} {phase}: {before:.4f}s -> {seconds:.4f}s")
+        for key in ('ilp_status', 'lp_status'):
+            if case[key] != old[key]:
+                regressions.append(f"{label} {key}: {old[key]} -> {case[key]}")
+        for key in ('ilp_objective', 'lp_objective'):
+            if case[key] is not None and old[key] is not None and abs(case[key] - old[key]) > 1e-6 * max(1.0, abs(old[key])):
+                regressions.append(f"{label} {key}: {old[key]:,.2f} -> {case[key]:,.2f}")
+    return regressions
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, cases=3, seed=0, backends=None, cbc=None, time_limit=60, repeat=1, progress=None):
+    report = {
+        'meta': {
+            'seed': seed,
+            'sizes': list(sizes),
+            'cases': cases,
+            'repeat': repeat,
+            'time_limit': time_limit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'cases': [],
+    }
+    for parcel in generate_parcels(sizes, cases, seed):
+        for backend in backends or [optimizer.DEFAULT_BACKEND]:
+            result = run_case(parcel, backend, cbc=cbc, time_limit=time_limit, repeat=repeat)
+            report['cases'].append(result)
+            if progress is not None:
+                progress(result)
+    report['summary'] = summarize(report['cases'])
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the unit mix optimizer on synthetic parcels of growing size.")
+    parser.add_argument('-o', '--output', default=None, help="JSON report file")
+    parser.add_argument('--baseline', default=None, help="earlier JSON report to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=25, help="allowed slowdown over the baseline in %% (default: 25)")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help="unit type counts (default: %(default)s)")
+    parser.add_argument('--cases', type=int, default=3, help="parcels per size (default: 3)")
+    parser.add_argument('--seed', type=int, default=0, help="generator seed (default: 0)")
+    parser.add_argument('--repeat', type=int, default=1, help="timing runs per phase, fastest kept (default: 1)")
+    parser.add_argument('--backend', action='append', choices=optimizer.BACKENDS, default=None,
+                        help=f"solver backend, repeat for several (default: {optimizer.DEFAULT_BACKEND})")
+    parser.add_argument('--cbc', default=None, help="path to the CBC binary")
+    parser.add_argument('--time-limit', type=float, default=60, help="ILP time limit per solve in seconds (default: 60)")
+    args = parser.parse_args(argv)
+
+    def progress(case):
+        phases = ' '.join(f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in case['phases'].items())
+        print(f"{case['name']:>10} [{case['backend']}] {case['ilp_status']:<10} {phases}", file=sys.stderr)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    report = run_benchmark(sizes, args.cases, args.seed, args.backend, args.cbc, args.time_limit, args.repeat, progress)
+    for backend, summary in report['summary'].items():
+        print(f"{backend}: interactive (< {INTERACTIVE_SECONDS:g}s) up to {summary['interactive_up_to']} unit types", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance / 100)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import optimizer
+
+# Results worth keeping; time-limited or failed solves are always re-run
+CACHEABLE_STATUSES = ('Optimal', 'Infeasible', 'Unbounded')
+
+
+def scenario_key(derived_inputs, units, net_residential_area, set_aside_percentage, ami_values=None, relaxed=False,
+                 ami_tiers=None, income_average=None, backend=None):
+    """Canonical hash of everything that determines a solve.
+
+    Unit order, int/float spelling and dict ordering do not change the key.
+    The backend is part of it, so HiGHS and CBC results are kept apart;
+    None stands for optimizer.DEFAULT_BACKEND.
+    """
+    scenario = {
+        'derived_inputs': sorted(
+            [{key: float(value) if isinstance(value, (int, float)) else value for key, value in di.items()}
+             for di in derived_inputs],
+            key=lambda di: di['Unit Type']),
+        'mix': sorted((optimizer.unit_key(unit['name']), float(unit['min_units']), float(unit['max_units']))
+                      for unit in units),
+        'net_residential_area': float(net_residential_area),
+        'set_aside_percentage': float(set_aside_percentage),
+        'ami_values': sorted((int(size), float(income)) for size, income in (ami_values or {}).items()),
+        'relaxed': bool(relaxed),
+        'backend': backend or optimizer.DEFAULT_BACKEND,
+    }
+    # Single-level scenarios keep the keys they had before AMI tiers existed
+    if ami_tiers:
+        scenario['ami_tiers'] = [(float(tier['ami_percentage']), float(tier.get('min_share') or 0)) for tier in ami_tiers]
+        scenario['income_average'] = None if income_average is None else float(income_average)
+    text = json.dumps(scenario, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def parcel_key(parcel, relaxed=False, backend=None):
+    # scenario_key for a plain-data parcel as read by batch.py
+    ami_percentage = 100 if parcel.get('ami_tiers') else parcel['ami_percentage']
+    ami_values = optimizer.ami_limits(parcel['ami_incomes'], ami_percentage)
+    derived_inputs = optimizer.parcel_derived_inputs(parcel)
+    return scenario_key(derived_inputs, parcel['units'], parcel['net_residential_area'],
+                        parcel['set_aside_percentage'], ami_values=ami_values, relaxed=relaxed,
+                        ami_tiers=parcel.get('ami_tiers'), income_average=parcel.get('income_average'), backend=backend)
+
+
+class SolveCache:
+    """Two-tier memo of solve results keyed by scenario_key.
+
+    An in-memory LRU holds up to `maxsize` results; with `path` set, results
+    are also written to a SQLite file that survives restarts. Results are
+    stored as JSON, so every get returns a fresh copy the caller may modify.
+    """
+
+    def __init__(self, maxsize=256, path=None):
+        self.maxsize = maxsize
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS solve_cache (key TEXT PRIMARY KEY, result TEXT NOT NULL)")
+            self.db.commit()
+
+    def get(self, key):
+        with self.lock:
+            text = self.memory.get(key)
+            if text is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return json.loads(text)
+            if self.db is not None:
+                row = self.db.execute("SELECT result FROM solve_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    self.disk_hits += 1
+                    return json.loads(row[0])
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        if result.get('status') not in CACHEABLE_STATUSES:
+            return
+        text = json.dumps(result)
+        with self.lock:
+            self._remember(key, text)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO solve_cache (key, result) VALUES (?, ?)", (key, text))
+                self.db.commit()
+
+    def _remember(self, key, text):
+        self.memory[key] = text
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'size': len(self.memory)}
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
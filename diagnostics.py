@@ -0,0 +1,158 @@
+import json
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+# Statistics in the closing report of a CBC or HiGHS log, with how to read each value
+LOG_STATISTICS = (
+    # CBC
+    ('nodes', re.compile(r'^Enumerated nodes:\s+(\d+)'), int),
+    ('iterations', re.compile(r'^Total iterations:\s+(\d+)'), int),
+    ('iterations', re.compile(r'^Optimal objective \S+ - (\d+) iterations'), int),
+    ('gap', re.compile(r'^Gap:\s+(\S+)'), lambda value: float(value) * 100),
+    ('lp_objective', re.compile(r'^Continuous objective value is (\S+)'), float),
+    ('solver_seconds', re.compile(r'^Total time \(CPU seconds\):\s+\S+\s+\(Wallclock seconds\):\s+(\S+)'), float),
+    # HiGHS
+    ('nodes', re.compile(r'^\s*Nodes\s+(\d+)\s*$'), int),
+    ('iterations', re.compile(r'^\s*LP iterations\s+(\d+)\s*$'), int),
+    ('iterations', re.compile(r'^Simplex\s+iterations:\s*(\d+)'), int),
+    ('gap', re.compile(r'^\s*Gap\s+([\d.eE+-]+)%'), float),
+    ('solver_seconds', re.compile(r'^\s*Timing\s+(\S+)'), float),
+    ('solver_seconds', re.compile(r'^HiGHS run time\s*:\s*(\S+)'), float),
+)
+
+# Phases in the order they run, for reports
+PHASES = ('derived_inputs', 'heuristic', 'build', 'mps_write', 'solver_launch', 'solve', 'extract')
+
+# Callables that receive every record passed to emit()
+_hooks = []
+
+
+def parse_solver_log(text):
+    """Solver statistics (nodes, iterations, gap %, LP relaxation objective
+    and the solver's own run time) found in a CBC or HiGHS log."""
+    statistics = {}
+    for line in text.splitlines():
+        for name, pattern, convert in LOG_STATISTICS:
+            match = pattern.match(line)
+            if match:
+                try:
+                    statistics[name] = convert(match.group(1))
+                except ValueError:
+                    pass
+                break
+    return statistics
+
+
+def new_diagnostics():
+    return {'phases': {}, 'solver': {}}
+
+
+@contextmanager
+def timed(diagnostics, phase):
+    # Add the time spent in the block to `phase` of a diagnostics dict
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = diagnostics['phases']
+        phases[phase] = phases.get(phase, 0.0) + time.perf_counter() - start
+
+
+def apply_solver_log(diagnostics, text):
+    """Merge the statistics of a solver log into `diagnostics`.
+
+    Statistics the solver interface already reported are kept. For CBC,
+    which runs as a separate process on an MPS file, the measured 'solve'
+    phase is split into CBC's own run time and 'solver_launch' (process
+    start and reading the solution back).
+    """
+    statistics = parse_solver_log(text)
+    solver_seconds = statistics.pop('solver_seconds', None)
+    for name, value in statistics.items():
+        diagnostics['solver'].setdefault(name, value)
+    phases = diagnostics['phases']
+    if solver_seconds is not None and 'mps_write' in phases and 'solve' in phases and 'solver_launch' not in phases:
+        phases['solver_launch'] = max(0.0, phases['solve'] - solver_seconds)
+        phases['solve'] = min(phases['solve'], solver_seconds)
+    return diagnostics
+
+
+def add_hook(hook):
+    _hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def emit(event, **fields):
+    """Send a record to every hook: {'event', 'time', **fields}."""
+    record = {'event': event, 'time': time.time()}
+    record.update(fields)
+    for hook in list(_hooks):
+        hook(record)
+    return record
+
+
+class JsonLinesLog:
+    """Hook writing each record as one JSON line to a file or stream."""
+
+    def __init__(self, path=None, stream=None):
+        self.stream = stream or open(path, 'a')
+        self.owned = stream is None
+
+    def __call__(self, record):
+        self.stream.write(json.dumps(record, default=str) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        if self.owned:
+            self.stream.close()
+
+
+class Aggregator:
+    """Hook totalling the 'solve' records of a run.
+
+    summary() gives the number of solves by status, how many of them were
+    cache hits and, per phase and solver statistic, the total, mean and
+    maximum over the solves that reported it. Cache hits carry the timings
+    of the solve that filled the cache, so they are left out of the totals.
+    """
+
+    def __init__(self):
+        self.statuses = {}
+        self.cached = 0
+        self.values = {}
+
+    def __call__(self, record):
+        if record['event'] != 'solve':
+            return
+        self.statuses[record.get('status')] = self.statuses.get(record.get('status'), 0) + 1
+        if record.get('cached'):
+            self.cached += 1
+            return
+        diagnostics = record.get('diagnostics') or new_diagnostics()
+        for group in ('phases', 'solver'):
+            for name, value in diagnostics.get(group, {}).items():
+                if isinstance(value, (int, float)):
+                    self.values.setdefault(f"{group}.{name}", []).append(value)
+
+    def summary(self):
+        totals = {}
+        for name, values in sorted(self.values.items()):
+            totals[name] = {'total': sum(values), 'mean': sum(values) / len(values), 'max': max(values), 'count': len(values)}
+        return {'solves': sum(self.statuses.values()), 'cached': self.cached, 'statuses': self.statuses,
+                'totals': totals}
+
+
+def log_from_environment(variable='WALNUT_LOG'):
+    # Log every record as JSON lines to the file named by $WALNUT_LOG, if set ('-' for stderr)
+    path = os.environ.get(variable)
+    if not path:
+        return None
+    return add_hook(JsonLinesLog(stream=sys.stderr) if path == '-' else JsonLinesLog(path))
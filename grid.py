@@ -0,0 +1,334 @@
+import csv
+import io
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+
+# Rows a DataGrid shows at once; only these have widgets
+VISIBLE_ROWS = 15
+
+# Rows per page of a PagedTree
+PAGE_SIZE = 200
+
+# Rows handed to the CSV writer at a time when exporting
+EXPORT_CHUNK = 1000
+
+
+def _normalized(text):
+    return ''.join(ch for ch in str(text).lower() if ch.isalnum())
+
+
+def parse_table(text):
+    """Rows of cells from pasted text: tab-separated (a spreadsheet copy) or CSV."""
+    text = text.strip('\r\n')
+    if not text:
+        return []
+    dialect = 'excel-tab' if '\t' in text else 'excel'
+    return [row for row in csv.reader(io.StringIO(text), dialect) if any(cell.strip() for cell in row)]
+
+
+def write_csv(path, header, rows, chunk=EXPORT_CHUNK):
+    # Stream any iterable of rows to a CSV file a batch at a time
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk:
+                writer.writerows(batch)
+                batch = []
+        writer.writerows(batch)
+
+
+class Table:
+    """Rows of text cells under typed columns, the data behind a DataGrid.
+
+    `columns` are (key, heading, convert, default) tuples; cells are kept as
+    typed and converted by records(). With a `key` column, imports that
+    carry a header update the rows with matching keys, so a file of just
+    names and mix limits fills in those columns of an existing catalog.
+    """
+
+    def __init__(self, columns, key=None):
+        self.columns = columns
+        self.key = key
+        self.rows = []
+
+    def blank_row(self):
+        return ['' if default is None else str(default) for _, _, _, default in self.columns]
+
+    def resize(self, count):
+        del self.rows[count:]
+        while len(self.rows) < count:
+            self.rows.append(self.blank_row())
+
+    def set(self, row, column, text):
+        self.rows[row][column] = text
+
+    def paste(self, row, column, cells):
+        # Write a block of cells with its top left at (row, column), adding rows as needed
+        for i, values in enumerate(cells):
+            if row + i >= len(self.rows):
+                self.rows.append(self.blank_row())
+            for j, text in enumerate(values[:len(self.columns) - column]):
+                self.rows[row + i][column + j] = text.strip()
+
+    def header_columns(self, header):
+        # {column: position in the row} when `header` names at least one column, else None
+        names = {}
+        for j, (key, heading, _, _) in enumerate(self.columns):
+            names[_normalized(key)] = j
+            names[_normalized(heading)] = j
+        mapping = {}
+        for position, cell in enumerate(header):
+            j = names.get(_normalized(cell))
+            if j is not None and j not in mapping:
+                mapping[j] = position
+        return mapping or None
+
+    def import_rows(self, cells):
+        """Load parsed rows, with or without a header row.
+
+        Without a header the cells replace the table column by column. With
+        one, the named columns are read; when the key column is among them,
+        rows with a known key are updated and the others appended.
+        """
+        if not cells:
+            return
+        mapping = self.header_columns(cells[0])
+        if mapping is None:
+            self.rows = []
+            self.paste(0, 0, cells)
+            return
+        if self.key is None or self.key not in mapping:
+            self.rows = []
+            for values in cells[1:]:
+                row = self.blank_row()
+                for j, position in mapping.items():
+                    if position < len(values):
+                        row[j] = values[position].strip()
+                self.rows.append(row)
+            return
+        # Rows without a key are placeholders from resize(); imported rows take their place
+        self.rows = [row for row in self.rows if row[self.key].strip()]
+        index = {row[self.key].strip(): row for row in self.rows}
+        for values in cells[1:]:
+            if mapping[self.key] >= len(values) or not values[mapping[self.key]].strip():
+                continue
+            name = values[mapping[self.key]].strip()
+            if name not in index:
+                index[name] = self.blank_row()
+                self.rows.append(index[name])
+            for j, position in mapping.items():
+                if position < len(values):
+                    index[name][j] = values[position].strip()
+
+    def records(self):
+        """Rows as dicts of converted values; ValueError names the first bad cell."""
+        records = []
+        for i, row in enumerate(self.rows):
+            record = {}
+            for (key, heading, convert, default), text in zip(self.columns, row):
+                text = text.strip()
+                try:
+                    record[key] = text if convert is str else convert(text.replace(',', ''))
+                except ValueError:
+                    raise ValueError(f"Row {i + 1}, {heading}: {text!r} is not a valid value") from None
+            records.append(record)
+        return records
+
+
+def int_cell(text):
+    # Whole number cell that also reads spreadsheet exports like '12.0'
+    value = float(text)
+    if not value.is_integer():
+        raise ValueError(text)
+    return int(value)
+
+
+class DataGrid(ttk.Frame):
+    """Spreadsheet-style editor for a Table with widgets for the visible rows only.
+
+    Scrolling points the same entries at other rows, so a catalog of
+    thousands of rows costs as many widgets as one of VISIBLE_ROWS. Pasting
+    tab- or comma-separated cells (Ctrl+V) fills the grid from the focused
+    cell down and right, adding rows as needed. `on_change` is called after
+    every edit, paste, import or resize of the table.
+    """
+
+    def __init__(self, container, table, visible_rows=VISIBLE_ROWS, width=12, on_change=None, **kwargs):
+        super().__init__(container, **kwargs)
+        self.table = table
+        self.on_change = on_change
+        self.top = 0
+        self.visible_rows = visible_rows
+        self.loading = False
+
+        for j, (_, heading, _, _) in enumerate(table.columns):
+            ttk.Label(self, text=heading).grid(row=0, column=j + 1, padx=2)
+        self.row_labels = []
+        self.vars = []
+        self.entries = []
+        for i in range(visible_rows):
+            label = ttk.Label(self, width=5, anchor='e')
+            label.grid(row=i + 1, column=0)
+            self.row_labels.append(label)
+            row_vars, row_entries = [], []
+            for j in range(len(table.columns)):
+                var = tk.StringVar()
+                var.trace_add('write', lambda *args, i=i, j=j: self.store(i, j))
+                entry = ttk.Entry(self, textvariable=var, width=width)
+                entry.grid(row=i + 1, column=j + 1, sticky='ew')
+                entry.bind('<<Paste>>', lambda event, i=i, j=j: self.paste(i, j))
+                entry.bind('<Up>', lambda event, i=i, j=j: self.move_focus(i - 1, j))
+                entry.bind('<Down>', lambda event, i=i, j=j: self.move_focus(i + 1, j))
+                entry.bind('<Return>', lambda event, i=i, j=j: self.move_focus(i + 1, j))
+                entry.bind('<MouseWheel>', lambda event: self.yview('scroll', -1 if event.delta > 0 else 1, 'units'))
+                entry.bind('<Button-4>', lambda event: self.yview('scroll', -1, 'units'))
+                entry.bind('<Button-5>', lambda event: self.yview('scroll', 1, 'units'))
+                row_vars.append(var)
+                row_entries.append(entry)
+            self.vars.append(row_vars)
+            self.entries.append(row_entries)
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.yview)
+        self.scrollbar.grid(row=1, column=len(table.columns) + 1, rowspan=visible_rows, sticky='ns')
+        self.refresh()
+
+    def refresh(self):
+        # Show the rows from self.top in the entry pool
+        self.loading = True
+        try:
+            count = len(self.table.rows)
+            self.top = max(0, min(self.top, count - self.visible_rows))
+            for i in range(self.visible_rows):
+                row = self.top + i
+                self.row_labels[i].configure(text=str(row + 1) if row < count else "")
+                for j, var in enumerate(self.vars[i]):
+                    var.set(self.table.rows[row][j] if row < count else "")
+                    self.entries[i][j].configure(state='normal' if row < count else 'disabled')
+        finally:
+            self.loading = False
+        if count:
+            self.scrollbar.set(self.top / count, min(1.0, (self.top + self.visible_rows) / count))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def store(self, i, j):
+        if not self.loading and self.top + i < len(self.table.rows):
+            self.table.set(self.top + i, j, self.vars[i][j].get())
+            self.changed()
+
+    def yview(self, *args):
+        count = len(self.table.rows)
+        if args[0] == 'moveto':
+            self.top = int(float(args[1]) * count)
+        elif args[0] == 'scroll':
+            step = int(args[1]) * (self.visible_rows if args[2] == 'pages' else 1)
+            self.top += step
+        self.refresh()
+        return 'break'
+
+    def move_focus(self, i, j):
+        # Keyboard navigation, scrolling at the edges of the visible rows
+        if i < 0:
+            self.yview('scroll', -1, 'units')
+            i = 0
+        elif i >= self.visible_rows:
+            self.yview('scroll', 1, 'units')
+            i = self.visible_rows - 1
+        self.entries[i][j].focus_set()
+        return 'break'
+
+    def paste(self, i, j):
+        try:
+            text = self.clipboard_get()
+        except tk.TclError:
+            return None
+        if '\t' not in text and '\n' not in text.strip():
+            # A single value: let the entry paste it as usual
+            return None
+        self.table.paste(self.top + i, j, parse_table(text))
+        self.refresh()
+        self.changed()
+        return 'break'
+
+    def set_rows(self, count):
+        self.table.resize(count)
+        self.refresh()
+        self.changed()
+
+    def import_csv(self, path=None):
+        path = path or filedialog.askopenfilename(title="Import CSV", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return False
+        try:
+            with open(path, newline='') as f:
+                self.table.import_rows(parse_table(f.read()))
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            messagebox.showerror("Error", f"Failed to import {path}: {e}")
+            return False
+        self.top = 0
+        self.refresh()
+        self.changed()
+        return True
+
+    def export_csv(self, path=None):
+        path = path or filedialog.asksaveasfilename(title="Export CSV", defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+        if path:
+            write_csv(path, [heading for _, heading, _, _ in self.table.columns], self.table.rows)
+
+
+class PagedTree(ttk.Frame):
+    """Treeview that holds one page of a long list of rows at a time.
+
+    `rows` is a sequence of value tuples; only the current page is inserted
+    into the Treeview, so opening a window over thousands of rows costs one
+    page. Export CSV streams every row, not just the page shown.
+    """
+
+    def __init__(self, container, columns, rows, page_size=PAGE_SIZE, height=15, **kwargs):
+        super().__init__(container, **kwargs)
+        self.columns = columns
+        self.rows = rows
+        self.page_size = page_size
+        self.page = 0
+
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=height)
+        for column in columns:
+            self.tree.heading(column, text=column)
+        scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        scrollbar.grid(row=0, column=1, sticky='ns')
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        navigation = ttk.Frame(self)
+        navigation.grid(row=1, column=0, columnspan=2, sticky='ew')
+        ttk.Button(navigation, text="< Prev", command=lambda: self.show(self.page - 1)).pack(side='left')
+        self.page_label = ttk.Label(navigation)
+        self.page_label.pack(side='left', padx=10)
+        ttk.Button(navigation, text="Next >", command=lambda: self.show(self.page + 1)).pack(side='left')
+        ttk.Button(navigation, text="Export CSV...", command=self.export_csv).pack(side='right')
+        self.show(0)
+
+    def pages(self):
+        return max(1, -(-len(self.rows) // self.page_size))
+
+    def show(self, page):
+        self.page = max(0, min(page, self.pages() - 1))
+        self.tree.delete(*self.tree.get_children())
+        start = self.page * self.page_size
+        for values in self.rows[start:start + self.page_size]:
+            self.tree.insert('', 'end', values=values)
+        end = min(start + self.page_size, len(self.rows))
+        self.page_label.configure(text=f"Rows {start + 1 if self.rows else 0}-{end} of {len(self.rows)}")
+
+    def export_csv(self, path=None):
+        path = path or filedialog.asksaveasfilename(title="Export CSV", defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+        if path:
+            write_csv(path, self.columns, self.rows)
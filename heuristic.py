@@ -0,0 +1,191 @@
+import time
+
+import numpy as np
+
+import optimizer
+
+TOL = 1e-9
+
+# Moves made before the repair or improvement gives up
+MAX_MOVES = 2000
+
+# (market, affordable) changes of the moves within one unit: add or remove
+# either, both together, or turn one into the other
+UNIT_MOVES = np.array([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1)])
+
+# Trades between units price n^2 moves, so they are only tried up to this many unit types
+SHIFT_MAX_UNIT_TYPES = 250
+
+
+class MixState:
+    """An integer unit mix and the activity of each row of the unit mix model.
+
+    Total units is written as the sum of the quantities, so a move changes
+    every min/max units row through the total; but a move touches at most
+    two units and changes the total by at most two, so its violation is
+    priced from per-unit terms instead of the whole model. Land is measured
+    in average units, so a violation of 1 reads as about one unit on every row.
+    """
+
+    def __init__(self, derived_inputs, units, net_residential_area, set_aside_percentage, quantities):
+        names = [optimizer.unit_key(unit['name']) for unit in units]
+        self.market = np.array([derived_inputs.positions[name] for name in names], dtype=int)
+        self.aff = np.array([derived_inputs.positions[f"Aff_{name}"] for name in names], dtype=int)
+        n = len(derived_inputs.unit_types)
+        aff_housing_percent = set_aside_percentage * 0.01
+
+        # Unit of each unit type, and its coefficient in that unit's set-aside row
+        self.unit_of = np.zeros(n, dtype=int)
+        self.unit_of[self.market] = self.unit_of[self.aff] = np.arange(len(names))
+        self.coef = np.zeros(n)
+        self.coef[self.market] = -aff_housing_percent
+        self.coef[self.aff] = 1 - aff_housing_percent
+        self.min_share = np.array([0.01 * unit['min_units'] for unit in units])
+        self.max_share = np.array([0.01 * unit['max_units'] for unit in units])
+
+        scale = derived_inputs.sq_ft.mean() if n else 1.0
+        self.sq_ft = derived_inputs.sq_ft / scale
+        self.land_bounds = (optimizer.LAND_UTILIZATION_MIN * net_residential_area / scale, net_residential_area / scale)
+        self.profit = (derived_inputs.rent - derived_inputs.max_cost) * 12
+        self.q = np.array(quantities, dtype=float)
+        self.recount()
+
+    def recount(self):
+        q = self.q
+        self.total = q.sum()
+        self.land = self.sq_ft @ q
+        self.unit_total = q[self.market] + q[self.aff]
+        self.unit_row = self.coef[self.market] * q[self.market] + self.coef[self.aff] * q[self.aff]
+
+    def land_violation(self, land):
+        low, high = self.land_bounds
+        return np.maximum(low - land, 0) + np.maximum(land - high, 0)
+
+    def mix_violation(self, unit_total, total, units=slice(None)):
+        return (np.maximum(self.min_share[units] * total - unit_total, 0)
+                + np.maximum(unit_total - self.max_share[units] * total, 0))
+
+    def violation(self):
+        return float(self.land_violation(self.land) + self.mix_violation(self.unit_total, self.total).sum()
+                     + np.maximum(-self.unit_row, 0).sum())
+
+    def unit_moves(self):
+        # Violation after and profit gain of each UNIT_MOVES row on each unit (moves x units)
+        dm, da = UNIT_MOVES[:, :1], UNIT_MOVES[:, 1:]
+        dt = dm + da
+        mix = {d: self.mix_violation(self.unit_total, self.total + d) for d in range(-2, 3)}
+        mix_before = np.array([mix[d] for d in dt.ravel()])
+        mix_after = self.mix_violation(self.unit_total + dt, self.total + dt)
+        aff_before = np.maximum(-self.unit_row, 0)
+        aff_after = np.maximum(-(self.unit_row + dm * self.coef[self.market] + da * self.coef[self.aff]), 0)
+        land = self.land_violation(self.land + dm * self.sq_ft[self.market] + da * self.sq_ft[self.aff])
+        violation = (land + mix_before.sum(axis=1, keepdims=True) - mix_before + mix_after
+                     + aff_before.sum() - aff_before + aff_after)
+        violation[(self.q[self.market] + dm < 0) | (self.q[self.aff] + da < 0)] = np.inf
+        return violation, dm * self.profit[self.market] + da * self.profit[self.aff]
+
+    def apply_unit_move(self, move, unit):
+        self.q[self.market[unit]] += UNIT_MOVES[move, 0]
+        self.q[self.aff[unit]] += UNIT_MOVES[move, 1]
+        self.recount()
+
+    def shifts(self):
+        # Violation after and profit gain of trading one unit type (row) for one of another unit (column)
+        unit = self.unit_of
+        mix = self.mix_violation(self.unit_total, self.total)
+        aff = np.maximum(-self.unit_row, 0)
+        base = mix.sum() + aff.sum()
+        remove = (self.mix_violation(self.unit_total[unit] - 1, self.total, unit) - mix[unit]
+                  + np.maximum(-(self.unit_row[unit] - self.coef), 0) - aff[unit])
+        remove[self.q < 1] = np.inf
+        add = (self.mix_violation(self.unit_total[unit] + 1, self.total, unit) - mix[unit]
+               + np.maximum(-(self.unit_row[unit] + self.coef), 0) - aff[unit])
+        violation = (self.land_violation(self.land - self.sq_ft[:, np.newaxis] + self.sq_ft)
+                     + base + remove[:, np.newaxis] + add)
+        # Trades within a unit are unit moves
+        violation[unit[:, np.newaxis] == unit] = np.inf
+        return violation, self.profit - self.profit[:, np.newaxis]
+
+    def apply_shift(self, j, k):
+        self.q[j] -= 1
+        self.q[k] += 1
+        self.recount()
+
+
+def _pick(violation, gain, current):
+    # Index of the best move: while infeasible, the one removing the most violation
+    # (then the most profitable); once feasible, the most profitable that stays so
+    violation, gain = violation.ravel(), gain.ravel()
+    if current > TOL:
+        k = np.lexsort((-gain, violation))[0]
+        return k if violation[k] < current - TOL else None
+    candidates = np.where(violation <= TOL, gain, -np.inf)
+    k = int(np.argmax(candidates))
+    return k if candidates[k] > TOL else None
+
+
+def _search(state, shifts):
+    # Repair, then improve, one move at a time; the mix, or None when it stays infeasible
+    for _ in range(MAX_MOVES):
+        current = state.violation()
+        violation, gain = state.unit_moves()
+        k = _pick(violation, gain, current)
+        if k is not None:
+            state.apply_unit_move(*np.unravel_index(k, violation.shape))
+            continue
+        if not shifts:
+            break
+        violation, gain = state.shifts()
+        k = _pick(violation, gain, current)
+        if k is None:
+            break
+        state.apply_shift(*np.unravel_index(k, violation.shape))
+    return state.q if state.violation() <= TOL else None
+
+
+def round_mix(derived_inputs, units, net_residential_area, set_aside_percentage, quantities):
+    """Round an LP relaxation mix to a feasible integer mix, or None.
+
+    The LP quantities are rounded down, to nearest and up, and each is
+    repaired by the moves that remove the most violation: adding, removing
+    or converting units within a unit type pair, or, on smaller models,
+    trading a unit type for one of another unit. Each is then improved by
+    the moves that raise the worst case profit and keep the mix feasible.
+    The most profitable result is returned. Only single AMI level models
+    are rounded; derived inputs with AMI tiers raise ValueError.
+    """
+    derived_inputs = optimizer.DerivedInputs.from_records(derived_inputs)
+    if any(f"Aff_{optimizer.unit_key(unit['name'])}" not in derived_inputs.positions for unit in units):
+        raise ValueError("round_mix handles a single AMI level; models with AMI tiers are not supported")
+    x = derived_inputs.quantity_vector(quantities)
+    shifts = len(x) <= 2 * SHIFT_MAX_UNIT_TYPES
+    best = None
+    for rounded in (np.floor(x + 1e-6), np.round(x), np.ceil(x - 1e-6)):
+        state = MixState(derived_inputs, units, net_residential_area, set_aside_percentage, rounded)
+        q = _search(state, shifts)
+        if q is not None and (best is None or state.profit @ q > state.profit @ best):
+            best = q
+    if best is None:
+        return None
+    return {unit_type: float(best[j]) for j, unit_type in enumerate(derived_inputs.unit_types)}
+
+
+def heuristic_gap(lp_result, heuristic_result):
+    # How far (%) the rounded mix's worst case profit is below the LP relaxation's
+    lp_profit = lp_result['annual_profit_worst_case']
+    return (lp_profit - heuristic_result['annual_profit_worst_case']) / abs(lp_profit) * 100 if lp_profit else 0.0
+
+
+def rounded_result(scenario, lp_result):
+    """Results of the mix rounded from an optimal LP relaxation of `scenario`
+    (as background.solve_scenario takes it), with its 'gap' to the LP and the
+    'seconds' rounding took; None when rounding finds no feasible mix."""
+    start = time.perf_counter()
+    quantities = round_mix(scenario['derived_inputs'], scenario['units'], scenario['net_residential_area'],
+                           scenario['set_aside_percentage'], lp_result['quantities'])
+    if quantities is None:
+        return None
+    result = optimizer.extract_results(scenario['derived_inputs'], quantities, scenario['net_residential_area'])
+    result['gap'] = heuristic_gap(lp_result, result)
+    result['seconds'] = time.perf_counter() - start
+    return result
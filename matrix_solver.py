@@ -0,0 +1,261 @@
+import numpy as np
+from scipy import sparse
+from scipy.optimize import milp, linprog, LinearConstraint, Bounds
+
+import optimizer
+from diagnostics import new_diagnostics, timed
+
+# scipy status codes mapped onto the PuLP status names the rest of the tool uses
+MILP_STATUS = {0: 'Optimal', 1: 'Not Solved', 2: 'Infeasible', 3: 'Unbounded', 4: 'Undefined'}
+LINPROG_STATUS = {0: 'Optimal', 1: 'Not Solved', 2: 'Infeasible', 3: 'Unbounded', 4: 'Undefined'}
+
+# A warm start's objective floor sits this far (relative) below its profit, so
+# the start itself stays feasible under rounding
+WARM_START_SLACK = 1e-9
+
+# HiGHS presolve costs more than it saves on a handful of unit types
+PRESOLVE_MIN_COLUMNS = 200
+
+# Relative violation of a row bound up to which a warm start still counts as feasible
+FEASIBILITY_TOLERANCE = 1e-7
+
+
+def _percent(fraction):
+    return fraction * 100 if fraction is not None and np.isfinite(fraction) else None
+
+
+def _negated(value):
+    # SciPy minimizes -c @ x, so its bounds come back negated
+    return -value if value is not None and np.isfinite(value) else None
+
+
+class MatrixModel:
+    """Unit mix model in matrix form: maximize c @ x subject to lb <= A @ x <= ub.
+
+    Columns are the derived input unit types followed by TotalUnits. Rows
+    carry the same names and orientation (lhs - rhs) as optimizer.UnitMixModel,
+    so duals line up with what CBC reports, and the same setters edit the
+    arrays in place between solves. A is a sparse CSR matrix holding only
+    each row's own terms, so it grows with units x AMI tiers, not its square.
+    """
+
+    def __init__(self, derived_inputs, units, net_residential_area, set_aside_percentage, ami_tiers=None,
+                 income_average=None):
+        self.derived_inputs = optimizer.DerivedInputs.from_records(derived_inputs)
+        # Node count, iterations, gap and bound of the last solve, as HiGHS reports them
+        self.statistics = {}
+        # (x, duals) of the last optimal LP relaxation, until a setter edits the model
+        self.lp_solution = None
+        unit_types = self.derived_inputs.unit_types
+        index = self.derived_inputs.positions
+        n = len(unit_types) + 1
+        total = n - 1
+        aff_housing_percent = set_aside_percentage * 0.01
+
+        self.unit_types = unit_types
+        self.index = index
+        self.unit_names = [optimizer.unit_key(unit['name']) for unit in units]
+        self.affordable = {unit_name: [index[unit_type] for unit_type in optimizer.affordable_unit_types(unit_name, ami_tiers)]
+                           for unit_name in self.unit_names}
+        self.ami_tiers = ami_tiers
+        self.income_average = income_average
+        self.net_residential_area = net_residential_area
+        self.c = np.zeros(n)
+        self.c[:total] = (self.derived_inputs.rent - self.derived_inputs.max_cost) * 12
+
+        rows, columns, values, lb, ub, names = [], [], [], [], [], []
+
+        def add_row(cols, coefs, lower, upper, name):
+            # Every coefficient a setter may change is stored, even when it starts at zero
+            cols = np.asarray(cols, dtype=int)
+            rows.append(np.full(len(cols), len(names)))
+            columns.append(cols)
+            values.append(np.broadcast_to(np.asarray(coefs, dtype=float), cols.shape))
+            lb.append(lower)
+            ub.append(upper)
+            names.append(name)
+
+        # TotalUnits - sum(units) == 0
+        coefs = np.full(n, -1.0)
+        coefs[total] = 1.0
+        add_row(np.arange(n), coefs, 0.0, 0.0, "TotalUnitsConstraint")
+
+        add_row(np.arange(total), self.derived_inputs.sq_ft, -np.inf, net_residential_area, "Land_Size_Constraint")
+        add_row(np.arange(total), self.derived_inputs.sq_ft, optimizer.LAND_UTILIZATION_MIN * net_residential_area, np.inf,
+                "Land_Utilization_Constraint")
+
+        for unit, unit_name in zip(units, self.unit_names):
+            unit_cols = [index[unit_name]] + self.affordable[unit_name]
+            ones = [1.0] * len(unit_cols)
+            add_row(unit_cols + [total], ones + [-0.01 * unit['min_units']], 0.0, np.inf, f"Min_Units_Constraint_{unit_name}")
+            add_row(unit_cols + [total], ones + [-0.01 * unit['max_units']], -np.inf, 0.0, f"Max_Units_Constraint_{unit_name}")
+            add_row(unit_cols, [-aff_housing_percent] + [1.0 - aff_housing_percent] * (len(unit_cols) - 1), 0.0, np.inf,
+                    f"Affordable_{unit_name}")
+
+        for name, min_share, levels in optimizer.tier_share_rows(ami_tiers):
+            counted = [tier for tier in ami_tiers if tier['ami_percentage'] in levels]
+            cols = [index[unit_type] for unit_name in self.unit_names
+                    for unit_type in optimizer.affordable_unit_types(unit_name, counted)]
+            add_row(cols + [total], [1.0] * len(cols) + [-0.01 * min_share], 0.0, np.inf, name)
+
+        if ami_tiers and income_average is not None:
+            # Sum of (tier AMI % - cap) over affordable units <= 0; tiers at the cap drop out
+            offsets = [tier['ami_percentage'] - income_average for tier in ami_tiers]
+            cols, coefs = [], []
+            for unit_name in self.unit_names:
+                for offset, j in zip(offsets, self.affordable[unit_name]):
+                    if offset:
+                        cols.append(j)
+                        coefs.append(offset)
+            if cols:
+                add_row(cols, coefs, -np.inf, 0.0, "Income_Averaging_Constraint")
+
+        self.A = sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                                   shape=(len(names), n))
+        self.A.sort_indices()
+        self.lb = np.array(lb)
+        self.ub = np.array(ub)
+        self.row_names = names
+        self.row_index = {name: i for i, name in enumerate(names)}
+
+    def _slot(self, row, column):
+        # Position of a stored coefficient of A in A.data
+        start, end = self.A.indptr[row], self.A.indptr[row + 1]
+        return start + np.searchsorted(self.A.indices[start:end], column)
+
+    def is_feasible(self, quantities, tolerance=FEASIBILITY_TOLERANCE):
+        # Whether a mix {unit_type: units} satisfies every row, e.g. after the
+        # parameters it was solved for have been edited
+        x = np.append(self.derived_inputs.quantity_vector(quantities), sum(quantities.values()))
+        return self._feasible(x, tolerance)
+
+    def _feasible(self, x, tolerance=FEASIBILITY_TOLERANCE):
+        activity = self.A @ x
+        slack = tolerance * np.maximum(1.0, np.abs(activity))
+        return bool(np.all(x >= -tolerance) and np.all(activity >= self.lb - slack) and np.all(activity <= self.ub + slack))
+
+    def column_names(self, relaxed):
+        prefix = "sa_" if relaxed else ""
+        return [f"{prefix}units_{unit_type}" for unit_type in self.unit_types] + [f"{prefix}TotalUnits"]
+
+    def set_net_residential_area(self, net_residential_area):
+        self.lp_solution = None
+        self.net_residential_area = net_residential_area
+        self.ub[self.row_index["Land_Size_Constraint"]] = net_residential_area
+        self.lb[self.row_index["Land_Utilization_Constraint"]] = optimizer.LAND_UTILIZATION_MIN * net_residential_area
+
+    def set_set_aside_percentage(self, set_aside_percentage):
+        self.lp_solution = None
+        aff_housing_percent = set_aside_percentage * 0.01
+        for unit_name in self.unit_names:
+            row = self.row_index[f"Affordable_{unit_name}"]
+            self.A.data[self._slot(row, self.index[unit_name])] = -aff_housing_percent
+            for j in self.affordable[unit_name]:
+                self.A.data[self._slot(row, j)] = 1.0 - aff_housing_percent
+
+    def set_mix_limits(self, unit_name, min_units, max_units):
+        self.lp_solution = None
+        total = len(self.c) - 1
+        self.A.data[self._slot(self.row_index[f"Min_Units_Constraint_{unit_name}"], total)] = -0.01 * min_units
+        self.A.data[self._slot(self.row_index[f"Max_Units_Constraint_{unit_name}"], total)] = -0.01 * max_units
+
+    def set_rent(self, unit_type, rent):
+        self.lp_solution = None
+        j = self.index[unit_type]
+        self.derived_inputs.rent[j] = rent
+        self.c[j] = (rent - self.derived_inputs.max_cost[j]) * 12
+
+    def set_objective_bonus(self, bonus=None):
+        # Add `bonus` (annual $, one value per unit type) to each unit type's profit
+        # in the objective, e.g. prices from a portfolio master problem; None removes it
+        self.lp_solution = None
+        n = len(self.unit_types)
+        self.c[:n] = (self.derived_inputs.rent - self.derived_inputs.max_cost) * 12
+        if bonus is not None:
+            self.c[:n] += bonus
+
+    def solve_milp(self, time_limit=None, objective_cap=None, mip_gap=None, disp=False, objective_floor=None):
+        # `objective_cap` adds c @ x <= cap, used to step down to the next best mix, and
+        # `objective_floor` c @ x >= floor, which prunes like an incumbent of that value;
+        # `mip_gap` is the relative gap (0.01 = 1%) at which the search stops
+        options = {'presolve': len(self.c) >= PRESOLVE_MIN_COLUMNS, 'disp': disp}
+        if time_limit:
+            options['time_limit'] = time_limit
+        if mip_gap is not None:
+            options['mip_rel_gap'] = mip_gap
+        constraints = [LinearConstraint(self.A, self.lb, self.ub)]
+        if objective_cap is not None or objective_floor is not None:
+            constraints.append(LinearConstraint(self.c[np.newaxis, :],
+                                                -np.inf if objective_floor is None else objective_floor,
+                                                np.inf if objective_cap is None else objective_cap))
+        res = milp(-self.c, constraints=constraints,
+                   integrality=np.ones(len(self.c)), bounds=Bounds(0, np.inf), options=options)
+        status = MILP_STATUS.get(res.status, 'Undefined')
+        x = np.round(res.x) if res.x is not None else None
+        self.statistics = {'nodes': res.get('mip_node_count'), 'gap': _percent(res.get('mip_gap')),
+                           'bound': _negated(res.get('mip_dual_bound'))}
+        return status, x, None
+
+    def solve_lp(self, disp=False):
+        # linprog wants A_ub x <= b_ub and A_eq x == b_eq, so split and flip the rows
+        eq = self.lb == self.ub
+        upper = ~eq & np.isfinite(self.ub)
+        lower = ~eq & np.isfinite(self.lb)
+        A_ub = sparse.vstack([self.A[upper], -self.A[lower]], format='csr')
+        b_ub = np.concatenate([self.ub[upper], -self.lb[lower]])
+        res = linprog(-self.c, A_ub=A_ub, b_ub=b_ub, A_eq=self.A[eq], b_eq=self.lb[eq],
+                      bounds=(0, None), method='highs', options={'disp': disp})
+        status = LINPROG_STATUS.get(res.status, 'Undefined')
+        self.statistics = {'iterations': res.get('nit')}
+        if status != 'Optimal':
+            return status, None, None
+
+        # Shadow prices as d(max objective)/d(rhs) for each original row
+        pi = np.zeros(len(self.row_names))
+        pi[eq] = -res.eqlin.marginals
+        ub_marginals = res.ineqlin.marginals
+        n_upper = int(upper.sum())
+        pi[upper] = -ub_marginals[:n_upper]
+        pi[lower] += ub_marginals[n_upper:]
+        return status, res.x, pi
+
+    def solve(self, relaxed=False, solver=None, warm_start=None, time_limit=None, mip_gap=None, disp=False):
+        # `solver` is accepted for parity with optimizer.UnitMixModel. SciPy's HiGHS
+        # interface takes no MIP start, so a feasible `warm_start` mix becomes an
+        # objective floor just under its profit, and is returned if nothing better
+        # is found; an infeasible one is ignored
+        diagnostics = new_diagnostics()
+        floor = None
+        if warm_start and not relaxed:
+            start = np.append(self.derived_inputs.quantity_vector(warm_start), sum(warm_start.values()))
+            if self._feasible(start):
+                floor = self.c @ start - WARM_START_SLACK * max(1.0, abs(self.c @ start))
+        with timed(diagnostics, 'solve'):
+            if relaxed:
+                status, x, pi = self.solve_lp(disp=disp)
+            else:
+                status, x, pi = self.solve_milp(time_limit=time_limit, mip_gap=mip_gap, disp=disp, objective_floor=floor)
+        if floor is not None and x is None:
+            # Nothing above the floor of a feasible start: it is optimal, or the best found in time
+            status = 'Optimal' if status == 'Infeasible' else 'Not Solved'
+            x = start
+        elif floor is not None and self.c @ x < self.c @ start:
+            x = start
+        self.lp_solution = (x, pi) if relaxed and status == 'Optimal' else None
+        diagnostics['solver'] = {name: value for name, value in self.statistics.items() if value is not None}
+        diagnostics['solver']['status'] = status
+
+        # A search stopped on the time limit still reports its best mix, as 'Not Solved'
+        result = {'status': status, 'diagnostics': diagnostics}
+        if x is None or status not in ('Optimal', 'Not Solved'):
+            return result
+
+        with timed(diagnostics, 'extract'):
+            quantities = {unit_type: float(x[j]) for j, unit_type in enumerate(self.unit_types)}
+            result.update(optimizer.extract_results(self.derived_inputs, quantities, self.net_residential_area))
+            if relaxed:
+                dj = self.c - self.A.T @ pi
+                result['shadow_prices'] = dict(zip(self.row_names, pi.tolist()))
+                result['reduced_costs'] = dict(zip(self.column_names(relaxed), dj.tolist()))
+        diagnostics['solver']['objective'] = float(self.c @ x)
+        return result
@@ -0,0 +1,173 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+
+import batch
+import optimizer
+
+# Cost rules a scenario can draw, as named in the derived inputs
+COST_RULES = ('Sq. Ft. Rule', '50% Rule', 'Max')
+
+# With no spec the inputs are fixed and the cost rule is a coin flip between
+# the two rules the results window reports, so P5/P95 bracket those figures
+DEFAULT_SPEC = {
+    'rent': 1.0,
+    'ami': 1.0,
+    'vacancy': optimizer.VACANCY_FACTOR,
+    'cost_rule': {'Max': 0.5, 'Sq. Ft. Rule': 0.5},
+}
+
+BATCH_SIZE = 200000
+PERCENTILES = (5, 50, 95)
+
+
+def draw(rng, spec, size):
+    """Sample `size` values from a distribution spec.
+
+    A spec is a plain number (constant) or a dict with 'dist' set to
+    'normal' (mean, sd), 'lognormal' (mean, sigma of the log), 'uniform'
+    (low, high) or 'triangular' (low, mode, high).
+    """
+    if isinstance(spec, (int, float)):
+        return np.full(size, float(spec))
+    dist = spec['dist']
+    if dist == 'normal':
+        return rng.normal(spec['mean'], spec['sd'], size)
+    if dist == 'lognormal':
+        return rng.lognormal(np.log(spec['mean']), spec['sigma'], size)
+    if dist == 'uniform':
+        return rng.uniform(spec['low'], spec['high'], size)
+    if dist == 'triangular':
+        return rng.triangular(spec['low'], spec['mode'], spec['high'], size)
+    raise ValueError(f"unknown distribution: {dist}")
+
+
+def top_mixes(model, k, step=1.0):
+    """The k best distinct unit mixes of `model` by worst case profit.
+
+    Each solve caps the objective `step` dollars below the previous optimum,
+    so mixes with tied objectives count once.
+    """
+    mixes = []
+    cap = None
+    for _ in range(k):
+        status, x, _ = model.solve_milp(objective_cap=cap)
+        if status != 'Optimal':
+            break
+        mixes.append({unit_type: float(x[j]) for j, unit_type in enumerate(model.unit_types)})
+        cap = float(model.c @ x) - step
+    return mixes
+
+
+def simulate(units, ami_incomes, ami_percentage, mixes, spec=None, scenarios=1000000, seed=None, batch_size=BATCH_SIZE,
+             ami_tiers=None):
+    """Annual profit distribution of each mix in `mixes` over sampled scenarios.
+
+    Per scenario, each unit type's market rent is scaled by a 'rent' draw,
+    the AMI incomes by one 'ami' draw, profit is multiplied by a 'vacancy'
+    draw and one cost rule is picked with the 'cost_rule' probabilities.
+    Every mix sees the same scenarios. With `ami_tiers` the mixes hold one
+    affordable quantity per tier and `ami_percentage` is not used. Returns
+    one dict per mix with P5/P50/P95, the mean and the probability of a loss.
+    """
+    spec = dict(DEFAULT_SPEC, **(spec or {}))
+    rng = np.random.default_rng(seed)
+
+    names = [optimizer.unit_key(unit['name']) for unit in units]
+    sq_ft_rule = np.array([unit['sqft'] for unit in units], dtype=float) / 12
+    base_rent = np.array([unit['rent'] for unit in units], dtype=float)
+    people = np.array([unit['people'] for unit in units], dtype=int)
+    # Each AMI level's incomes as a multiple of `ami_income`
+    if ami_tiers:
+        optimizer.check_ami_tiers(ami_tiers)
+        ami_income = optimizer.household_incomes(optimizer.ami_limits(ami_incomes, 100), people)
+        levels = [tier['ami_percentage'] * 0.01 for tier in ami_tiers]
+    else:
+        ami_income = optimizer.household_incomes(optimizer.ami_limits(ami_incomes, ami_percentage), people)
+        levels = [1.0]
+
+    market = np.array([[mix[name] for name in names] for mix in mixes])
+    # mixes x units x AMI levels
+    affordable = np.array([[[mix[unit_type] for unit_type in optimizer.affordable_unit_types(name, ami_tiers)]
+                            for name in names] for mix in mixes])
+    total = market + affordable.sum(axis=2)
+
+    rule_probabilities = np.array([spec['cost_rule'].get(rule, 0.0) for rule in COST_RULES], dtype=float)
+    rule_probabilities /= rule_probabilities.sum()
+
+    profits = np.empty((scenarios, len(mixes)))
+    for start in range(0, scenarios, batch_size):
+        size = min(batch_size, scenarios - start)
+        rent = base_rent * draw(rng, spec['rent'], (size, len(units)))
+        ami_draw = draw(rng, spec['ami'], (size, 1))
+        aff_revenue = sum(optimizer.affordable_rents(ami_income * level * ami_draw) @ affordable[:, :, k].T
+                          for k, level in enumerate(levels))
+        rule_50 = rent * 0.5
+        costs = np.stack([np.broadcast_to(sq_ft_rule, rent.shape), rule_50, np.maximum(sq_ft_rule, rule_50)])
+        rule = rng.choice(len(COST_RULES), size=size, p=rule_probabilities)
+        cost = costs[rule, np.arange(size)]
+        vacancy = draw(rng, spec['vacancy'], (size, 1))
+        profits[start:start + size] = (rent @ market.T + aff_revenue - cost @ total.T) * 12 * vacancy
+
+    percentiles = np.percentile(profits, PERCENTILES, axis=0)
+    results = []
+    for i, mix in enumerate(mixes):
+        result = {'mix': mix, 'mean': float(profits[:, i].mean()), 'probability_of_loss': float((profits[:, i] < 0).mean())}
+        for p, values in zip(PERCENTILES, percentiles):
+            result[f"p{p}"] = float(values[i])
+        results.append(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo profit risk of a parcel's best unit mixes.")
+    parser.add_argument('parcels', help="CSV or JSON parcel file, as read by batch.py")
+    parser.add_argument('--parcel', default=None, help="name of the parcel (default: the first)")
+    parser.add_argument('--spec', default=None, help="JSON file of rent, ami, vacancy and cost_rule distributions")
+    parser.add_argument('--mix', default=None, help="JSON file with a unit mix to evaluate instead of solving")
+    parser.add_argument('--top-k', type=int, default=1, help="number of best mixes to evaluate (default: 1)")
+    parser.add_argument('--scenarios', type=int, default=1000000, help="number of scenarios (default: 1000000)")
+    parser.add_argument('--seed', type=int, default=None, help="random seed")
+    args = parser.parse_args(argv)
+
+    try:
+        parcels = batch.load_parcels(args.parcels)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.parcel is not None:
+        parcels = [parcel for parcel in parcels if parcel['name'] == args.parcel]
+        if not parcels:
+            parser.error(f"no parcel named {args.parcel!r}")
+    parcel = parcels[0]
+
+    spec = None
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+    if args.mix:
+        with open(args.mix) as f:
+            mixes = [json.load(f)]
+    else:
+        import matrix_solver
+        try:
+            derived_inputs = optimizer.parcel_derived_inputs(parcel)
+        except ValueError as e:
+            parser.error(str(e))
+        model = matrix_solver.MatrixModel(derived_inputs, parcel['units'], parcel['net_residential_area'],
+                                          parcel['set_aside_percentage'], ami_tiers=parcel.get('ami_tiers'),
+                                          income_average=parcel.get('income_average'))
+        mixes = top_mixes(model, args.top_k)
+        if not mixes:
+            print("No feasible unit mix", file=sys.stderr)
+            return 1
+
+    for result in simulate(parcel['units'], parcel['ami_incomes'], parcel.get('ami_percentage'), mixes,
+                           spec=spec, scenarios=args.scenarios, seed=args.seed, ami_tiers=parcel.get('ami_tiers')):
+        print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,508 @@
+import importlib.util
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from pulp import (LpProblem, LpVariable, LpAffineExpression, LpConstraint, LpConstraintEQ, LpConstraintGE,
+                  LpConstraintLE, LpMaximize, LpStatus, LpSolutionIntegerFeasible, COIN_CMD)
+
+from diagnostics import new_diagnostics, timed, apply_solver_log
+
+# The in-process HiGHS backend needs SciPy; CBC is used without it. SciPy is
+# slow to import, so matrix_solver is only loaded when a HiGHS model is built
+HAS_SCIPY = importlib.util.find_spec('scipy') is not None
+
+# Constants shared by the GUI and the headless entry points
+RENT_REDUCTION = 100
+RENT_PERCENTAGE = 0.30
+VACANCY_FACTOR = 0.95524
+LAND_UTILIZATION_MIN = 0.9
+
+BACKENDS = ('highs', 'cbc')
+DEFAULT_BACKEND = 'highs' if HAS_SCIPY else 'cbc'
+
+# Determine if we're running in a bundle or a normal Python environment
+is_bundle = getattr(sys, 'frozen', False)
+
+# Set the path to the CBC binary accordingly
+if is_bundle:
+    cbc_path = os.path.join(sys._MEIPASS, 'cbc')
+else:
+    cbc_path = '/opt/homebrew/bin/cbc'  # Default path for development
+
+# Where else to look for CBC when cbc_path has none
+CBC_SEARCH_PATH = ('/opt/homebrew/bin/cbc', '/usr/local/bin/cbc', '/usr/bin/cbc')
+
+_found_cbc = None
+
+
+def _cbc_works(path):
+    if not (os.path.isfile(path) and os.access(path, os.X_OK)):
+        return False
+    try:
+        return subprocess.run([path, '-quit'], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL, timeout=10).returncode == 0
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+
+def _pulp_cbc():
+    # The CBC binary that ships inside the PuLP package, if this install has one
+    try:
+        from pulp import PULP_CBC_CMD
+        return PULP_CBC_CMD().path
+    except Exception:
+        return None
+
+
+def find_cbc():
+    """Path of a working CBC binary, found and checked on first use.
+
+    Tries $WALNUT_CBC, cbc_path, the PATH, CBC_SEARCH_PATH and then PuLP's
+    own CBC, keeping the first that starts and exits cleanly. With none,
+    cbc_path is returned and the solve fails with PuLP's usual error.
+    """
+    global _found_cbc
+    if _found_cbc is None:
+        candidates = [os.environ.get('WALNUT_CBC'), cbc_path, shutil.which('cbc'), *CBC_SEARCH_PATH, _pulp_cbc()]
+        _found_cbc = next((path for path in candidates if path and _cbc_works(path)), cbc_path)
+    return _found_cbc
+
+
+def make_solver(path=None, msg=True, warm_start=False, time_limit=None, mip_gap=None):
+    # Use the CBC binary path for PuLP; `mip_gap` is relative (0.01 = 1%)
+    return COIN_CMD(path=path or find_cbc(), msg=msg, warmStart=warm_start, timeLimit=time_limit or None,
+                    gapRel=mip_gap)
+
+
+def unit_key(name):
+    # Unit names are used in variable and constraint names, so no spaces
+    return name.strip().replace(' ', '_')
+
+
+def affordable_unit_types(unit_name, ami_tiers=None):
+    # Affordable variants of a unit: Aff_{name} at the single AMI level, or one
+    # Aff{AMI %}_{name} per tier, e.g. Aff30_1BR and Aff60_1BR
+    if not ami_tiers:
+        return [f"Aff_{unit_name}"]
+    return [f"Aff{tier['ami_percentage']:g}_{unit_name}" for tier in ami_tiers]
+
+
+def check_ami_tiers(ami_tiers):
+    # The AMI % names each tier's variables and rows, so it must be given and distinct
+    levels = set()
+    for tier in ami_tiers:
+        if tier.get('ami_percentage') is None:
+            raise ValueError("Every AMI tier needs an 'ami_percentage'")
+        level = f"{tier['ami_percentage']:g}"
+        if level in levels:
+            raise ValueError(f"AMI tiers repeat {level}% AMI; each tier needs its own AMI %")
+        levels.add(level)
+
+
+def is_affordable(unit_type):
+    return re.match(r"Aff(\d+(\.\d+)?)?_", unit_type) is not None
+
+
+def ami_limits(ami_incomes, ami_percentage):
+    # Scale the 100% AMI income table down to the affordable AMI level
+    return {int(size): income * ami_percentage * 0.01 for size, income in ami_incomes.items()}
+
+
+def affordable_rent(ami_income):
+    # Monthly rent capped at 30% of the AMI-limited income, less the utility allowance
+    return max(0, (ami_income * RENT_PERCENTAGE / 12) - RENT_REDUCTION)
+
+
+class DerivedInputs:
+    """Column-oriented derived inputs.
+
+    Each unit type contributes a market entry followed by its affordable
+    entries: Aff_ at a single AMI level, or one per AMI tier.
+    The columns are NumPy arrays; iterating yields the record dicts
+    ('Unit Type', 'Sq. Ft.', 'Avg. Rent', ...) the GUI and PuLP model read.
+    """
+
+    # Record key for each column
+    COLUMNS = (
+        ('sq_ft', 'Sq. Ft.'),
+        ('rent', 'Avg. Rent'),
+        ('sq_ft_rule', 'Sq. Ft. Rule'),
+        ('rule_50', '50% Rule'),
+        ('max_cost', 'Max'),
+        ('min_salary', 'MinAnnualSalary'),
+    )
+
+    def __init__(self, unit_types, sq_ft, rent, sq_ft_rule, rule_50, max_cost, min_salary):
+        self.unit_types = list(unit_types)
+        self.sq_ft = np.asarray(sq_ft, dtype=float)
+        self.rent = np.asarray(rent, dtype=float)
+        self.sq_ft_rule = np.asarray(sq_ft_rule, dtype=float)
+        self.rule_50 = np.asarray(rule_50, dtype=float)
+        self.max_cost = np.asarray(max_cost, dtype=float)
+        self.min_salary = np.asarray(min_salary, dtype=float)
+        self.positions = {unit_type: j for j, unit_type in enumerate(self.unit_types)}
+
+    @classmethod
+    def from_units(cls, units, ami_values):
+        names = [unit_key(unit['name']) for unit in units]
+        sq_ft = np.array([unit['sqft'] for unit in units], dtype=float)
+        rent = np.array([unit['rent'] for unit in units], dtype=float)
+        people = np.array([unit['people'] for unit in units], dtype=int)
+        ami_income = household_incomes(ami_values, people)
+        return cls.from_arrays(names, sq_ft, rent, affordable_rents(ami_income))
+
+    @classmethod
+    def from_arrays(cls, names, sq_ft, rent, aff_rent, ami_tiers=None):
+        # Market and affordable entries share square footage and cost rules, interleaved per
+        # unit; with `ami_tiers`, `aff_rent` holds one array of rent caps per tier
+        aff_rents = list(aff_rent) if ami_tiers else [aff_rent]
+        k = 1 + len(aff_rents)
+        sq_ft_rule = sq_ft / 12
+        rule_50 = rent * 0.5
+        max_cost = np.maximum(sq_ft_rule, rule_50)
+        unit_types = [unit_type for name in names for unit_type in (name, *affordable_unit_types(name, ami_tiers))]
+        return cls(
+            unit_types,
+            np.repeat(sq_ft, k),
+            np.column_stack([rent, *aff_rents]).ravel(),
+            np.repeat(sq_ft_rule, k),
+            np.repeat(rule_50, k),  # Use same rule_50 as market for consistency
+            np.repeat(max_cost, k),  # Use same max_cost as market for consistency
+            np.repeat(rent * 12 * 3, k),
+        )
+
+    @classmethod
+    def from_records(cls, records):
+        if isinstance(records, cls):
+            return records.copy()
+        records = list(records)
+        columns = {attr: [di[key] for di in records] for attr, key in cls.COLUMNS}
+        return cls([di['Unit Type'] for di in records], **columns)
+
+    def copy(self):
+        return DerivedInputs(self.unit_types, *(getattr(self, attr).copy() for attr, _ in self.COLUMNS))
+
+    def __len__(self):
+        return len(self.unit_types)
+
+    def __iter__(self):
+        columns = [(key, getattr(self, attr).tolist()) for attr, key in self.COLUMNS]
+        for j, unit_type in enumerate(self.unit_types):
+            record = {'Unit Type': unit_type}
+            for key, values in columns:
+                record[key] = values[j]
+            yield record
+
+    def quantity_vector(self, quantities):
+        return np.array([quantities[unit_type] for unit_type in self.unit_types], dtype=float)
+
+
+def household_incomes(ami_values, people):
+    # Vectorized ami_values.get(people, 0) over an array of household sizes
+    lookup = np.zeros(max(max(map(int, ami_values), default=0), int(people.max(initial=0))) + 1)
+    for size, income in ami_values.items():
+        lookup[int(size)] = income
+    return lookup[people]
+
+
+def affordable_rents(ami_income):
+    # Array form of affordable_rent
+    return np.maximum(0, (np.asarray(ami_income, dtype=float) * RENT_PERCENTAGE / 12) - RENT_REDUCTION)
+
+
+def calculate_derived_inputs(units, ami_values):
+    """Return the market and affordable derived inputs for each unit type.
+
+    `units` is a list of dicts with 'name', 'sqft', 'rent' and 'people';
+    `ami_values` maps household size to the AMI-limited annual income.
+    """
+    return DerivedInputs.from_units(units, ami_values)
+
+
+def calculate_tiered_inputs(units, ami_incomes, ami_tiers):
+    """Derived inputs with one affordable entry per AMI tier.
+
+    `ami_incomes` is the 100% AMI income by household size and `ami_tiers`
+    a list of dicts with 'ami_percentage' (the tier's rent cap level) and
+    optionally 'min_share', the % of all units that must be at or below it.
+    """
+    check_ami_tiers(ami_tiers)
+    names = [unit_key(unit['name']) for unit in units]
+    sq_ft = np.array([unit['sqft'] for unit in units], dtype=float)
+    rent = np.array([unit['rent'] for unit in units], dtype=float)
+    people = np.array([unit['people'] for unit in units], dtype=int)
+    ami_income = household_incomes(ami_limits(ami_incomes, 100), people)
+    aff_rents = [affordable_rents(ami_income * tier['ami_percentage'] * 0.01) for tier in ami_tiers]
+    return DerivedInputs.from_arrays(names, sq_ft, rent, aff_rents, ami_tiers)
+
+
+def parcel_derived_inputs(parcel):
+    # Derived inputs of a plain-data parcel, tiered when it has 'ami_tiers'
+    if parcel.get('ami_tiers'):
+        return calculate_tiered_inputs(parcel['units'], parcel['ami_incomes'], parcel['ami_tiers'])
+    return calculate_derived_inputs(parcel['units'], ami_limits(parcel['ami_incomes'], parcel['ami_percentage']))
+
+
+def tier_share_rows(ami_tiers):
+    """(name, min share %, AMI % levels counted) of each tier with a minimum share.
+
+    A tier's share counts the units at its AMI level or below, so a 10% share
+    at 30% AMI and a 40% share at 60% AMI can both be met by 30% AMI units.
+    """
+    rows = []
+    for tier in ami_tiers or ():
+        if tier.get('min_share'):
+            levels = {other['ami_percentage'] for other in ami_tiers if other['ami_percentage'] <= tier['ami_percentage']}
+            rows.append((f"Tier_Share_Constraint_{tier['ami_percentage']:g}", tier['min_share'], levels))
+    return rows
+
+
+def _coefficients(constraint):
+    # PuLP 3 keeps the linear expression on .expr, older releases subclass it
+    return getattr(constraint, 'expr', constraint)
+
+
+class UnitMixModel:
+    """PuLP unit mix model built once from the derived inputs.
+
+    The expression tree is generated a single time. Switching between the
+    ILP and its LP relaxation and changing the land area, set-aside %, mix
+    limits or rents all edit the existing rows in place, so a re-solve only
+    pays for the solver itself.
+
+    With `ami_tiers` (see calculate_tiered_inputs) each unit has one
+    affordable variable per tier, the tiers' minimum shares become rows of
+    their own and `income_average` caps the average AMI % of the affordable
+    units. Rows are built from their nonzero terms only, so the model grows
+    with units x tiers.
+    """
+
+    def __init__(self, derived_inputs, units, net_residential_area, set_aside_percentage, ami_tiers=None,
+                 income_average=None):
+        self.derived_inputs = DerivedInputs.from_records(derived_inputs)
+        self.unit_types = self.derived_inputs.unit_types
+        self.unit_names = [unit_key(unit['name']) for unit in units]
+        self.affordable = {unit_name: affordable_unit_types(unit_name, ami_tiers) for unit_name in self.unit_names}
+        self.ami_tiers = ami_tiers
+        self.income_average = income_average
+        self.net_residential_area = net_residential_area
+
+        self.problem = LpProblem("Optimal_Unit_Mix", LpMaximize)
+
+        # Create decision variables
+        self.unit_vars = {unit_type: LpVariable(f"units_{unit_type}", lowBound=0, cat='Integer') for unit_type in self.unit_types}
+        self.total_units_var = LpVariable("TotalUnits", lowBound=0, cat='Integer')
+
+        # Objective: annual revenue less worst case costs
+        variables = [self.unit_vars[unit_type] for unit_type in self.unit_types]
+        profit = ((self.derived_inputs.rent - self.derived_inputs.max_cost) * 12).tolist()
+        self.problem += LpAffineExpression(list(zip(variables, profit))), "Total_Annual_Profit_Worst_Case"
+
+        # Define constraints, each from its own terms; the land used expression is shared by both land rows
+        def add_row(terms, sense, rhs, name):
+            self.problem += LpConstraint(LpAffineExpression(terms), sense, name, rhs)
+
+        total = self.total_units_var
+        land_used = LpAffineExpression(list(zip(variables, self.derived_inputs.sq_ft.tolist())))
+        add_row([(total, 1)] + [(var, -1) for var in variables], LpConstraintEQ, 0, "TotalUnitsConstraint")
+        self.problem += land_used <= net_residential_area, "Land_Size_Constraint"
+        self.problem += land_used >= LAND_UTILIZATION_MIN * net_residential_area, "Land_Utilization_Constraint"
+        for unit, unit_name in zip(units, self.unit_names):
+            unit_vars = [self.unit_vars[unit_name]] + [self.unit_vars[unit_type] for unit_type in self.affordable[unit_name]]
+            add_row([(var, 1) for var in unit_vars] + [(total, -0.01 * unit['min_units'])], LpConstraintGE, 0,
+                    f"Min_Units_Constraint_{unit_name}")
+            add_row([(var, 1) for var in unit_vars] + [(total, -0.01 * unit['max_units'])], LpConstraintLE, 0,
+                    f"Max_Units_Constraint_{unit_name}")
+            add_row([(var, 0) for var in unit_vars], LpConstraintGE, 0, f"Affordable_{unit_name}")
+        for name, min_share, levels in tier_share_rows(ami_tiers):
+            counted = [tier for tier in ami_tiers if tier['ami_percentage'] in levels]
+            terms = [(self.unit_vars[unit_type], 1) for unit_name in self.unit_names
+                     for unit_type in affordable_unit_types(unit_name, counted)]
+            add_row(terms + [(total, -0.01 * min_share)], LpConstraintGE, 0, name)
+        if ami_tiers and income_average is not None:
+            # Sum of (tier AMI % - cap) over affordable units <= 0; tiers at the cap drop out
+            terms = [(self.unit_vars[unit_type], tier['ami_percentage'] - income_average)
+                     for unit_name in self.unit_names
+                     for tier, unit_type in zip(ami_tiers, self.affordable[unit_name])
+                     if tier['ami_percentage'] != income_average]
+            if terms:
+                add_row(terms, LpConstraintLE, 0, "Income_Averaging_Constraint")
+        # Coefficients that are zero at build time are dropped by PuLP, so set them explicitly
+        self.set_set_aside_percentage(set_aside_percentage)
+
+        # Time the MPS file PuLP writes for CBC separately from the solve
+        self.diagnostics = new_diagnostics()
+        write_mps = self.problem.writeMPS
+
+        def timed_write_mps(*args, **kwargs):
+            with timed(self.diagnostics, 'mps_write'):
+                return write_mps(*args, **kwargs)
+
+        self.problem.writeMPS = timed_write_mps
+
+    def column_names(self, relaxed):
+        prefix = "sa_" if relaxed else ""
+        return [f"{prefix}units_{unit_type}" for unit_type in self.unit_types] + [f"{prefix}TotalUnits"]
+
+    def set_relaxed(self, relaxed):
+        cat = 'Continuous' if relaxed else 'Integer'
+        for var in list(self.unit_vars.values()) + [self.total_units_var]:
+            var.cat = cat
+
+    def set_net_residential_area(self, net_residential_area):
+        self.net_residential_area = net_residential_area
+        self.problem.constraints["Land_Size_Constraint"].changeRHS(net_residential_area)
+        self.problem.constraints["Land_Utilization_Constraint"].changeRHS(LAND_UTILIZATION_MIN * net_residential_area)
+
+    def set_set_aside_percentage(self, set_aside_percentage):
+        aff_housing_percent = set_aside_percentage * 0.01
+        for unit_name in self.unit_names:
+            row = _coefficients(self.problem.constraints[f"Affordable_{unit_name}"])
+            row[self.unit_vars[unit_name]] = -aff_housing_percent
+            for unit_type in self.affordable[unit_name]:
+                row[self.unit_vars[unit_type]] = 1 - aff_housing_percent
+
+    def set_mix_limits(self, unit_name, min_units, max_units):
+        _coefficients(self.problem.constraints[f"Min_Units_Constraint_{unit_name}"])[self.total_units_var] = -0.01 * min_units
+        _coefficients(self.problem.constraints[f"Max_Units_Constraint_{unit_name}"])[self.total_units_var] = -0.01 * max_units
+
+    def set_rent(self, unit_type, rent):
+        j = self.derived_inputs.positions[unit_type]
+        self.derived_inputs.rent[j] = rent
+        self.problem.objective[self.unit_vars[unit_type]] = (rent - self.derived_inputs.max_cost[j]) * 12
+
+    def set_objective_bonus(self, bonus=None):
+        # Add `bonus` (annual $, one value per unit type) to each unit type's profit
+        # in the objective, e.g. prices from a portfolio master problem; None removes it
+        profit = (self.derived_inputs.rent - self.derived_inputs.max_cost) * 12
+        if bonus is not None:
+            profit = profit + bonus
+        for unit_type, value in zip(self.unit_types, profit.tolist()):
+            self.problem.objective[self.unit_vars[unit_type]] = value
+
+    def solve(self, relaxed=False, solver=None, warm_start=None):
+        # `warm_start` maps unit types to a known feasible mix; CBC uses it
+        # as the initial incumbent when the solver was made with warm_start=True
+        self.set_relaxed(relaxed)
+        if warm_start:
+            for unit_type, var in self.unit_vars.items():
+                var.setInitialValue(warm_start[unit_type])
+            self.total_units_var.setInitialValue(sum(warm_start.values()))
+        solver = solver or make_solver()
+
+        # A quiet CBC logs to a scratch file instead, so its statistics can be read back
+        log_path = None
+        if not solver.msg and not solver.optionsDict.get('logPath'):
+            fd, log_path = tempfile.mkstemp(prefix='walnut-cbc-', suffix='.log')
+            os.close(fd)
+            solver.optionsDict['logPath'] = log_path
+        self.diagnostics = diagnostics = new_diagnostics()
+        try:
+            with timed(diagnostics, 'solve'):
+                self.problem.solve(solver)
+        finally:
+            if log_path is not None:
+                del solver.optionsDict['logPath']
+        diagnostics['phases']['solve'] -= diagnostics['phases'].get('mps_write', 0.0)
+        if log_path is not None:
+            with open(log_path) as log:
+                apply_solver_log(diagnostics, log.read())
+            os.remove(log_path)
+
+        status = LpStatus[self.problem.status]
+        # CBC stopped on its time limit with an incumbent: keep the mix, but not as 'Optimal'
+        if self.problem.sol_status == LpSolutionIntegerFeasible:
+            status = 'Not Solved'
+        diagnostics['solver']['status'] = status
+        result = {'status': status, 'diagnostics': diagnostics}
+        if self.problem.sol_status != LpSolutionIntegerFeasible and status != 'Optimal':
+            return result
+
+        with timed(diagnostics, 'extract'):
+            quantities = {unit_type: var.varValue or 0 for unit_type, var in self.unit_vars.items()}
+            result.update(extract_results(self.derived_inputs, quantities, self.net_residential_area))
+            if relaxed:
+                columns = list(self.unit_vars.values()) + [self.total_units_var]
+                result['shadow_prices'] = {name: constraint.pi for name, constraint in self.problem.constraints.items()}
+                result['reduced_costs'] = {name: var.dj for name, var in zip(self.column_names(relaxed), columns)}
+        diagnostics['solver']['objective'] = float(self.problem.objective.value())
+        return result
+
+
+def extract_results(derived_inputs, quantities, net_residential_area):
+    """Compute the reported metrics from the unit quantities of a solve."""
+    if not isinstance(derived_inputs, DerivedInputs):
+        derived_inputs = DerivedInputs.from_records(derived_inputs)
+    q = derived_inputs.quantity_vector(quantities)
+    revenue = derived_inputs.rent @ q * 12
+    worst_case_costs = derived_inputs.max_cost @ q * 12
+    best_case_costs = derived_inputs.sq_ft_rule @ q * 12
+
+    # Calculate land utilization rate and total units
+    total_land_used = derived_inputs.sq_ft @ q
+    land_utilization_rate = (total_land_used / net_residential_area) * 100 if net_residential_area else 0
+    total_units = q.sum()
+
+    return {
+        'quantities': quantities,
+        'annual_profit_worst_case': float((revenue - worst_case_costs) * VACANCY_FACTOR),
+        'annual_profit_best_case': float((revenue - best_case_costs) * VACANCY_FACTOR),
+        'land_utilization_rate': float(land_utilization_rate),
+        'total_units': float(total_units),
+    }
+
+
+def build_model(derived_inputs, units, net_residential_area, set_aside_percentage, backend=None, ami_tiers=None,
+                income_average=None):
+    """Build a reusable model on `backend`: 'highs' for the in-process matrix
+    solver or 'cbc' for PuLP. Defaults to 'highs' when SciPy is available.
+    """
+    backend = backend or DEFAULT_BACKEND
+    if ami_tiers:
+        check_ami_tiers(ami_tiers)
+    if backend == 'highs' and HAS_SCIPY:
+        import matrix_solver
+        return matrix_solver.MatrixModel(derived_inputs, units, net_residential_area, set_aside_percentage,
+                                         ami_tiers=ami_tiers, income_average=income_average)
+    return UnitMixModel(derived_inputs, units, net_residential_area, set_aside_percentage, ami_tiers=ami_tiers,
+                        income_average=income_average)
+
+
+def solve_problem(derived_inputs, units, net_residential_area, set_aside_percentage, solver=None, relaxed=False,
+                  backend=None, ami_tiers=None, income_average=None):
+    """Build and solve the model once, returning a plain dict of results."""
+    start = time.perf_counter()
+    model = build_model(derived_inputs, units, net_residential_area, set_aside_percentage, backend=backend,
+                        ami_tiers=ami_tiers, income_average=income_average)
+    build_seconds = time.perf_counter() - start
+    result = model.solve(relaxed=relaxed, solver=solver)
+    result['diagnostics']['phases']['build'] = build_seconds
+    return result
+
+
+def solve_parcel(parcel, solver=None, relaxed=False, backend=None):
+    """Solve one parcel described as plain data.
+
+    A parcel is a dict with 'net_residential_area', 'ami_incomes' (100% AMI
+    income by household size), 'ami_percentage', 'set_aside_percentage' and
+    'units', a list of dicts with 'name', 'sqft', 'rent', 'people',
+    'min_units' and 'max_units' (the last two in % of total units).
+
+    Instead of 'ami_percentage' a parcel may list 'ami_tiers' (see
+    calculate_tiered_inputs), optionally with 'income_average', the highest
+    average AMI % its affordable units may have.
+    """
+    start = time.perf_counter()
+    derived_inputs = parcel_derived_inputs(parcel)
+    derived_inputs_seconds = time.perf_counter() - start
+    result = solve_problem(derived_inputs, parcel['units'], parcel['net_residential_area'],
+                           parcel['set_aside_percentage'], solver=solver, relaxed=relaxed, backend=backend,
+                           ami_tiers=parcel.get('ami_tiers'), income_average=parcel.get('income_average'))
+    result['diagnostics']['phases']['derived_inputs'] = derived_inputs_seconds
+    result['min_annual_salary'] = dict(zip(derived_inputs.unit_types, derived_inputs.min_salary.tolist()))
+    return result
@@ -0,0 +1,345 @@
+import argparse
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.optimize import milp, linprog, LinearConstraint, Bounds
+
+import ami
+import batch
+import optimizer
+
+TOL = 1e-6
+MAX_ITERATIONS = 100
+
+# Multiples of the final target prices between which parcels' frontiers are traced,
+# widened in turn while the selected portfolio is short of the bound
+FRONTIER_RANGES = ((0.5, 2.0), (0.25, 4.0), (0.1, 10.0))
+
+# Per-process parcel models, built on first use and reused in every pricing round
+_worker_parcels = None
+_worker_targets = None
+_worker_backend = None
+_worker_solver = None
+_worker_models = {}
+
+
+def target_rows(derived_inputs, targets):
+    """Coefficients of the portfolio-wide targets for one parcel's unit types.
+
+    `targets` may hold 'set_aside_percentage' (affordable units as a % of
+    all units across the portfolio) and 'min_affordable_units'. Returns
+    (G, rhs): summed over all parcels, G @ quantities must be at least rhs.
+    """
+    affordable = np.array([optimizer.is_affordable(unit_type) for unit_type in derived_inputs.unit_types], dtype=float)
+    rows, rhs = [], []
+    if targets.get('set_aside_percentage') is not None:
+        # Affordable units less the set-aside share of all units, >= 0
+        rows.append(affordable - targets['set_aside_percentage'] * 0.01)
+        rhs.append(0.0)
+    if targets.get('min_affordable_units') is not None:
+        rows.append(affordable)
+        rhs.append(float(targets['min_affordable_units']))
+    return np.array(rows).reshape(len(rows), len(affordable)), np.array(rhs)
+
+
+def _init_worker(parcels, targets, backend, cbc):
+    global _worker_parcels, _worker_targets, _worker_backend, _worker_solver, _worker_models
+    # Models built for another portfolio (a thread pool, or a forked parent's) do not carry over
+    _worker_models = {}
+    _worker_parcels = parcels
+    _worker_targets = targets
+    _worker_backend = backend
+    _worker_solver = optimizer.make_solver(cbc, msg=False)
+
+
+def _parcel_model(i):
+    if i not in _worker_models:
+        parcel = _worker_parcels[i]
+        derived_inputs = optimizer.parcel_derived_inputs(parcel)
+        model = optimizer.build_model(derived_inputs, parcel['units'], parcel['net_residential_area'],
+                                      parcel['set_aside_percentage'], backend=_worker_backend,
+                                      ami_tiers=parcel.get('ami_tiers'), income_average=parcel.get('income_average'))
+        _worker_models[i] = (model, target_rows(derived_inputs, _worker_targets)[0])
+    return _worker_models[i]
+
+
+def price_parcels(jobs):
+    """Solve parcels' own unit mix problems with the targets priced in.
+
+    `jobs` are (index, prices) pairs: every unit type's profit is raised
+    by the prices times its contribution to the portfolio targets.
+    Returns (index, status, quantities) triples, with quantities in
+    derived input order.
+    """
+    solved = []
+    for i, prices in jobs:
+        model, G = _parcel_model(i)
+        model.set_objective_bonus(prices @ G if len(prices) else None)
+        result = model.solve(solver=_worker_solver)
+        quantities = None
+        if result['status'] == 'Optimal':
+            quantities = [result['quantities'][unit_type] for unit_type in model.unit_types]
+        solved.append((i, result['status'], quantities))
+    return solved
+
+
+def upper_hull(points):
+    # Upper concave hull of (target contribution, profit) points, left to right
+    hull = []
+    for point in sorted(set(points)):
+        while len(hull) >= 2 and ((hull[-1][0] - hull[-2][0]) * (point[1] - hull[-2][1])
+                                  - (hull[-1][1] - hull[-2][1]) * (point[0] - hull[-2][0])) >= 0:
+            hull.pop()
+        hull.append(point)
+    return hull
+
+
+class ColumnPool:
+    """Unit mixes generated so far: one column per distinct mix of a parcel."""
+
+    def __init__(self, profits, rows):
+        self.profits = profits
+        self.rows = rows
+        self.parcel = []
+        self.mixes = []
+        self.seen = set()
+
+    def add(self, i, quantities):
+        x = np.round(np.asarray(quantities, dtype=float))
+        key = (i, tuple(x.astype(int)))
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        self.parcel.append(i)
+        self.mixes.append(x)
+        return True
+
+    def frontier(self, i, direction):
+        # (contribution along `direction`, profit) of every mix of parcel i
+        return [(float(direction @ self.rows[i] @ x), float(self.profits[i] @ x))
+                for k, x in zip(self.parcel, self.mixes) if k == i]
+
+    def arrays(self, n_parcels):
+        # Objective, convexity rows (one mix per parcel) and target rows over all columns
+        c = np.array([self.profits[i] @ x for i, x in zip(self.parcel, self.mixes)])
+        convexity = np.zeros((n_parcels, len(self.mixes)))
+        convexity[self.parcel, np.arange(len(self.mixes))] = 1
+        G = np.column_stack([self.rows[i] @ x for i, x in zip(self.parcel, self.mixes)])
+        return c, convexity, G
+
+
+def solve_master_lp(pool, n_parcels, rhs):
+    # Restricted master LP; returns (status, objective, weights, target prices, convexity duals)
+    c, convexity, G = pool.arrays(n_parcels)
+    res = linprog(-c, A_ub=-G if len(rhs) else None, b_ub=-rhs if len(rhs) else None,
+                  A_eq=convexity, b_eq=np.ones(n_parcels), bounds=(0, None), method='highs')
+    if res.status != 0:
+        return 'Infeasible' if res.status == 2 else 'Not Solved', None, None, None, None
+    prices = -res.ineqlin.marginals if len(rhs) else np.zeros(0)
+    return 'Optimal', -res.fun, res.x, np.maximum(prices, 0), -res.eqlin.marginals
+
+
+def solve_master_milp(pool, n_parcels, rhs, time_limit=None):
+    # One generated mix per parcel, meeting the targets, at the highest total profit
+    c, convexity, G = pool.arrays(n_parcels)
+    constraints = [LinearConstraint(convexity, 1, 1)]
+    if len(rhs):
+        constraints.append(LinearConstraint(G, rhs, np.inf))
+    options = {'time_limit': time_limit} if time_limit else {}
+    res = milp(-c, constraints=constraints, integrality=np.ones(len(c)), bounds=Bounds(0, 1), options=options)
+    if res.x is None:
+        return 'Infeasible' if res.status == 2 else 'Not Solved', None
+    return 'Optimal', np.round(res.x)
+
+
+def solve_portfolio(parcels, set_aside_percentage=None, min_affordable_units=None, workers=None, backend=None,
+                    cbc=None, max_iterations=MAX_ITERATIONS, tolerance=1e-4, time_limit=None, progress=None):
+    """Jointly optimize the unit mix of many parcels under portfolio-wide targets.
+
+    Dantzig-Wolfe decomposition: each parcel keeps its own land, mix limit
+    and set-aside rows and is solved on its own across a process pool,
+    while a master LP over the mixes found so far prices the shared
+    targets. Pricing rounds repeat until no parcel finds a better mix at
+    the master's prices, then a small MIP picks one generated mix per
+    parcel, with more mixes traced near the prices while it falls short.
+    The prices also give an upper bound on the portfolio profit, so the
+    result carries a proven gap; status is 'Optimal' when that gap is
+    within `tolerance`, 'Not Solved' when a feasible portfolio was found
+    but not proven optimal. The gap shrinks as portfolios grow: it comes
+    from the few parcels the LP would split between two mixes. A parcel
+    not solved to optimality in a pricing round adds nothing to it and
+    that round gives no bound; such solves are counted in 'pricing_failures'.
+    """
+    targets = {'set_aside_percentage': set_aside_percentage, 'min_affordable_units': min_affordable_units}
+    workers = workers or os.cpu_count()
+    derived_inputs = [optimizer.parcel_derived_inputs(parcel) for parcel in parcels]
+    profits = [(di.rent - di.max_cost) * 12 for di in derived_inputs]
+    rows = [target_rows(di, targets)[0] for di in derived_inputs]
+    rhs = target_rows(derived_inputs[0], targets)[1] if parcels else np.zeros(0)
+    pool = ColumnPool(profits, rows)
+    n = len(parcels)
+
+    def price(executor, jobs):
+        chunk_size = max(1, math.ceil(len(jobs) / (workers * 2)))
+        futures = [executor.submit(price_parcels, jobs[k:k + chunk_size]) for k in range(0, len(jobs), chunk_size)]
+        solved = []
+        for future in futures:
+            solved.extend(future.result())
+        return solved
+
+    result = {'status': 'Not Solved', 'iterations': 0}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(parcels, targets, backend, cbc)) as executor:
+        # Start from each parcel's own best mix and its most affordable one, which
+        # gives the master a feasible start whenever the targets can be met at all
+        scale = 10 * max((np.abs(p).max(initial=0) for p in profits), default=1)
+        for prices in (np.zeros(len(rhs)), np.full(len(rhs), scale)):
+            for i, status, quantities in price(executor, [(i, prices) for i in range(n)]):
+                if quantities is None:
+                    # Only an infeasible parcel makes the portfolio infeasible; a time limit is just 'Not Solved'
+                    failed = {'status': status, 'iterations': 0}
+                    if status == 'Infeasible':
+                        failed['infeasible_parcel'] = parcels[i]['name']
+                    return failed
+                pool.add(i, quantities)
+
+        upper_bound = np.inf
+        for iteration in range(1, max_iterations + 1):
+            status, lp_objective, _, prices, convexity_duals = solve_master_lp(pool, n, rhs)
+            if status != 'Optimal':
+                return {'status': status, 'iterations': iteration}
+
+            # Lagrangian bound: every parcel at its best for these prices
+            added = 0
+            bound = -prices @ rhs
+            for i, status, quantities in price(executor, [(i, prices) for i in range(n)]):
+                if quantities is None:
+                    # Not solved to optimality at these prices (e.g. a time limit): the
+                    # parcel adds no mix this round, and the round proves no bound
+                    result['pricing_failures'] = result.get('pricing_failures', 0) + 1
+                    bound = np.inf
+                    continue
+                x = np.asarray(quantities)
+                value = (profits[i] + prices @ rows[i]) @ x
+                bound += value
+                if value - convexity_duals[i] > TOL * (1 + abs(convexity_duals[i])) and pool.add(i, quantities):
+                    added += 1
+            upper_bound = min(upper_bound, bound)
+            result['iterations'] = iteration
+            if progress is not None:
+                progress(iteration, float(lp_objective), float(upper_bound), added)
+            if not added or upper_bound - lp_objective <= tolerance * max(1.0, abs(lp_objective)):
+                break
+
+        def select():
+            # One generated mix per parcel; returns (status, chosen mixes by parcel, objective)
+            status, weights = solve_master_milp(pool, n, rhs, time_limit)
+            if weights is None:
+                return status, None, -np.inf
+            chosen = {pool.parcel[k]: pool.mixes[k] for k in np.flatnonzero(weights > 0.5)}
+            return status, chosen, sum(profits[i] @ x for i, x in chosen.items())
+
+        # Pricing finds only the mixes that are best at the master's prices, while the
+        # selection needs each parcel's trade-off between profit and targets near them.
+        # Trace it where the gap calls for it: price each parcel where two neighbouring
+        # mixes on its frontier tie, until no parcel finds a mix above its frontier,
+        # over a wider range of prices each time
+        status, chosen, objective = select()
+        norm = np.linalg.norm(prices) if len(prices) else 0
+        checked = set()
+        for low, high in FRONTIER_RANGES:
+            if norm == 0 or upper_bound - objective <= tolerance * max(1.0, abs(objective)):
+                break
+            direction = prices / norm
+            while True:
+                jobs = []
+                for i in range(n):
+                    hull = upper_hull(pool.frontier(i, direction))
+                    for (g1, p1), (g2, p2) in zip(hull, hull[1:]):
+                        price_ratio = (p1 - p2) / (g2 - g1) if g2 > g1 else 0
+                        if low * norm <= price_ratio <= high * norm and (i, g1, p1, g2, p2) not in checked:
+                            checked.add((i, g1, p1, g2, p2))
+                            jobs.append((i, price_ratio * direction))
+                solved = price(executor, jobs)
+                if not sum(pool.add(i, quantities) for i, status, quantities in solved if quantities is not None):
+                    break
+            status, chosen, objective = select()
+
+    if chosen is None:
+        result['status'] = status
+        return result
+
+    # Parcels are solved to the solver's own MIP gap, so the bound can fall a hair short
+    upper_bound = max(upper_bound, objective)
+    gap = (upper_bound - objective) / max(1.0, abs(objective)) * 100
+    result.update({
+        'status': 'Optimal' if gap <= tolerance * 100 else 'Not Solved',
+        'columns': len(pool.mixes),
+        'objective': float(objective),
+        'upper_bound': float(upper_bound),
+        'gap': float(gap),
+    })
+
+    totals = {'annual_profit_worst_case': 0.0, 'annual_profit_best_case': 0.0, 'total_units': 0.0, 'affordable_units': 0.0}
+    parcel_results = []
+    for i, parcel in enumerate(parcels):
+        quantities = dict(zip(derived_inputs[i].unit_types, chosen[i].tolist()))
+        parcel_result = {'parcel': parcel['name']}
+        parcel_result.update(optimizer.extract_results(derived_inputs[i], quantities, parcel['net_residential_area']))
+        parcel_result['affordable_units'] = float(sum(q for unit_type, q in quantities.items() if optimizer.is_affordable(unit_type)))
+        for key in totals:
+            totals[key] += parcel_result[key]
+        parcel_results.append(parcel_result)
+    result.update(totals)
+    result['affordable_percentage'] = totals['affordable_units'] / totals['total_units'] * 100 if totals['total_units'] else 0
+    result['parcels'] = parcel_results
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Optimize the unit mix of many parcels under portfolio-wide affordability targets.")
+    parser.add_argument('parcels', help="CSV or JSON file of parcels, as read by batch.py")
+    parser.add_argument('--set-aside', type=float, default=None, help="affordable units as %% of all units across the portfolio")
+    parser.add_argument('--min-affordable-units', type=float, default=None, help="affordable units across the portfolio")
+    parser.add_argument('-o', '--output', default='-', help="JSON output file (default: stdout)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--cbc', default=None, help="path to the CBC binary")
+    parser.add_argument('--backend', choices=optimizer.BACKENDS, default=optimizer.DEFAULT_BACKEND,
+                        help="solver backend for the parcel subproblems (default: %(default)s)")
+    parser.add_argument('--ami-table', default=None, help="HUD-style income limits CSV for parcels with an ami_area")
+    parser.add_argument('--max-iterations', type=int, default=MAX_ITERATIONS, help="pricing rounds (default: %(default)s)")
+    parser.add_argument('--gap', type=float, default=0.01, help="stop within this %% of the upper bound (default: 0.01)")
+    parser.add_argument('--time-limit', type=float, default=None, help="time limit for the final mix selection in seconds")
+    args = parser.parse_args(argv)
+    if args.set_aside is None and args.min_affordable_units is None:
+        parser.error("give --set-aside and/or --min-affordable-units")
+
+    def progress(iteration, lp_objective, upper_bound, added):
+        print(f"round {iteration}: master ${lp_objective:,.0f}, bound ${upper_bound:,.0f}, {added} new mixes", file=sys.stderr)
+
+    try:
+        parcels = batch.load_parcels(args.parcels, ami.AmiTable.load_csv(args.ami_table) if args.ami_table else None)
+    except ValueError as e:
+        parser.error(str(e))
+    result = solve_portfolio(parcels, args.set_aside, args.min_affordable_units, workers=args.workers,
+                             backend=args.backend, cbc=args.cbc, max_iterations=args.max_iterations,
+                             tolerance=args.gap / 100, time_limit=args.time_limit, progress=progress)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        json.dump(result, output, indent=2)
+        output.write('\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if 'gap' in result:
+        print(f"{result['status']}: ${result['annual_profit_worst_case']:,.2f} worst case, "
+              f"{result['affordable_percentage']:.2f}% affordable, gap {result['gap']:.4f}%", file=sys.stderr)
+    return 0 if result['status'] in ('Optimal', 'Not Solved') and 'parcels' in result else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+from scipy.linalg import lu_factor, lu_solve
+
+import batch
+import matrix_solver
+import optimizer
+import sweep
+
+TOL = 1e-7
+
+# Bounds on each row's right-hand side that move with the land area
+AREA_ROWS = {
+    "Land_Size_Constraint": ('ub', 1.0),
+    "Land_Utilization_Constraint": ('lb', optimizer.LAND_UTILIZATION_MIN),
+}
+
+
+class Basis:
+    """Optimal basis of a MatrixModel's LP relaxation, factorized once.
+
+    The model is written as M @ z == 0 with z = (x, s), where s = A @ x are
+    the row activities bounded by lb <= s <= ub. SciPy does not hand back
+    the simplex basis, so it is recovered from the optimal vertex: columns
+    strictly inside their bounds are basic, and the rest of the basis is
+    filled from columns with zero reduced cost under the HiGHS duals, which
+    keeps the recovered basis dual feasible.
+    """
+
+    def __init__(self, model, x, pi):
+        m, n = model.A.shape
+        self.model = model
+        self.n = n
+        # Ranging works on the basis inverse, which is dense anyway
+        self.M = np.hstack([model.A.toarray(), -np.eye(m)])
+        self.lower = np.concatenate([np.zeros(n), model.lb])
+        self.upper = np.concatenate([np.full(n, np.inf), model.ub])
+        self.z = np.concatenate([x, model.A @ x])
+        self.d = np.concatenate([model.c, np.zeros(m)]) - self.M.T @ pi
+
+        scale = TOL * (1 + np.abs(self.z))
+        self.at_lower = np.abs(self.z - self.lower) <= scale
+        self.at_upper = np.abs(self.z - self.upper) <= scale
+        interior = ~(self.at_lower | self.at_upper)
+        dual_zero = np.abs(self.d) <= TOL * (1 + np.abs(model.c).max(initial=0))
+        slack = np.arange(n + m) >= n
+        order = np.concatenate([
+            np.flatnonzero(interior),
+            np.flatnonzero(~interior & dual_zero & slack),
+            np.flatnonzero(~interior & dual_zero & ~slack),
+            np.flatnonzero(~interior & ~dual_zero),
+        ])
+        self.basic = self._independent_columns(order, m)
+        self.nonbasic = np.setdiff1d(np.arange(n + m), self.basic)
+        self.position = {k: r for r, k in enumerate(self.basic)}
+
+        self.lu = lu_factor(self.M[:, self.basic])
+        self.B_inv = lu_solve(self.lu, np.eye(m))
+
+    def _independent_columns(self, order, m):
+        # Greedy Gram-Schmidt: take columns in priority order while they add rank
+        Q = np.zeros((m, 0))
+        chosen = []
+        for k in order:
+            column = self.M[:, k]
+            residual = column - Q @ (Q.T @ column)
+            norm = np.linalg.norm(residual)
+            if norm > 1e-9 * max(1.0, np.linalg.norm(column)):
+                Q = np.column_stack([Q, residual / norm])
+                chosen.append(k)
+                if len(chosen) == m:
+                    break
+        return np.array(chosen)
+
+    def cost_range(self, j):
+        """Allowable (increase, decrease) of the objective coefficient of column j."""
+        if j not in self.position:
+            # Nonbasic at zero: the coefficient can fall freely and rise until d_j reaches 0
+            return max(0.0, -self.d[j]), np.inf
+        alpha = self.B_inv[self.position[j]] @ self.M[:, self.nonbasic]
+        increase, decrease = np.inf, np.inf
+        for k, a in zip(self.nonbasic, alpha):
+            if abs(a) <= TOL or self.lower[k] == self.upper[k]:
+                continue
+            ratio = self.d[k] / a
+            # Nonbasic at lower needs d_k - delta * a <= 0, at upper needs >= 0
+            raises_limit = (a < 0) if self.at_lower[k] else (a > 0)
+            if raises_limit:
+                increase = min(increase, max(0.0, ratio))
+            else:
+                decrease = min(decrease, max(0.0, -ratio))
+        return increase, decrease
+
+    def step_limits(self, delta, dl=None, du=None):
+        """Interval of t for which z_B + t * delta stays within bounds that
+        themselves move by t * dl and t * du."""
+        low, high = -np.inf, np.inf
+        for r, k in enumerate(self.basic):
+            v = self.z[k]
+            slope_low = delta[r] - (dl[k] if dl is not None else 0)
+            slope_high = delta[r] - (du[k] if du is not None else 0)
+            if np.isfinite(self.lower[k]) and abs(slope_low) > TOL:
+                t = (self.lower[k] - v) / slope_low
+                if slope_low > 0:
+                    low = max(low, t)
+                else:
+                    high = min(high, t)
+            if np.isfinite(self.upper[k]) and abs(slope_high) > TOL:
+                t = (self.upper[k] - v) / slope_high
+                if slope_high > 0:
+                    high = min(high, t)
+                else:
+                    low = max(low, t)
+        return low, high
+
+    def rhs_range(self, i):
+        """Allowable (increase, decrease) of the right-hand side of row i."""
+        k = self.n + i
+        lb, ub = self.model.lb[i], self.model.ub[i]
+        if k in self.position:
+            # Row not binding: the rhs can move until it meets the activity
+            activity = self.z[k]
+            if np.isfinite(ub):
+                return np.inf, max(0.0, ub - activity)
+            return max(0.0, activity - lb), np.inf
+        low, high = self.step_limits(self.B_inv[:, i])
+        return max(0.0, high), max(0.0, -low)
+
+    def area_direction(self):
+        # Movement of every bound and of the basic variables per unit of land area
+        dl = np.zeros(len(self.z))
+        du = np.zeros(len(self.z))
+        for name, (side, factor) in AREA_ROWS.items():
+            k = self.n + self.model.row_index[name]
+            (du if side == 'ub' else dl)[k] = factor
+        dz_nonbasic = np.where(self.at_upper[self.nonbasic], du[self.nonbasic], dl[self.nonbasic])
+        delta = -self.B_inv @ (self.M[:, self.nonbasic] @ dz_nonbasic)
+        return delta, dl, du
+
+
+def solve_basis(model):
+    status, x, pi = model.solve_lp()
+    if status != 'Optimal':
+        return status, None
+    return status, Basis(model, x, pi)
+
+
+def last_basis(model):
+    # Basis of the LP relaxation `model` last solved, or None when there is none to reuse
+    if model.lp_solution is None:
+        return None
+    return Basis(model, *model.lp_solution)
+
+
+def ranging_report(model, basis=None):
+    """Objective and right-hand-side ranging of the LP relaxation of `model`.
+
+    Objective ranges are reported on the annual profit coefficient of each
+    unit type and translated to monthly rent ($ per unit); a rise in cost is
+    the same as a fall in rent. Right-hand-side ranges come with the shadow
+    price that holds across them. `basis` is the optimal Basis of the LP,
+    e.g. last_basis(model) after model.solve(relaxed=True); the LP is only
+    solved here when it is not given.
+    """
+    status = 'Optimal'
+    if basis is None:
+        status, basis = solve_basis(model)
+    report = {'status': status}
+    if basis is None:
+        return report
+
+    objective = []
+    for j, unit_type in enumerate(model.unit_types):
+        increase, decrease = basis.cost_range(j)
+        objective.append({
+            'unit_type': unit_type,
+            'rent': float(model.derived_inputs.rent[j]),
+            'quantity': float(basis.z[j]),
+            'coefficient': float(model.c[j]),
+            'reduced_cost': float(basis.d[j]),
+            'allowable_increase': increase,
+            'allowable_decrease': decrease,
+            'rent_increase': increase / 12,
+            'rent_decrease': decrease / 12,
+            'cost_increase': decrease / 12,
+            'cost_decrease': increase / 12,
+        })
+
+    rhs = []
+    for i, name in enumerate(model.row_names):
+        increase, decrease = basis.rhs_range(i)
+        value = model.ub[i] if np.isfinite(model.ub[i]) else model.lb[i]
+        rhs.append({
+            'constraint': name,
+            'rhs': float(value),
+            'activity': float(basis.z[basis.n + i]),
+            'shadow_price': float(basis.d[basis.n + i]),
+            'allowable_increase': increase,
+            'allowable_decrease': decrease,
+        })
+
+    report['objective'] = objective
+    report['rhs'] = rhs
+    return report
+
+
+def json_ready(value):
+    # Copy of a report with infinite ranges as None, since JSON has no Infinity
+    if isinstance(value, dict):
+        return {key: json_ready(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_ready(item) for item in value]
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def parametric(model, parameter, values):
+    """LP relaxation results along one parameter from as few factorizations as possible.
+
+    `parameter` is 'net_residential_area' or ('rent', unit_type). Values that
+    stay inside the current basis's range are evaluated directly from it; a
+    fresh LP solve and factorization only happens when a value crosses into
+    a new basis. Returns a list of (value, result) pairs in input order; each
+    result carries 'refactorized' to show which values needed a new basis.
+    The model's parameter is restored afterwards.
+    """
+    if parameter == 'net_residential_area':
+        original = model.net_residential_area
+        apply = model.set_net_residential_area
+    else:
+        _, unit_type = parameter
+        j = model.index[unit_type]
+        original = float(model.derived_inputs.rent[j])
+        apply = lambda rent: model.set_rent(unit_type, rent)
+
+    results = {}
+    basis, base_value, limits = None, None, None
+    try:
+        for value in sorted(set(values)):
+            refactorized = False
+            if basis is None or not (limits[0] - TOL <= value - base_value <= limits[1] + TOL):
+                apply(value)
+                status, basis = solve_basis(model)
+                if basis is None:
+                    results[value] = {'status': status, 'refactorized': True}
+                    continue
+                base_value, refactorized = value, True
+                if parameter == 'net_residential_area':
+                    delta, dl, du = basis.area_direction()
+                    limits = basis.step_limits(delta, dl, du)
+                else:
+                    increase, decrease = basis.cost_range(j)
+                    limits = (-decrease / 12, increase / 12)
+
+            t = value - base_value
+            z = basis.z.copy()
+            if parameter == 'net_residential_area' and t:
+                z[basis.basic] += t * delta
+                model.net_residential_area = value
+            elif parameter != 'net_residential_area':
+                model.derived_inputs.rent[j] = value
+            quantities = {unit_type: float(z[k]) for k, unit_type in enumerate(model.unit_types)}
+            result = {'status': 'Optimal', 'refactorized': refactorized}
+            result.update(optimizer.extract_results(model.derived_inputs, quantities, model.net_residential_area))
+            results[value] = result
+    finally:
+        apply(original)
+    return [(value, results[value]) for value in values]
+
+
+def parse_parameter(spec):
+    # "area" or "rent:<unit type>"
+    if spec in ('area', 'net_residential_area'):
+        return 'net_residential_area'
+    kind, _, unit_type = spec.partition(':')
+    if kind != 'rent' or not unit_type:
+        raise argparse.ArgumentTypeError("expected 'area' or 'rent:<unit type>'")
+    return ('rent', optimizer.unit_key(unit_type))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sensitivity ranging and parametric analysis of a parcel's LP relaxation.")
+    parser.add_argument('parcels', help="CSV or JSON parcel file, as read by batch.py")
+    parser.add_argument('--parcel', default=None, help="name of the parcel (default: the first)")
+    parser.add_argument('--parameter', type=parse_parameter, help="parameter to vary: area or rent:<unit type>")
+    parser.add_argument('--values', type=sweep.parse_values, help="parameter values, e.g. 30000:60000:1000")
+    args = parser.parse_args(argv)
+
+    try:
+        parcels = batch.load_parcels(args.parcels)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.parcel is not None:
+        parcels = [parcel for parcel in parcels if parcel['name'] == args.parcel]
+        if not parcels:
+            parser.error(f"no parcel named {args.parcel!r}")
+    parcel = parcels[0]
+    try:
+        derived_inputs = optimizer.parcel_derived_inputs(parcel)
+    except ValueError as e:
+        parser.error(str(e))
+    model = matrix_solver.MatrixModel(derived_inputs, parcel['units'], parcel['net_residential_area'],
+                                      parcel['set_aside_percentage'], ami_tiers=parcel.get('ami_tiers'),
+                                      income_average=parcel.get('income_average'))
+
+    if args.parameter is None:
+        json.dump(json_ready(ranging_report(model)), sys.stdout, indent=2, allow_nan=False)
+        print()
+        return 0
+    if not args.values:
+        parser.error("--parameter needs --values")
+    for value, result in parametric(model, args.parameter, args.values):
+        result['value'] = value
+        print(json.dumps(json_ready(result), allow_nan=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
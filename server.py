@@ -0,0 +1,584 @@
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import background
+import cache
+import diagnostics
+import optimizer
+
+# Queued requests handed to a worker as one task: up to BATCH_SIZE, split across
+# the idle workers, after waiting BATCH_WINDOW (s) for concurrent requests to join
+BATCH_SIZE = 16
+BATCH_WINDOW = 0.002
+
+# Requests waiting or solving before new ones are turned away with 503
+MAX_PENDING = 512
+
+# Per-request solver time limit (s): the default, and the most a request may ask for
+DEFAULT_TIME_LIMIT = 30
+MAX_TIME_LIMIT = 300
+
+# How long past its time limit a request waits for its answer before a 504 (s)
+TIMEOUT_GRACE = 5.0
+
+# Latencies kept for the /metrics percentiles, and the window throughput is measured over (s)
+LATENCY_SAMPLES = 10000
+THROUGHPUT_WINDOW = 60
+
+# Largest request body accepted (bytes)
+MAX_BODY = 16 * 2 ** 20
+
+# Request keys that are options rather than parcel data
+OPTIONS = ('relaxed', 'sensitivity', 'time_limit', 'mip_gap')
+
+# Solved once by each worker as it starts, so the first real request finds
+# NumPy, SciPy, PuLP and the solver already loaded
+WARMUP_PARCEL = {
+    'name': 'warmup',
+    'net_residential_area': 20000,
+    'ami_percentage': 60,
+    'set_aside_percentage': 20,
+    'ami_incomes': {1: 70000, 2: 80000},
+    'units': [
+        {'name': 'Studio', 'sqft': 500, 'rent': 1500, 'people': 1, 'min_units': 0, 'max_units': 100},
+        {'name': '1BR', 'sqft': 750, 'rent': 2000, 'people': 2, 'min_units': 0, 'max_units': 100},
+    ],
+}
+
+# Per-process solver settings and the model kept between requests
+_worker_backend = None
+_worker_cbc = None
+_worker_model = None
+
+
+class Overloaded(Exception):
+    pass
+
+
+def _init_worker(backend, cbc):
+    global _worker_backend, _worker_cbc
+    _worker_backend = backend
+    _worker_cbc = cbc
+    # Solver logs would interleave on the service's terminal
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+    for relaxed in (False, True):
+        _solve({'parcel': WARMUP_PARCEL, 'relaxed': relaxed, 'time_limit': DEFAULT_TIME_LIMIT})
+
+
+def _ping(seconds):
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def _solve(request):
+    """Solve one request in a worker, reusing the worker's model where it can.
+
+    Returns the ILP result, or the LP relaxation's with 'relaxed'. With
+    'sensitivity' the LP relaxation (shadow prices, reduced costs and, on
+    HiGHS, ranging) is added under 'sensitivity', as the GUI shows it.
+    """
+    global _worker_model
+    parcel = request['parcel']
+    start = time.perf_counter()
+    derived_inputs = optimizer.parcel_derived_inputs(parcel)
+    derived_inputs_seconds = time.perf_counter() - start
+    scenario = {
+        'derived_inputs': list(derived_inputs),
+        'units': parcel['units'],
+        'net_residential_area': parcel['net_residential_area'],
+        'set_aside_percentage': parcel['set_aside_percentage'],
+        'ami_tiers': parcel.get('ami_tiers'),
+        'income_average': parcel.get('income_average'),
+    }
+    relaxed = bool(request.get('relaxed'))
+    _worker_model, result = background.solve_scenario(_worker_model, scenario, relaxed, request['time_limit'],
+                                                      request.get('mip_gap'), _worker_backend, _worker_cbc)
+    result['diagnostics']['phases']['derived_inputs'] = derived_inputs_seconds
+    result['min_annual_salary'] = dict(zip(derived_inputs.unit_types, derived_inputs.min_salary.tolist()))
+    if request.get('sensitivity'):
+        if relaxed:
+            sensitivity = result
+        else:
+            _worker_model, sensitivity = background.solve_scenario(_worker_model, scenario, True, request['time_limit'],
+                                                                   None, _worker_backend, _worker_cbc)
+        if sensitivity['status'] == 'Optimal' and not isinstance(_worker_model, optimizer.UnitMixModel):
+            import ranging
+            report = ranging.ranging_report(_worker_model, ranging.last_basis(_worker_model))
+            sensitivity['ranging'] = ranging.json_ready({'objective': report['objective'], 'rhs': report['rhs']})
+        if not relaxed:
+            result['sensitivity'] = sensitivity
+    return result
+
+
+def _solve_time(request):
+    # The longest a request can keep its worker: an integer solve with
+    # sensitivity also re-solves the LP relaxation under the same limit
+    return request['time_limit'] * (2 if request.get('sensitivity') and not request.get('relaxed') else 1)
+
+
+def _solve_batch(requests):
+    global _worker_model
+    results = []
+    for request in requests:
+        try:
+            results.append(_solve(request))
+        except Exception as e:
+            # Start the next request from a fresh model
+            _worker_model = None
+            results.append({'status': 'Error', 'error': str(e)})
+    return results
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(math.ceil(q * len(values))) - 1)]
+
+
+class Metrics:
+    """Request counts, throughput and latency percentiles of the service.
+
+    'errors' counts the requests that ended in an error: malformed ones
+    (including parcels of a /batch) and failed solves. Every HTTP response
+    is also counted by status code under 'responses'.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counts = dict.fromkeys(('requests', 'completed', 'cached', 'rejected', 'timeouts', 'errors',
+                                     'batches', 'batched_requests', 'solves'), 0)
+        self.responses = {}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.completions = deque()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+
+    def invalid(self):
+        # A request turned away as malformed, before it reached submit()
+        with self.lock:
+            self.counts['requests'] += 1
+            self.counts['errors'] += 1
+
+    def response(self, status):
+        with self.lock:
+            self.responses[status] = self.responses.get(status, 0) + 1
+
+    def completed(self, seconds, status):
+        now = time.time()
+        with self.lock:
+            self.counts['completed'] += 1
+            if status == 'Error':
+                self.counts['errors'] += 1
+            self.latencies.append(seconds)
+            self.completions.append(now)
+            while self.completions[0] < now - THROUGHPUT_WINDOW:
+                self.completions.popleft()
+
+    def summary(self):
+        now = time.time()
+        with self.lock:
+            counts = dict(self.counts)
+            responses = {str(status): n for status, n in sorted(self.responses.items())}
+            latencies = sorted(self.latencies)
+            while self.completions and self.completions[0] < now - THROUGHPUT_WINDOW:
+                self.completions.popleft()
+            recent = len(self.completions)
+        uptime = now - self.started
+        ms = lambda seconds: None if seconds is None else seconds * 1000
+        return {
+            'uptime': uptime,
+            'counts': counts,
+            'responses': responses,
+            'error_rate': counts['errors'] / counts['requests'] if counts['requests'] else None,
+            'throughput': recent / max(1e-9, min(uptime, THROUGHPUT_WINDOW)),
+            'mean_batch_size': counts['batched_requests'] / counts['batches'] if counts['batches'] else None,
+            'latency_ms': {
+                'p50': ms(_percentile(latencies, 0.50)),
+                'p90': ms(_percentile(latencies, 0.90)),
+                'p99': ms(_percentile(latencies, 0.99)),
+                'max': ms(latencies[-1] if latencies else None),
+                'samples': len(latencies),
+            },
+        }
+
+
+class SolveService:
+    """Warm solver processes behind a bounded queue of requests.
+
+    submit() returns a Future for a request's result, answering from the
+    cache when it can, or raises Overloaded when `max_pending` requests are
+    already waiting or solving. A dispatcher thread hands the queue to idle
+    workers in batches, one pool task per batch, so a burst of small
+    requests costs a few round trips instead of one each. Identical requests
+    in a batch are solved once. Requests whose caller gave up while they
+    were queued are dropped before they reach a worker.
+
+    A batch solves its requests one after another, so wait() times each one
+    from the latest it can start: when the batch is handed to a worker, plus
+    the time limits of the requests ahead of it.
+    """
+
+    def __init__(self, workers=None, backend=None, cbc=None, batch_size=BATCH_SIZE, batch_window=BATCH_WINDOW,
+                 max_pending=MAX_PENDING, solve_cache=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.backend = backend
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_pending = max_pending
+        self.solve_cache = solve_cache if solve_cache is not None else cache.SolveCache(maxsize=4096)
+        self.metrics = Metrics()
+        self.aggregator = diagnostics.add_hook(diagnostics.Aggregator())
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(backend, cbc))
+        self.queue = deque()
+        self.starts = {}
+        self.pending = 0
+        self.busy = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def warm_up(self, timeout=120):
+        # Start every worker now rather than on the first requests; the first
+        # warm worker takes whatever is queued, so ping until all have answered
+        pids = set()
+        deadline = time.time() + timeout
+        while len(pids) < self.workers and time.time() < deadline:
+            futures = [self.pool.submit(_ping, 0.05) for _ in range(self.workers)]
+            pids.update(future.result() for future in futures)
+        return len(pids)
+
+    def submit(self, request):
+        # ValueError/TypeError from values the model cannot take are raised before the request counts
+        key = "{}:{}:{}".format(cache.parcel_key(request['parcel'], relaxed=bool(request.get('relaxed')),
+                                                 backend=self.backend),
+                                bool(request.get('sensitivity')), request.get('mip_gap'))
+        self.metrics.count('requests')
+        future = Future()
+        result = self.solve_cache.get(key)
+        if result is not None:
+            self.metrics.count('cached')
+            future.set_result(result)
+            return future
+        with self.condition:
+            if self.pending >= self.max_pending or self.closed:
+                self.metrics.count('rejected')
+                raise Overloaded(f"{self.pending} requests pending")
+            self.pending += 1
+            self.queue.append((key, request, future))
+            self.condition.notify()
+        return future
+
+    def _dispatch(self):
+        while True:
+            with self.condition:
+                while not self.closed and (not self.queue or self.busy >= self.workers):
+                    self.condition.wait()
+                if self.closed:
+                    return
+                waiting = len(self.queue)
+            # Let requests arriving together share a batch, unless a full one is already waiting
+            if waiting < self.batch_size:
+                time.sleep(self.batch_window)
+            with self.condition:
+                idle = self.workers - self.busy
+                size = min(self.batch_size, max(1, math.ceil(len(self.queue) / idle)))
+                while self.queue and self.busy < self.workers:
+                    items = []
+                    while self.queue and len(items) < size:
+                        item = self.queue.popleft()
+                        if item[2].set_running_or_notify_cancel():
+                            items.append(item)
+                        else:
+                            self.pending -= 1
+                    if not items:
+                        continue
+                    self._submit_batch(items)
+
+    def _submit_batch(self, items):
+        # Called with the condition held
+        unique = {}
+        for key, request, future in items:
+            unique.setdefault(key, request)
+        keys = list(unique)
+        self.busy += 1
+        self.metrics.count('batches')
+        self.metrics.count('batched_requests', len(items))
+        self.metrics.count('solves', len(keys))
+        task = self.pool.submit(_solve_batch, [unique[key] for key in keys])
+        starts, start = {}, time.perf_counter()
+        for key in keys:
+            starts[key] = start
+            start += _solve_time(unique[key])
+        for key, request, future in items:
+            self.starts[future] = starts[key]
+        self.condition.notify_all()
+        task.add_done_callback(lambda task: self._finished(items, keys, task))
+
+    def _finished(self, items, keys, task):
+        try:
+            results = dict(zip(keys, task.result()))
+        except Exception as e:
+            # A worker died; the pool is broken from here on, so report it on every request
+            results = {key: {'status': 'Error', 'error': f"Solver worker failed: {e}"} for key in keys}
+        names = {key: request['parcel']['name'] for key, request, future in items}
+        for key, result in results.items():
+            self.solve_cache.put(key, result)
+            diagnostics.emit('solve', parcel=names[key], status=result['status'], cached=False,
+                             diagnostics=result.get('diagnostics'))
+        for key, request, future in items:
+            # Each caller gets a copy, as from the cache
+            future.set_result(json.loads(json.dumps(results[key])))
+        with self.condition:
+            self.busy -= 1
+            self.pending -= len(items)
+            for key, request, future in items:
+                self.starts.pop(future, None)
+            self.condition.notify_all()
+
+    def wait(self, future, timeout):
+        """Result of a submitted request, raising TimeoutError when it takes
+        over `timeout` seconds from when its solve can start."""
+        with self.condition:
+            while not future.done() and future not in self.starts and not self.closed:
+                self.condition.wait()
+            start = self.starts.get(future)
+        if start is None and not future.done():
+            raise Overloaded("the service is shutting down")
+        try:
+            return future.result(timeout=None if start is None else max(0.0, start + timeout - time.perf_counter()))
+        except TimeoutError:
+            future.cancel()
+            self.metrics.count('timeouts')
+            raise
+
+    def solve(self, request, timeout):
+        """Result of `request`, raising TimeoutError after `timeout` seconds of solving."""
+        start = time.perf_counter()
+        result = self.wait(self.submit(request), timeout)
+        self.metrics.completed(time.perf_counter() - start, result.get('status'))
+        return result
+
+    def status(self):
+        with self.condition:
+            return {'workers': self.workers, 'busy': self.busy, 'pending': self.pending, 'queued': len(self.queue),
+                    'max_pending': self.max_pending}
+
+    def metrics_summary(self):
+        summary = self.metrics.summary()
+        summary['service'] = self.status()
+        summary['cache'] = self.solve_cache.stats()
+        summary['solver'] = self.aggregator.summary()
+        return summary
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        diagnostics.remove_hook(self.aggregator)
+
+
+def parse_request(body):
+    """(request, time limit) from a /solve body: a parcel as batch.py reads it,
+    plus optional 'relaxed', 'sensitivity', 'time_limit' (s) and 'mip_gap' (%).
+    Raises ValueError on a malformed request."""
+    if not isinstance(body, dict):
+        raise ValueError("expected a JSON object")
+    parcel = {key: value for key, value in body.items() if key not in OPTIONS}
+    missing = [key for key in ('net_residential_area', 'set_aside_percentage', 'ami_incomes', 'units') if key not in parcel]
+    if 'ami_percentage' not in parcel and not parcel.get('ami_tiers'):
+        missing.append('ami_percentage')
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    if not isinstance(parcel['units'], list) or not parcel['units']:
+        raise ValueError("'units' must be a non-empty list")
+    for unit in parcel['units']:
+        absent = [key for key in ('name', 'sqft', 'rent', 'people', 'min_units', 'max_units') if key not in unit]
+        if absent:
+            raise ValueError(f"unit {unit.get('name', '?')!r} is missing {', '.join(absent)}")
+    parcel.setdefault('name', 'request')
+    parcel['ami_incomes'] = {int(size): float(income) for size, income in parcel['ami_incomes'].items()}
+    if parcel.get('ami_tiers'):
+        optimizer.check_ami_tiers(parcel['ami_tiers'])
+    time_limit = min(float(body.get('time_limit') or DEFAULT_TIME_LIMIT), MAX_TIME_LIMIT)
+    mip_gap = body.get('mip_gap')
+    request = {
+        'parcel': parcel,
+        'relaxed': bool(body.get('relaxed')),
+        'sensitivity': bool(body.get('sensitivity')),
+        'time_limit': time_limit,
+        'mip_gap': float(mip_gap) * 0.01 if mip_gap is not None else None,
+    }
+    return request, time_limit
+
+
+class Handler(BaseHTTPRequestHandler):
+    """JSON endpoints: POST /solve and /batch, GET /metrics and /health."""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'WalnutService/1.0'
+    verbose = False
+
+    def send_json(self, status, payload, headers=()):
+        self.server.service.metrics.response(status)
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_invalid(self, message):
+        self.server.service.metrics.invalid()
+        self.send_json(400, {'error': message})
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY:
+            raise ValueError(f"request body over {MAX_BODY} bytes")
+        return json.loads(self.rfile.read(length) or b'null')
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == '/health':
+            self.send_json(200, dict(status='ok', **service.status()))
+        elif self.path == '/metrics':
+            self.send_json(200, service.metrics_summary())
+        else:
+            self.send_json(404, {'error': f"no such endpoint: {self.path}"})
+
+    def do_POST(self):
+        try:
+            body = self.read_json()
+        except ValueError as e:
+            self.send_invalid(f"invalid JSON: {e}")
+            return
+        if self.path == '/solve':
+            self.solve_one(body)
+        elif self.path == '/batch':
+            self.solve_many(body)
+        else:
+            self.send_json(404, {'error': f"no such endpoint: {self.path}"})
+
+    def solve_one(self, body):
+        try:
+            request, time_limit = parse_request(body)
+            result = self.server.service.solve(request, time_limit + TIMEOUT_GRACE)
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            self.send_invalid(str(e))
+            return
+        except Overloaded as e:
+            self.send_json(503, {'error': f"service busy: {e}"}, headers=[('Retry-After', '1')])
+            return
+        except TimeoutError:
+            self.send_json(504, {'error': f"no result within {time_limit + TIMEOUT_GRACE:g}s of solving"})
+            return
+        result['parcel'] = request['parcel']['name']
+        self.send_json(200, result)
+
+    def solve_many(self, body):
+        # Every parcel is queued at once and answered in order; each carries its own status
+        parcels = body.get('parcels') if isinstance(body, dict) else body
+        if not isinstance(parcels, list):
+            self.send_invalid("expected a list of parcels or {'parcels': [...]}")
+            return
+        service = self.server.service
+        submitted = []
+        for i, parcel in enumerate(parcels):
+            try:
+                request, time_limit = parse_request(parcel)
+                submitted.append((request, time_limit, time.perf_counter(), service.submit(request)))
+            except (ValueError, TypeError, AttributeError, KeyError) as e:
+                service.metrics.invalid()
+                submitted.append(({'parcel': {'name': f"parcel_{i + 1}"}}, None, None, {'status': 'Error', 'error': str(e)}))
+            except Overloaded as e:
+                submitted.append((request, None, None, {'status': 'Overloaded', 'error': f"service busy: {e}"}))
+        results = []
+        for request, time_limit, start, future in submitted:
+            if isinstance(future, dict):
+                result = future
+            else:
+                try:
+                    result = service.wait(future, time_limit + TIMEOUT_GRACE)
+                    service.metrics.completed(time.perf_counter() - start, result.get('status'))
+                except TimeoutError:
+                    result = {'status': 'Timeout', 'error': f"no result within {time_limit + TIMEOUT_GRACE:g}s of solving"}
+                except Overloaded as e:
+                    result = {'status': 'Overloaded', 'error': str(e)}
+            result['parcel'] = request['parcel'].get('name', 'request')
+            results.append(result)
+        self.send_json(200, {'results': results})
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, service):
+        self.service = service
+        super().__init__(address, Handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve unit mix solves over local HTTP/JSON from warm solver workers.")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=8765, help="port to listen on (default: %(default)s)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="number of solver processes")
+    parser.add_argument('--cbc', default=None, help="path to the CBC binary")
+    parser.add_argument('--backend', choices=optimizer.BACKENDS, default=optimizer.DEFAULT_BACKEND,
+                        help="solver backend (default: %(default)s)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="most requests per worker task")
+    parser.add_argument('--batch-window', type=float, default=BATCH_WINDOW * 1000,
+                        help="ms to wait for concurrent requests to batch together")
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING, help="queued requests before answering 503")
+    parser.add_argument('--cache', default=None, help="SQLite file to reuse results across restarts")
+    parser.add_argument('--log', default=None, help="JSON-lines file for per-solve timings and solver statistics")
+    parser.add_argument('-v', '--verbose', action='store_true', help="log every HTTP request")
+    args = parser.parse_args(argv)
+
+    log = diagnostics.add_hook(diagnostics.JsonLinesLog(args.log)) if args.log else None
+    solve_cache = cache.SolveCache(maxsize=4096, path=args.cache)
+    service = SolveService(workers=args.workers, backend=args.backend, cbc=args.cbc, batch_size=args.batch_size,
+                           batch_window=args.batch_window / 1000, max_pending=args.max_pending, solve_cache=solve_cache)
+    started = time.perf_counter()
+    workers = service.warm_up()
+    Handler.verbose = args.verbose
+    server = Server((args.host, args.port), service)
+    print(f"{workers} solver workers warm in {time.perf_counter() - started:.1f}s; "
+          f"serving on http://{args.host}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        solve_cache.close()
+        if log is not None:
+            diagnostics.remove_hook(log)
+            log.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
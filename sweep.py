@@ -0,0 +1,277 @@
+import argparse
+import csv
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import ami
+import batch
+import cache
+import optimizer
+
+RESULT_COLUMNS = ('status', 'annual_profit_worst_case', 'annual_profit_best_case', 'total_units', 'land_utilization_rate')
+
+
+def parse_values(spec):
+    # "15,20,25" lists values; "15:25:5" is an inclusive start:stop:step range
+    if ':' in spec:
+        start, stop, step = (float(v) for v in spec.split(':'))
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        return [start + i * step for i in range(count)]
+    return [float(v) for v in spec.split(',')]
+
+
+def parse_mix(spec):
+    # "Studio=10-40,20-50" gives the (min %, max %) pairs to try for one unit type
+    unit_name, pairs = spec.split('=', 1)
+    limits = []
+    for pair in pairs.split(','):
+        low, high = pair.split('-')
+        limits.append((float(low), float(high)))
+    return optimizer.unit_key(unit_name), limits
+
+
+def snake_product(axes):
+    # Cartesian product in boustrophedon order: consecutive points differ in
+    # a single axis, so each solve starts next to the previous solution
+    if not axes:
+        yield ()
+        return
+    tails = list(snake_product(axes[1:]))
+    for i, value in enumerate(axes[0]):
+        for tail in (reversed(tails) if i % 2 else tails):
+            yield (value,) + tail
+
+
+def grid_points(parcel, set_aside=None, ami=None, area=None, mix=None, ami_area=None):
+    """Return the sweep grid for `parcel` as a list of point dicts.
+
+    Each axis defaults to the parcel's own value. `mix` maps unit names to a
+    list of (min %, max %) pairs. `ami_area` lists areas of an AMI table to
+    take the AMI incomes from; by default points carry None and use the
+    parcel's own. A parcel with 'ami_tiers' has no single AMI % to sweep;
+    its points carry None.
+    """
+    mix = mix or {}
+    if (ami or ami_area) and parcel.get('ami_tiers'):
+        raise ValueError(f"parcel {parcel['name']!r} sets its AMI levels per tier; the AMI axes need a single-level parcel")
+    axes = [
+        set_aside or [parcel['set_aside_percentage']],
+        ami or [parcel.get('ami_percentage')],
+        ami_area or [None],
+        area or [parcel['net_residential_area']],
+    ] + [mix[unit_name] for unit_name in mix]
+    points = []
+    for values in snake_product(axes):
+        points.append({
+            'set_aside_percentage': values[0],
+            'ami_percentage': values[1],
+            'ami_area': values[2],
+            'net_residential_area': values[3],
+            'mix': dict(zip(mix, values[4:])),
+        })
+    return points
+
+
+def regional_inputs(parcel, table, points):
+    """(AMI values, derived inputs) of `parcel` at each (AMI %, AMI area) the points visit.
+
+    All the areas are derived in one vectorized pass per AMI % (see
+    ami.regional_derived_inputs). Raises ValueError when the table lacks a
+    limit the parcel's units need.
+    """
+    areas = sorted({point['ami_area'] for point in points if point['ami_area'] is not None})
+    inputs = {}
+    if not areas:
+        return inputs
+    sizes = sorted({unit['people'] for unit in parcel['units']})
+    for ami_percentage in sorted({point['ami_percentage'] for point in points}):
+        limits = table.limits(areas, ami_percentage, sizes=sizes)
+        regional = ami.regional_derived_inputs(parcel['units'], table, areas, ami_percentage)
+        for i, area in enumerate(areas):
+            inputs[(ami_percentage, area)] = (dict(zip(sizes, limits[i].tolist())), regional[area])
+    return inputs
+
+
+def apply_point(model, parcel, point, previous=None, regional=None):
+    # Edit only the parameters that changed since the previous grid point;
+    # `regional` holds the derived inputs of the AMI areas (see regional_inputs)
+    if previous is None or point['set_aside_percentage'] != previous['set_aside_percentage']:
+        model.set_set_aside_percentage(point['set_aside_percentage'])
+    if previous is None or point['net_residential_area'] != previous['net_residential_area']:
+        model.set_net_residential_area(point['net_residential_area'])
+    ami_changed = previous is None or (point['ami_percentage'], point['ami_area']) != (previous['ami_percentage'],
+                                                                                      previous['ami_area'])
+    if point['ami_area'] is not None and ami_changed:
+        derived_inputs = regional[(point['ami_percentage'], point['ami_area'])][1]
+        for unit in parcel['units']:
+            unit_type = f"Aff_{optimizer.unit_key(unit['name'])}"
+            model.set_rent(unit_type, float(derived_inputs.rent[derived_inputs.positions[unit_type]]))
+    elif point['ami_percentage'] is not None and ami_changed:
+        ami_values = optimizer.ami_limits(parcel['ami_incomes'], point['ami_percentage'])
+        for unit in parcel['units']:
+            rent = optimizer.affordable_rent(ami_values.get(unit['people'], 0))
+            model.set_rent(f"Aff_{optimizer.unit_key(unit['name'])}", rent)
+    for unit_name, (min_units, max_units) in point['mix'].items():
+        if previous is None or previous['mix'][unit_name] != (min_units, max_units):
+            model.set_mix_limits(unit_name, min_units, max_units)
+
+
+def solve_chunk(parcel, points, backend=None, cbc=None, regional=None):
+    """Solve a run of neighbouring grid points on one reused model."""
+    derived_inputs = optimizer.parcel_derived_inputs(parcel)
+    model = optimizer.build_model(derived_inputs, parcel['units'], parcel['net_residential_area'],
+                                  parcel['set_aside_percentage'], backend=backend, ami_tiers=parcel.get('ami_tiers'),
+                                  income_average=parcel.get('income_average'))
+    solver = optimizer.make_solver(cbc, msg=False, warm_start=True)
+
+    rows = []
+    previous = None
+    warm_start = None
+    for point in points:
+        apply_point(model, parcel, point, previous, regional)
+        # CBC checks a MIP start itself; on HiGHS a start is an objective floor,
+        # so only one that still fits the edited model is passed on
+        if warm_start and not isinstance(model, optimizer.UnitMixModel) and not model.is_feasible(warm_start):
+            warm_start = None
+        result = model.solve(solver=solver, warm_start=warm_start)
+        warm_start = result.get('quantities')
+        rows.append((point, result))
+        previous = point
+    return rows
+
+
+def point_key(parcel, point, derived_inputs_by_ami, backend=None):
+    # scenario_key of one grid point, matching cache.parcel_key; derived inputs are shared per
+    # (AMI %, AMI area), and those of the AMI areas come from regional_inputs
+    ami_percentage = point['ami_percentage']
+    if (ami_percentage, point['ami_area']) not in derived_inputs_by_ami:
+        ami_parcel = dict(parcel, ami_percentage=ami_percentage) if ami_percentage is not None else parcel
+        ami_values = optimizer.ami_limits(parcel['ami_incomes'], 100 if ami_percentage is None else ami_percentage)
+        derived_inputs_by_ami[(ami_percentage, None)] = (ami_values, optimizer.parcel_derived_inputs(ami_parcel))
+    ami_values, derived_inputs = derived_inputs_by_ami[(ami_percentage, point['ami_area'])]
+    units = []
+    for unit in parcel['units']:
+        min_units, max_units = point['mix'].get(optimizer.unit_key(unit['name']), (unit['min_units'], unit['max_units']))
+        units.append({'name': unit['name'], 'min_units': min_units, 'max_units': max_units})
+    return cache.scenario_key(derived_inputs, units, point['net_residential_area'], point['set_aside_percentage'],
+                              ami_values=ami_values, ami_tiers=parcel.get('ami_tiers'),
+                              income_average=parcel.get('income_average'), backend=backend)
+
+
+def run_sweep(parcel, points, workers=None, backend=None, cbc=None, solve_cache=None, ami_table=None):
+    """Solve every grid point across a process pool.
+
+    The snake-ordered grid is cut into contiguous chunks so each worker
+    walks neighbouring points. Points with an 'ami_area' take their AMI
+    incomes from `ami_table`. With `solve_cache`, points solved before are
+    taken from the cache and only the rest are sent to the pool. Returns
+    (point, result) pairs in grid order.
+    """
+    workers = workers or os.cpu_count()
+    regional = regional_inputs(parcel, ami_table, points)
+    results = [None] * len(points)
+    keys = [None] * len(points)
+    if solve_cache is not None:
+        derived_inputs_by_ami = dict(regional)
+        for i, point in enumerate(points):
+            keys[i] = point_key(parcel, point, derived_inputs_by_ami, backend)
+            results[i] = solve_cache.get(keys[i])
+    pending = [i for i, result in enumerate(results) if result is None]
+
+    chunk_size = max(1, math.ceil(len(pending) / (workers * 4)))
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [(chunk, pool.submit(solve_chunk, parcel, [points[i] for i in chunk], backend, cbc,
+                                           regional)) for chunk in chunks]
+        for chunk, future in futures:
+            for i, (_, result) in zip(chunk, future.result()):
+                results[i] = result
+                if solve_cache is not None:
+                    solve_cache.put(keys[i], result)
+    return list(zip(points, results))
+
+
+def write_table(rows, output):
+    unit_names = list(rows[0][0]['mix']) if rows else []
+    # The AMI area column only appears when the sweep has that axis
+    point_columns = ['set_aside_percentage', 'ami_percentage', 'net_residential_area']
+    if any(point['ami_area'] is not None for point, _ in rows):
+        point_columns.insert(2, 'ami_area')
+    fieldnames = list(point_columns)
+    for unit_name in unit_names:
+        fieldnames += [f"min_units_{unit_name}", f"max_units_{unit_name}"]
+    fieldnames += list(RESULT_COLUMNS)
+
+    writer = csv.DictWriter(output, fieldnames=fieldnames, extrasaction='ignore')
+    writer.writeheader()
+    for point, result in rows:
+        row = {key: point[key] for key in point_columns}
+        for unit_name, (min_units, max_units) in point['mix'].items():
+            row[f"min_units_{unit_name}"] = min_units
+            row[f"max_units_{unit_name}"] = max_units
+        row.update({key: result.get(key, '') for key in RESULT_COLUMNS})
+        writer.writerow(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep set-aside %, AMI %, AMI area, land area and unit mix limits for a parcel.")
+    parser.add_argument('parcels', help="CSV or JSON parcel file, as read by batch.py")
+    parser.add_argument('--parcel', default=None, help="name of the parcel to sweep (default: the first)")
+    parser.add_argument('--set-aside', type=parse_values, help="set-aside %% values, e.g. 15,20,25 or 15:25:5")
+    parser.add_argument('--ami', type=parse_values, help="AMI %% values")
+    parser.add_argument('--ami-area', type=lambda spec: [area.strip() for area in spec.split(',')],
+                        help="areas of the --ami-table to take AMI incomes from, e.g. Springfield,Shelbyville")
+    parser.add_argument('--area', type=parse_values, help="net residential area values")
+    parser.add_argument('--mix', type=parse_mix, action='append', default=[],
+                        help="min-max %% pairs for a unit type, e.g. Studio=10-40,20-50 (repeatable)")
+    parser.add_argument('-o', '--output', default='-', help="CSV output file (default: stdout)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--cbc', default=None, help="path to the CBC binary")
+    parser.add_argument('--backend', choices=optimizer.BACKENDS, default=optimizer.DEFAULT_BACKEND,
+                        help="solver backend (default: %(default)s)")
+    parser.add_argument('--cache', default=None, help="SQLite file to reuse results across runs")
+    parser.add_argument('--ami-table', default=None, help="HUD-style income limits CSV for parcels with an ami_area")
+    args = parser.parse_args(argv)
+
+    if args.ami_area and not args.ami_table:
+        parser.error("--ami-area needs --ami-table")
+    try:
+        ami_table = ami.AmiTable.load_csv(args.ami_table) if args.ami_table else None
+        parcels = batch.load_parcels(args.parcels, ami_table)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.parcel is not None:
+        parcels = [parcel for parcel in parcels if parcel['name'] == args.parcel]
+        if not parcels:
+            parser.error(f"no parcel named {args.parcel!r}")
+    parcel = parcels[0]
+
+    try:
+        points = grid_points(parcel, set_aside=args.set_aside, ami=args.ami, area=args.area, mix=dict(args.mix),
+                             ami_area=args.ami_area)
+        # Check the AMI areas against the table before any worker starts
+        regional_inputs(parcel, ami_table, points)
+    except ValueError as e:
+        parser.error(str(e))
+    solve_cache = cache.SolveCache(maxsize=len(points), path=args.cache) if args.cache else None
+    rows = run_sweep(parcel, points, workers=args.workers, backend=args.backend, cbc=args.cbc, solve_cache=solve_cache,
+                     ami_table=ami_table)
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        write_table(rows, output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    solved = sum(1 for _, result in rows if result['status'] == 'Optimal')
+    print(f"Solved {solved} of {len(rows)} grid points", file=sys.stderr)
+    if solve_cache is not None:
+        print("Cache: {hits} hits, {disk_hits} disk hits, {misses} misses".format(**solve_cache.stats()), file=sys.stderr)
+        solve_cache.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ami  # noqa: E402
+import bench  # noqa: E402
+import optimizer  # noqa: E402
+
+HAS_CBC = optimizer.make_solver(None, msg=False).available()
+
+requires_scipy = pytest.mark.skipif(not optimizer.HAS_SCIPY, reason="SciPy/HiGHS not installed")
+requires_cbc = pytest.mark.skipif(not HAS_CBC, reason="CBC not available")
+
+# Two areas in HUD's wide layout: official 50% and 80% limits (capped, so not
+# linear in the median), extremely low income limits and the median family income
+HUD_CSV = """\
+hud_area_name,median2024,l50_1,l50_2,l50_3,l50_4,ELI_1,ELI_2,ELI_3,ELI_4,l80_1,l80_2,l80_3,l80_4
+Springfield,100000,35000,40000,45000,50000,21000,24000,27000,30000,"56,000","64,000","72,000","80,000"
+Shelbyville,150000,47600,54400,61200,68000,28600,32650,36750,40800,"66,150","75,600","85,050","94,450"
+"""
+
+
+def synthetic_parcel(unit_types, seed=0):
+    return bench.generate_parcel(np.random.default_rng([seed, unit_types]), unit_types, name=f"n{unit_types}-s{seed}")
+
+
+def relative_difference(a, b):
+    return abs(a - b) / max(1.0, abs(a), abs(b))
+
+
+@pytest.fixture
+def parcel():
+    # Three unit types on a small lot, with land as the binding constraint
+    return {
+        'name': 'small',
+        'net_residential_area': 20000,
+        'ami_percentage': 60,
+        'set_aside_percentage': 20,
+        'ami_incomes': {1: 70000, 2: 80000, 3: 90000},
+        'units': [
+            {'name': 'Studio', 'sqft': 500, 'rent': 1500, 'people': 1, 'min_units': 0, 'max_units': 100},
+            {'name': '1BR', 'sqft': 750, 'rent': 2000, 'people': 2, 'min_units': 0, 'max_units': 100},
+            {'name': '2BR', 'sqft': 1000, 'rent': 2600, 'people': 3, 'min_units': 0, 'max_units': 100},
+        ],
+    }
+
+
+@pytest.fixture
+def hud_table(tmp_path):
+    path = tmp_path / 'limits.csv'
+    path.write_text(HUD_CSV)
+    return ami.AmiTable.load_csv(str(path))
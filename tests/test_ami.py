@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+import ami
+import optimizer
+
+# Long layout without 100% limits
+LONG_CSV = """\
+area,household_size,ami_percentage,income
+Capital City,1,60,40000
+Capital City,2,60,45000
+Capital City,1,80,52000
+"""
+
+
+@pytest.fixture
+def long_table(tmp_path):
+    path = tmp_path / 'long.csv'
+    path.write_text(LONG_CSV)
+    return ami.AmiTable.load_csv(str(path))
+
+
+def test_load_wide_hud_layout(hud_table):
+    assert hud_table.areas == ['Shelbyville', 'Springfield']
+    assert hud_table.percentages == [30.0, 50.0, 80.0, 100.0]
+    assert hud_table.sizes == [1, 2, 3, 4, 5, 6, 7, 8]
+    np.testing.assert_allclose(hud_table.limits(['Springfield'], 50, sizes=[1, 2, 3, 4]), [[35000, 40000, 45000, 50000]])
+    np.testing.assert_allclose(hud_table.limits(['Springfield'], 30, sizes=[4]), [[30000]])
+
+
+def test_median_gives_size_adjusted_100_percent_limits(hud_table):
+    np.testing.assert_allclose(hud_table.limits(['Springfield', 'Shelbyville'], 100, sizes=[1, 4, 8]),
+                               [[70000, 100000, 132000], [105000, 150000, 198000]])
+
+
+def test_unlisted_percentage_scales_from_100_percent(hud_table):
+    # 60% is not listed; it comes from the median, not from the capped 50% or 80% limits
+    np.testing.assert_allclose(hud_table.limits(['Springfield'], 60, sizes=[1, 4]), [[42000, 60000]])
+    assert hud_table.ami_values('Springfield', 60)[4] == pytest.approx(60000)
+
+
+def test_listed_percentage_is_not_rescaled(hud_table):
+    np.testing.assert_allclose(hud_table.limits(['Shelbyville'], 80, sizes=[4]), [[94450]])
+
+
+def test_missing_size_is_an_error_not_zero(hud_table):
+    # The file lists 80% limits for households of 1 to 4 only
+    with pytest.raises(ValueError, match="80% limit for a household of 5 in Springfield"):
+        hud_table.limits(['Springfield'], 80, sizes=[4, 5])
+    with pytest.raises(ValueError, match="household of 9"):
+        hud_table.limits(['Springfield'], 100, sizes=[9])
+
+
+def test_no_100_percent_limits_to_scale_from(long_table):
+    np.testing.assert_allclose(long_table.limits(['Capital City'], 60), [[40000, 45000]])
+    with pytest.raises(ValueError, match="no 50% limits"):
+        long_table.limits(['Capital City'], 50)
+    with pytest.raises(ValueError, match="household of 2 in Capital City"):
+        long_table.ami_values('Capital City', 80)
+
+
+def test_unknown_area(hud_table):
+    with pytest.raises(ValueError, match="Ogdenville"):
+        hud_table.limits(['Springfield', 'Ogdenville'], 100)
+
+
+def test_file_without_area_column(tmp_path):
+    path = tmp_path / 'bad.csv'
+    path.write_text("county,l50_1\nX,1000\n")
+    with pytest.raises(ValueError, match="no area column"):
+        ami.AmiTable.load_csv(str(path))
+
+
+@pytest.mark.parametrize('ami_percentage', [50, 60, 80])
+def test_regional_derived_inputs_match_each_area(hud_table, parcel, ami_percentage):
+    areas = ['Springfield', 'Shelbyville']
+    regional = ami.regional_derived_inputs(parcel['units'], hud_table, areas, ami_percentage)
+    for area in areas:
+        ami_values = dict(zip([1, 2, 3], hud_table.limits([area], ami_percentage, sizes=[1, 2, 3])[0]))
+        expected = optimizer.calculate_derived_inputs(parcel['units'], ami_values)
+        assert regional[area].unit_types == expected.unit_types
+        np.testing.assert_allclose(regional[area].rent, expected.rent)
+        np.testing.assert_allclose(regional[area].min_salary, expected.min_salary)
+
+
+def test_regional_derived_inputs_need_every_household_size(hud_table, parcel):
+    parcel['units'][0]['people'] = 5
+    with pytest.raises(ValueError, match="household of 5"):
+        ami.regional_derived_inputs(parcel['units'], hud_table, ['Springfield'], 80)
@@ -0,0 +1,77 @@
+import pytest
+
+import optimizer
+from conftest import relative_difference, requires_cbc, requires_scipy, synthetic_parcel
+
+# The SciPy/HiGHS matrix model against the PuLP/CBC model it stands in for
+pytestmark = [requires_scipy, requires_cbc]
+
+TIERS = [{'ami_percentage': 30, 'min_share': 5}, {'ami_percentage': 60, 'min_share': 10}, {'ami_percentage': 80}]
+
+
+def models(parcel):
+    derived_inputs = optimizer.parcel_derived_inputs(parcel)
+    return [optimizer.build_model(derived_inputs, parcel['units'], parcel['net_residential_area'],
+                                  parcel['set_aside_percentage'], backend=backend, ami_tiers=parcel.get('ami_tiers'),
+                                  income_average=parcel.get('income_average'))
+            for backend in ('highs', 'cbc')]
+
+
+def assert_same_solve(highs, cbc, relaxed=False):
+    a = highs.solve(relaxed=relaxed)
+    b = cbc.solve(relaxed=relaxed, solver=optimizer.make_solver(None, msg=False))
+    assert a['status'] == b['status']
+    if a['status'] == 'Optimal':
+        assert relative_difference(a['annual_profit_worst_case'], b['annual_profit_worst_case']) < 1e-6
+    return a, b
+
+
+@pytest.mark.parametrize('unit_types', [2, 5, 10])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_highs_matches_cbc(unit_types, seed):
+    parcel = synthetic_parcel(unit_types, seed)
+    solver = optimizer.make_solver(None, msg=False)
+    for relaxed in (False, True):
+        highs = optimizer.solve_parcel(parcel, relaxed=relaxed, backend='highs')
+        cbc = optimizer.solve_parcel(parcel, relaxed=relaxed, backend='cbc', solver=solver)
+        assert highs['status'] == cbc['status']
+        if highs['status'] == 'Optimal':
+            assert relative_difference(highs['annual_profit_worst_case'], cbc['annual_profit_worst_case']) < 1e-6
+
+
+def test_rows_and_columns_line_up(parcel):
+    highs, cbc = models(dict(parcel, ami_tiers=TIERS, income_average=60))
+    assert highs.row_names == list(cbc.problem.constraints)
+    assert highs.column_names(True) == cbc.column_names(True)
+    a, b = assert_same_solve(highs, cbc, relaxed=True)
+    assert set(a['shadow_prices']) == set(b['shadow_prices'])
+    assert set(a['reduced_costs']) == set(b['reduced_costs'])
+
+
+def test_infeasible_on_both(parcel):
+    parcel['units'][0]['min_units'] = 60
+    parcel['units'][1]['min_units'] = 60
+    for relaxed in (False, True):
+        a, _ = assert_same_solve(*models(parcel), relaxed=relaxed)
+        assert a['status'] == 'Infeasible'
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_tiered_parcels_match(seed):
+    parcel = synthetic_parcel(6, seed)
+    del parcel['ami_percentage']
+    parcel.update(ami_tiers=TIERS, income_average=60)
+    for relaxed in (False, True):
+        a, _ = assert_same_solve(*models(parcel), relaxed=relaxed)
+        assert a['status'] == 'Optimal'
+
+
+def test_in_place_edits_match(parcel):
+    highs, cbc = models(parcel)
+    for model in (highs, cbc):
+        model.set_net_residential_area(15000)
+        model.set_set_aside_percentage(35)
+        model.set_mix_limits('Studio', 10, 50)
+        model.set_rent('1BR', 2300)
+    for relaxed in (False, True):
+        assert_same_solve(highs, cbc, relaxed=relaxed)
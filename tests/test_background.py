@@ -0,0 +1,118 @@
+import os
+import time
+
+import pytest
+
+import background
+import optimizer
+from conftest import requires_cbc, requires_scipy, synthetic_parcel
+
+VACANCY = optimizer.VACANCY_FACTOR
+BACKENDS = [pytest.param('highs', marks=requires_scipy), pytest.param('cbc', marks=requires_cbc)]
+
+
+def scenario_for(parcel):
+    return {'derived_inputs': optimizer.parcel_derived_inputs(parcel), 'units': parcel['units'],
+            'net_residential_area': parcel['net_residential_area'],
+            'set_aside_percentage': parcel['set_aside_percentage']}
+
+
+def wait(worker, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        result = worker.poll()
+        if result is not None:
+            return result
+        time.sleep(0.02)
+    pytest.fail("no result in time")
+
+
+def test_parse_progress_reads_cbc_lines():
+    progress = {}
+    background.parse_progress("Cbc0012I Integer solution of -100000 found by feasibility pump after 0 iterations "
+                              "and 0 nodes (0.01 seconds)", progress)
+    assert progress == {'incumbent': pytest.approx(100000 * VACANCY)}
+    background.parse_progress("Cbc0010I After 100 nodes, 12 on tree, -120000 best solution, best possible -125000 "
+                              "(0.52 seconds)", progress)
+    assert progress == {'nodes': 100, 'incumbent': pytest.approx(120000 * VACANCY),
+                        'bound': pytest.approx(125000 * VACANCY), 'gap': pytest.approx(5000 / 120000 * 100)}
+    # No incumbent yet is printed as 1e+50; the earlier one stands
+    background.parse_progress("Cbc0010I After 200 nodes, 3 on tree, 1e+50 best solution, best possible -124000 "
+                              "(0.80 seconds)", progress)
+    assert progress['nodes'] == 200
+    assert progress['incumbent'] == pytest.approx(120000 * VACANCY)
+    assert progress['bound'] == pytest.approx(124000 * VACANCY)
+
+
+def test_parse_progress_reads_highs_rows():
+    progress = {}
+    background.parse_progress(" T       0       0         0   0.00%   -125000         -120000            4.17%"
+                              "        0      0      0     3     0.0s", progress)
+    assert progress == {'nodes': 0, 'incumbent': pytest.approx(120000 * VACANCY),
+                        'bound': pytest.approx(125000 * VACANCY), 'gap': pytest.approx(5000 / 120000 * 100)}
+    # Without an incumbent HiGHS prints inf
+    progress = {}
+    background.parse_progress("         0       0         0   0.00%   -125000         inf                  inf"
+                              "        0      0      0         0     0.0s", progress)
+    assert progress == {'nodes': 0, 'bound': pytest.approx(125000 * VACANCY)}
+    assert background.parse_progress("Presolving model", {}) == {}
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_solve_scenario_edits_the_model_in_place(parcel, backend):
+    model, first = background.solve_scenario(None, scenario_for(parcel), backend=backend)
+    assert first['status'] == 'Optimal'
+    smaller = dict(parcel, net_residential_area=12000, set_aside_percentage=30)
+    same, result = background.solve_scenario(model, scenario_for(smaller), backend=backend)
+    assert same is model
+    solver = optimizer.make_solver(None, msg=False) if backend == 'cbc' else None
+    expected = optimizer.solve_parcel(smaller, solver=solver, backend=backend)
+    assert result['annual_profit_worst_case'] == pytest.approx(expected['annual_profit_worst_case'], rel=1e-6)
+    # New derived inputs need a new model
+    rebuilt, _ = background.solve_scenario(model, scenario_for(dict(parcel, ami_percentage=80)), backend=backend)
+    assert rebuilt is not model
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_worker_solves_in_its_own_process(parcel, backend):
+    worker = background.SolveWorker(backend)
+    try:
+        worker.submit(scenario_for(parcel), relaxed=False, time_limit=30)
+        log_path = worker.log_path
+        result = wait(worker)
+        assert result['status'] == 'Optimal'
+        solver = optimizer.make_solver(None, msg=False) if backend == 'cbc' else None
+        expected = optimizer.solve_parcel(parcel, solver=solver, backend=backend)
+        assert result['annual_profit_worst_case'] == pytest.approx(expected['annual_profit_worst_case'], rel=1e-6)
+        assert not os.path.exists(log_path)
+        assert not worker.running
+    finally:
+        worker.close()
+
+
+def test_cancelled_worker_restarts_on_the_next_submit(parcel):
+    worker = background.SolveWorker()
+    try:
+        worker.submit(scenario_for(synthetic_parcel(40, seed=7)))
+        log_path = worker.log_path
+        worker.cancel()
+        assert worker.process is None and not worker.running
+        assert not os.path.exists(log_path)
+        assert worker.poll() is None
+        worker.submit(scenario_for(parcel), relaxed=True)
+        assert wait(worker)['status'] == 'Optimal'
+    finally:
+        worker.close()
+
+
+def test_race_tags_the_winning_backend(parcel):
+    race = background.SolveRace()
+    try:
+        race.submit(scenario_for(parcel), time_limit=30)
+        result = wait(race)
+        assert result['status'] == 'Optimal'
+        assert result['backend'] in race.workers
+        assert result['diagnostics']['solver']['backend'] == result['backend']
+        assert not race.running
+    finally:
+        race.close()
@@ -0,0 +1,37 @@
+import io
+import json
+
+import pytest
+
+import batch
+import cache
+
+
+def run(parcels, solve_cache=None):
+    output = io.StringIO()
+    solved = batch.run_batch(parcels, output, workers=1, solve_cache=solve_cache)
+    results = {result['parcel']: result for result in map(json.loads, output.getvalue().splitlines())}
+    return solved, results
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_malformed_parcel_is_an_error_row(parcel, cached):
+    broken = dict(parcel, name='broken')
+    del broken['ami_incomes']
+    solve_cache = cache.SolveCache() if cached else None
+    solved, results = run([broken, parcel], solve_cache)
+    assert solved == 1
+    assert results['broken']['status'] == 'Error'
+    assert results['small']['status'] == 'Optimal'
+
+
+def test_cache_hits_stay_out_of_solver_time(parcel, tmp_path, capsys):
+    path = tmp_path / 'parcels.json'
+    path.write_text(json.dumps([parcel, dict(parcel, name='other', net_residential_area=25000)]))
+    argv = [str(path), '-w', '1', '--cache', str(tmp_path / 'cache.db'), '-o', str(tmp_path / 'out.jsonl')]
+    assert batch.main(argv) == 0
+    assert "Solver time" in capsys.readouterr().err
+    assert batch.main(argv) == 0
+    err = capsys.readouterr().err
+    assert "Solver time" not in err
+    assert "2 disk hits" in err
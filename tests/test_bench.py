@@ -0,0 +1,97 @@
+import copy
+import json
+
+import numpy as np
+import pytest
+
+import bench
+import optimizer
+
+
+def case(name='n5-c0', backend='highs', unit_types=5, interactive_seconds=0.1, **changes):
+    result = {
+        'name': name,
+        'backend': backend,
+        'unit_types': unit_types,
+        'phases': {'derived_inputs': 0.001, 'build': 0.010, 'solve_ilp': 0.100, 'extract': 0.001, 'solve_lp': 0.020},
+        'interactive_seconds': interactive_seconds,
+        'ilp_status': 'Optimal',
+        'lp_status': 'Optimal',
+        'ilp_objective': 100000.0,
+        'lp_objective': 101000.0,
+    }
+    result.update(changes)
+    return result
+
+
+def test_generated_parcels_are_reproducible_and_feasible():
+    parcels = bench.generate_parcels(sizes=(3, 8), cases=2, seed=4)
+    assert [parcel['name'] for parcel in parcels] == ['n3-c0', 'n3-c1', 'n8-c0', 'n8-c1']
+    # A parcel does not depend on the other sizes generated with it
+    assert bench.generate_parcels(sizes=(8,), cases=2, seed=4) == parcels[2:]
+    for parcel in parcels:
+        assert sum(unit['min_units'] for unit in parcel['units']) <= 50
+        assert sum(unit['max_units'] for unit in parcel['units']) > 100
+        assert optimizer.solve_parcel(parcel)['status'] in ('Optimal', 'Infeasible')
+
+
+def test_summarize_takes_medians_up_to_the_first_slow_size():
+    cases = [case(f"n{size}-c{i}", backend, size, seconds)
+             for backend, times in (('highs', {2: [0.1, 0.3, 0.2], 5: [0.5, 2.0, 0.9], 10: [1.5, 0.8, 3.0]}),
+                                    ('cbc', {2: [1.2, 1.1, 1.3], 5: [0.4, 0.4, 0.4]}))
+             for size, seconds_list in times.items() for i, seconds in enumerate(seconds_list)]
+    summary = bench.summarize(cases)
+    assert summary['highs'] == {'median_interactive_seconds': {'2': 0.2, '5': 0.9, '10': 1.5}, 'interactive_up_to': 5}
+    # Interactive at no size when the smallest is already too slow
+    assert summary['cbc'] == {'median_interactive_seconds': {'2': 1.2, '5': 0.4}, 'interactive_up_to': None}
+
+
+def test_compare_flags_slow_phases_and_changed_results():
+    baseline = {'cases': [case(), case(backend='cbc'), case('n9-c0')]}
+    report = copy.deepcopy(baseline)
+    assert bench.compare(report, baseline) == []
+
+    highs, cbc, _ = report['cases']
+    # 30% slower and over MIN_REGRESSION_DELTA; 50% slower but under it
+    highs['phases']['solve_ilp'] = 0.130
+    highs['phases']['extract'] = 0.0015
+    cbc['lp_status'] = 'Not Solved'
+    cbc['ilp_objective'] = 99000.0
+    # Cases only in one of the reports are skipped
+    report['cases'] = [highs, cbc, case('n20-c0')]
+    expected = [
+        "n5-c0 [highs] solve_ilp: 0.1000s -> 0.1300s",
+        "n5-c0 [cbc] lp_status: Optimal -> Not Solved",
+        "n5-c0 [cbc] ilp_objective: 100,000.00 -> 99,000.00",
+    ]
+    assert bench.compare(report, baseline) == expected
+    # A looser tolerance lets the slowdown pass, never a changed result
+    assert bench.compare(report, baseline, tolerance=0.5) == expected[1:]
+
+
+def test_run_case_times_every_phase():
+    parcel = bench.generate_parcel(np.random.default_rng(1), 4)
+    result = bench.run_case(parcel, optimizer.DEFAULT_BACKEND, repeat=2)
+    assert set(result['phases']) == set(bench.PHASES)
+    assert result['interactive_seconds'] == pytest.approx(
+        sum(result['phases'][phase] for phase in ('derived_inputs', 'build', 'solve_ilp', 'extract')))
+    if result['ilp_status'] == 'Optimal':
+        expected = optimizer.solve_parcel(parcel)['annual_profit_worst_case'] / optimizer.VACANCY_FACTOR
+        assert result['ilp_objective'] == pytest.approx(expected, rel=1e-6)
+        assert result['integrality_gap'] >= -1e-6
+
+
+def test_command_line_reports_regressions(tmp_path, capsys):
+    path = tmp_path / 'report.json'
+    argv = ['--sizes', '2', '--cases', '1', '-o', str(path)]
+    assert bench.main(argv) == 0
+    report = json.loads(path.read_text())
+    entry, = report['cases']
+    assert entry['name'] == 'n2-c0' and entry['ilp_status'] == 'Optimal'
+    # A baseline with a different objective is a regression
+    entry['ilp_objective'] += 1000
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps(report))
+    capsys.readouterr()
+    assert bench.main(argv + ['--baseline', str(baseline), '--tolerance', '1000']) == 1
+    assert "REGRESSION n2-c0" in capsys.readouterr().err
@@ -0,0 +1,89 @@
+import pytest
+
+import cache
+import optimizer
+import sweep
+
+OPTIMAL = {'status': 'Optimal', 'quantities': {'Studio': 10.0}}
+
+
+def test_lru_keeps_the_most_recently_used():
+    solve_cache = cache.SolveCache(maxsize=2)
+    solve_cache.put('a', dict(OPTIMAL, total_units=1.0))
+    solve_cache.put('b', dict(OPTIMAL, total_units=2.0))
+    assert solve_cache.get('a')['total_units'] == 1.0
+    solve_cache.put('c', dict(OPTIMAL, total_units=3.0))
+    # 'b' was used least recently, so it made room for 'c'
+    assert solve_cache.get('b') is None
+    assert [solve_cache.get(key)['total_units'] for key in ('a', 'c')] == [1.0, 3.0]
+    assert solve_cache.stats() == {'hits': 3, 'disk_hits': 0, 'misses': 1, 'size': 2}
+
+
+def test_results_are_copies():
+    solve_cache = cache.SolveCache()
+    result = dict(OPTIMAL)
+    solve_cache.put('a', result)
+    result['status'] = 'Changed'
+    solve_cache.get('a')['quantities']['Studio'] = 0.0
+    assert solve_cache.get('a') == OPTIMAL
+
+
+@pytest.mark.parametrize('status', ['Not Solved', 'Error', 'Undefined'])
+def test_unfinished_solves_are_not_kept(tmp_path, status):
+    solve_cache = cache.SolveCache(path=str(tmp_path / 'cache.db'))
+    solve_cache.put('a', {'status': status})
+    assert solve_cache.get('a') is None
+    solve_cache.close()
+
+
+def test_sqlite_round_trip(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first = cache.SolveCache(maxsize=1, path=path)
+    first.put('a', OPTIMAL)
+    first.put('b', {'status': 'Infeasible'})
+    first.close()
+
+    second = cache.SolveCache(maxsize=1, path=path)
+    assert second.get('a') == OPTIMAL
+    assert second.get('a') == OPTIMAL
+    assert second.get('b') == {'status': 'Infeasible'}
+    assert second.get('c') is None
+    # Disk hits are remembered in memory, within the LRU's size
+    assert second.stats() == {'hits': 1, 'disk_hits': 2, 'misses': 1, 'size': 1}
+    second.close()
+
+
+def test_scenario_key_ignores_spelling(parcel):
+    shuffled = dict(parcel, units=[dict(reversed(list(unit.items()))) for unit in reversed(parcel['units'])],
+                    net_residential_area=float(parcel['net_residential_area']),
+                    ami_incomes={size: int(income) for size, income in reversed(list(parcel['ami_incomes'].items()))})
+    assert cache.parcel_key(shuffled) == cache.parcel_key(parcel)
+
+
+@pytest.mark.parametrize('change', [
+    {'net_residential_area': 20001},
+    {'set_aside_percentage': 25},
+    {'ami_percentage': 80},
+    {'ami_incomes': {1: 70000, 2: 80000, 3: 91000}},
+    {'ami_tiers': [{'ami_percentage': 60}]},
+])
+def test_scenario_key_changes_with_the_inputs(parcel, change):
+    assert cache.parcel_key(dict(parcel, **change)) != cache.parcel_key(parcel)
+
+
+def test_scenario_key_changes_with_the_mix_limits(parcel):
+    units = [dict(parcel['units'][0], min_units=5)] + parcel['units'][1:]
+    assert cache.parcel_key(dict(parcel, units=units)) != cache.parcel_key(parcel)
+
+
+def test_scenario_key_separates_relaxed_and_backends(parcel):
+    keys = {cache.parcel_key(parcel, relaxed=relaxed, backend=backend)
+            for relaxed in (False, True) for backend in optimizer.BACKENDS}
+    assert len(keys) == 4
+    assert cache.parcel_key(parcel) == cache.parcel_key(parcel, backend=optimizer.DEFAULT_BACKEND)
+
+
+def test_sweep_points_share_batch_keys(parcel):
+    point, = sweep.grid_points(parcel)
+    for backend in optimizer.BACKENDS:
+        assert sweep.point_key(parcel, point, {}, backend) == cache.parcel_key(parcel, backend=backend)
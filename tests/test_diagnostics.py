@@ -0,0 +1,187 @@
+import io
+import json
+
+import pytest
+
+import diagnostics
+import optimizer
+from conftest import requires_cbc, synthetic_parcel
+
+CBC_LOG = """\
+Result - Optimal solution found
+
+Objective value:                1024014.00000000
+Enumerated nodes:               42
+Total iterations:               1337
+Time (CPU seconds):             0.21
+Time (Wallclock seconds):       0.25
+
+Total time (CPU seconds):       0.22   (Wallclock seconds):       0.26
+"""
+
+CBC_STOPPED_LOG = """\
+Continuous objective value is 1047458.58 - 0.00 seconds
+Result - Stopped on time limit
+
+Objective value:                1009314.00000000
+Lower bound:                    1036731.237
+Gap:                            0.03
+Enumerated nodes:               148
+Total iterations:               1139
+"""
+
+HIGHS_MIP_LOG = """\
+Solving report
+  Status            Optimal
+  Primal bound      -1024014
+  Dual bound        -1024086
+  Gap               0.00703% (tolerance: 0.01%)
+  Solution status   feasible
+                    -1024014 (objective)
+  Timing            0.30
+  Max sub-MIP depth 1
+  Nodes             315
+  Repair LPs        0
+  LP iterations     1905
+                    673 (strong br.)
+"""
+
+HIGHS_LP_LOG = """\
+Model status        : Optimal
+Simplex   iterations: 12
+Objective value     :  1.0474585830e+06
+HiGHS run time      :          0.01
+"""
+
+
+@pytest.fixture
+def records():
+    records = []
+    diagnostics.add_hook(records.append)
+    yield records
+    diagnostics.remove_hook(records.append)
+
+
+def test_parse_cbc_log():
+    assert diagnostics.parse_solver_log(CBC_LOG) == {'nodes': 42, 'iterations': 1337, 'solver_seconds': 0.26}
+    statistics = diagnostics.parse_solver_log(CBC_STOPPED_LOG)
+    assert statistics['gap'] == pytest.approx(3.0)
+    assert statistics['lp_objective'] == pytest.approx(1047458.58)
+    assert statistics['nodes'] == 148
+
+
+def test_parse_highs_log():
+    assert diagnostics.parse_solver_log(HIGHS_MIP_LOG) == {'gap': 0.00703, 'solver_seconds': 0.30, 'nodes': 315,
+                                                           'iterations': 1905}
+    assert diagnostics.parse_solver_log(HIGHS_LP_LOG) == {'iterations': 12, 'solver_seconds': 0.01}
+
+
+def test_parse_ignores_unreadable_values():
+    assert diagnostics.parse_solver_log("Gap:  nan%\nSome other line\n") == {}
+
+
+def test_apply_solver_log_splits_launch_time():
+    record = diagnostics.new_diagnostics()
+    record['phases'] = {'mps_write': 0.01, 'solve': 0.5}
+    record['solver']['nodes'] = 7
+    diagnostics.apply_solver_log(record, CBC_LOG)
+    # The solver interface's own statistics win over the log's
+    assert record['solver'] == {'nodes': 7, 'iterations': 1337}
+    assert record['phases']['solve'] == pytest.approx(0.26)
+    assert record['phases']['solver_launch'] == pytest.approx(0.24)
+
+
+def test_apply_solver_log_without_mps_keeps_solve_time():
+    record = diagnostics.new_diagnostics()
+    record['phases'] = {'solve': 0.5}
+    diagnostics.apply_solver_log(record, HIGHS_MIP_LOG)
+    assert record['phases'] == {'solve': 0.5}
+    assert record['solver']['nodes'] == 315
+
+
+def test_timed_accumulates():
+    record = diagnostics.new_diagnostics()
+    for _ in range(2):
+        with diagnostics.timed(record, 'build'):
+            pass
+    with pytest.raises(RuntimeError):
+        with diagnostics.timed(record, 'extract'):
+            raise RuntimeError
+    assert set(record['phases']) == {'build', 'extract'}
+    assert record['phases']['build'] >= 0
+
+
+def test_emit_reaches_hooks_until_removed(records):
+    record = diagnostics.emit('solve', status='Optimal')
+    assert records == [record]
+    assert record['event'] == 'solve' and record['status'] == 'Optimal' and 'time' in record
+    diagnostics.remove_hook(records.append)
+    diagnostics.emit('solve', status='Optimal')
+    assert len(records) == 1
+
+
+def test_json_lines_log():
+    stream = io.StringIO()
+    log = diagnostics.JsonLinesLog(stream=stream)
+    log({'event': 'solve', 'value': 1.5, 'path': object()})
+    log({'event': 'batch'})
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line['event'] for line in lines] == ['solve', 'batch']
+    assert lines[0]['value'] == 1.5
+    log.close()
+    assert not stream.closed
+
+
+def test_json_lines_log_to_file(tmp_path):
+    path = tmp_path / 'solves.log'
+    log = diagnostics.JsonLinesLog(path)
+    log({'event': 'solve'})
+    log.close()
+    assert json.loads(path.read_text()) == {'event': 'solve'}
+
+
+def test_log_from_environment(monkeypatch, tmp_path):
+    monkeypatch.delenv('WALNUT_LOG', raising=False)
+    assert diagnostics.log_from_environment() is None
+    monkeypatch.setenv('WALNUT_LOG', str(tmp_path / 'walnut.log'))
+    log = diagnostics.log_from_environment()
+    try:
+        diagnostics.emit('startup')
+    finally:
+        diagnostics.remove_hook(log)
+        log.close()
+    assert json.loads((tmp_path / 'walnut.log').read_text())['event'] == 'startup'
+
+
+def test_aggregator_summary():
+    aggregator = diagnostics.Aggregator()
+    aggregator({'event': 'solve', 'status': 'Optimal',
+                'diagnostics': {'phases': {'solve': 1.0}, 'solver': {'nodes': 10, 'status': 'Optimal'}}})
+    aggregator({'event': 'solve', 'status': 'Optimal',
+                'diagnostics': {'phases': {'solve': 3.0}, 'solver': {'nodes': 30}}})
+    aggregator({'event': 'solve', 'status': 'Infeasible', 'diagnostics': None})
+    aggregator({'event': 'batch', 'diagnostics': {'phases': {'solve': 100.0}}})
+    # A cache hit repeats the timings of the solve that filled the cache
+    aggregator({'event': 'solve', 'status': 'Optimal', 'cached': True,
+                'diagnostics': {'phases': {'solve': 50.0}, 'solver': {'nodes': 500}}})
+    summary = aggregator.summary()
+    assert summary['solves'] == 4
+    assert summary['cached'] == 1
+    assert summary['statuses'] == {'Optimal': 3, 'Infeasible': 1}
+    assert summary['totals'] == {
+        'phases.solve': {'total': 4.0, 'mean': 2.0, 'max': 3.0, 'count': 2},
+        'solver.nodes': {'total': 40, 'mean': 20.0, 'max': 30, 'count': 2},
+    }
+
+
+@requires_cbc
+def test_quiet_cbc_solve_reports_log_statistics():
+    parcel = synthetic_parcel(10, 0)
+    model = optimizer.build_model(optimizer.parcel_derived_inputs(parcel), parcel['units'],
+                                  parcel['net_residential_area'], parcel['set_aside_percentage'], backend='cbc')
+    result = model.solve(solver=optimizer.make_solver(None, msg=False))
+    assert result['status'] == 'Optimal'
+    solver = result['diagnostics']['solver']
+    assert solver['status'] == 'Optimal'
+    assert isinstance(solver['nodes'], int) and isinstance(solver['iterations'], int)
+    assert result['diagnostics']['phases']['solve'] >= 0
@@ -0,0 +1,62 @@
+import pytest
+
+import grid
+
+COLUMNS = [
+    ('unit', 'Unit Type', str, None),
+    ('sqft', 'Sq Ft', float, None),
+    ('rent', 'Market Rent', float, None),
+    ('min_units', 'Min %', grid.int_cell, 0),
+    ('max_units', 'Max %', grid.int_cell, 100),
+]
+
+
+def catalog():
+    table = grid.Table(COLUMNS, key=0)
+    table.import_rows(grid.parse_table("Studio\t500\t1,500\n1BR\t750\t2000\n"))
+    return table
+
+
+def test_parse_table_reads_spreadsheet_and_csv_text():
+    assert grid.parse_table("a\tb, c\n\n1\t2\n") == [['a', 'b, c'], ['1', '2']]
+    assert grid.parse_table('a,"b, c"\r\n1,2\r\n') == [['a', 'b, c'], ['1', '2']]
+    assert grid.parse_table("\n") == []
+
+
+def test_headerless_import_replaces_the_table():
+    table = catalog()
+    assert table.rows == [['Studio', '500', '1,500', '0', '100'], ['1BR', '750', '2000', '0', '100']]
+    table.import_rows([['2BR', '1000', '2600', '5', '50']])
+    assert table.rows == [['2BR', '1000', '2600', '5', '50']]
+
+
+def test_header_without_the_key_replaces_the_table():
+    table = catalog()
+    table.import_rows(grid.parse_table("market rent,MAX %\n1800,40\n2400\n"))
+    # The named columns are read, the others take their defaults
+    assert table.rows == [['', '', '1800', '0', '40'], ['', '', '2400', '0', '100']]
+
+
+def test_keyed_import_updates_existing_rows_and_appends_new_ones():
+    table = catalog()
+    table.resize(4)
+    table.import_rows(grid.parse_table("Max %,Unit Type,Min %\n60,1BR,10\n80,3BR,\n50,,5\n"))
+    # Blank placeholder rows and keyless imported rows are dropped
+    assert table.rows == [
+        ['Studio', '500', '1,500', '0', '100'],
+        ['1BR', '750', '2000', '10', '60'],
+        ['3BR', '', '', '', '80'],
+    ]
+
+
+def test_records_convert_cells():
+    assert catalog().records()[0] == {'unit': 'Studio', 'sqft': 500.0, 'rent': 1500.0, 'min_units': 0, 'max_units': 100}
+
+
+@pytest.mark.parametrize('column, text', [(1, 'wide'), (3, '12.5'), (4, '')])
+def test_records_name_the_bad_cell(column, text):
+    table = catalog()
+    table.set(1, column, text)
+    with pytest.raises(ValueError) as error:
+        table.records()
+    assert str(error.value) == f"Row 2, {COLUMNS[column][1]}: {text!r} is not a valid value"
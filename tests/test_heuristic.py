@@ -0,0 +1,54 @@
+import pytest
+
+import heuristic
+import optimizer
+from conftest import requires_scipy, synthetic_parcel
+
+pytestmark = requires_scipy
+
+if optimizer.HAS_SCIPY:
+    import matrix_solver
+
+CASES = [(3, 0), (5, 1), (10, 2), (25, 3)]
+
+
+def scenario_for(parcel):
+    return {
+        'derived_inputs': optimizer.parcel_derived_inputs(parcel),
+        'units': parcel['units'],
+        'net_residential_area': parcel['net_residential_area'],
+        'set_aside_percentage': parcel['set_aside_percentage'],
+    }
+
+
+def model_for(scenario):
+    return matrix_solver.MatrixModel(scenario['derived_inputs'], scenario['units'],
+                                     scenario['net_residential_area'], scenario['set_aside_percentage'])
+
+
+@pytest.mark.parametrize('unit_types, seed', CASES)
+def test_rounded_mix_is_feasible_and_bounded_by_optimum(unit_types, seed):
+    scenario = scenario_for(synthetic_parcel(unit_types, seed))
+    model = model_for(scenario)
+    lp = model.solve(relaxed=True)
+    ilp = model.solve()
+    assert lp['status'] == ilp['status'] == 'Optimal'
+
+    result = heuristic.rounded_result(scenario, lp)
+    assert result is not None
+    quantities = result['quantities']
+    assert all(value == int(value) and value >= 0 for value in quantities.values())
+    assert model.is_feasible(quantities)
+    assert result['annual_profit_worst_case'] <= ilp['annual_profit_worst_case'] + 1e-6
+    assert result['gap'] >= -1e-9
+
+
+def test_round_mix_of_parcel_fixture(parcel):
+    scenario = scenario_for(parcel)
+    model = model_for(scenario)
+    lp = model.solve(relaxed=True)
+    quantities = heuristic.round_mix(scenario['derived_inputs'], parcel['units'], parcel['net_residential_area'],
+                                     parcel['set_aside_percentage'], lp['quantities'])
+    assert quantities is not None
+    assert model.is_feasible(quantities)
+
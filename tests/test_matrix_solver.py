@@ -0,0 +1,43 @@
+import pytest
+
+import optimizer
+from conftest import requires_scipy
+
+pytestmark = requires_scipy
+
+
+def _model(parcel, backend='highs'):
+    derived_inputs = optimizer.parcel_derived_inputs(parcel)
+    return optimizer.build_model(derived_inputs, parcel['units'], parcel['net_residential_area'],
+                                 parcel['set_aside_percentage'], backend=backend)
+
+
+def test_infeasible_warm_start_is_ignored(parcel):
+    model = _model(parcel)
+    start = model.solve()['quantities']
+    # The mix for 20,000 sq. ft. no longer fits once the lot shrinks
+    model.set_net_residential_area(10000)
+    assert not model.is_feasible(start)
+    warm = model.solve(warm_start=start)
+    cold = _model(dict(parcel, net_residential_area=10000)).solve()
+    assert warm['status'] == cold['status'] == 'Optimal'
+    assert warm['annual_profit_worst_case'] == pytest.approx(cold['annual_profit_worst_case'])
+    assert warm['land_utilization_rate'] <= 100 + 1e-6
+
+
+def test_warm_start_never_hides_infeasibility(parcel):
+    start = _model(parcel).solve()['quantities']
+    # Minimum shares adding up to more than 100% leave no feasible mix
+    parcel['units'][0]['min_units'] = 60
+    parcel['units'][1]['min_units'] = 60
+    assert _model(parcel).solve(warm_start=start)['status'] == 'Infeasible'
+
+
+def test_feasible_warm_start_gives_same_optimum(parcel):
+    model = _model(parcel)
+    start = model.solve()['quantities']
+    model.set_set_aside_percentage(30)
+    warm = model.solve(warm_start=start)
+    cold = _model(dict(parcel, set_aside_percentage=30)).solve()
+    assert warm['status'] == 'Optimal'
+    assert warm['annual_profit_worst_case'] == pytest.approx(cold['annual_profit_worst_case'])
@@ -0,0 +1,98 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import montecarlo
+import optimizer
+from conftest import requires_scipy
+
+# A mix of the parcel fixture's unit types, a fifth of it affordable
+MIX = {'Studio': 12, 'Aff_Studio': 3, '1BR': 4, 'Aff_1BR': 1, '2BR': 0, 'Aff_2BR': 0}
+FIXED = {'rent': 1.0, 'ami': 1.0, 'vacancy': 1.0}
+
+
+def annual_profit(parcel, mix, rule):
+    # Profit of a mix under one cost rule, straight from the derived inputs
+    derived_inputs = optimizer.parcel_derived_inputs(parcel)
+    cost = getattr(derived_inputs, {'Sq. Ft. Rule': 'sq_ft_rule', '50% Rule': 'rule_50', 'Max': 'max_cost'}[rule])
+    return float(derived_inputs.quantity_vector(mix) @ (derived_inputs.rent - cost)) * 12
+
+
+def simulate(parcel, spec, mixes=(MIX,), **kwargs):
+    return montecarlo.simulate(parcel['units'], parcel['ami_incomes'], parcel['ami_percentage'], list(mixes), spec=spec,
+                               **kwargs)
+
+
+@pytest.mark.parametrize('rule', montecarlo.COST_RULES)
+def test_fixed_inputs_give_the_deterministic_profit(parcel, rule):
+    result, = simulate(parcel, dict(FIXED, cost_rule={rule: 1.0}), scenarios=1000, seed=0)
+    expected = annual_profit(parcel, MIX, rule)
+    for name in ('p5', 'p50', 'p95', 'mean'):
+        assert result[name] == pytest.approx(expected), name
+    assert result['probability_of_loss'] == (expected < 0)
+
+
+def test_default_spec_brackets_the_cost_rules(parcel):
+    # Fixed inputs and a coin flip between the Max and square foot rules
+    result, = simulate(parcel, None, scenarios=10000, seed=1)
+    worst = annual_profit(parcel, MIX, 'Max') * optimizer.VACANCY_FACTOR
+    best = annual_profit(parcel, MIX, 'Sq. Ft. Rule') * optimizer.VACANCY_FACTOR
+    assert worst < best
+    assert result['p5'] == pytest.approx(worst)
+    assert result['p95'] == pytest.approx(best)
+    assert result['mean'] == pytest.approx((worst + best) / 2, rel=0.02)
+    assert simulate(parcel, None, scenarios=10000, seed=1) == [result]
+
+
+def test_quantiles_of_normal_rents(parcel):
+    # The square foot rule does not depend on rent, so profit is normal:
+    # 12 x sum(market units x rent x draw) plus constants
+    spec = dict(FIXED, rent={'dist': 'normal', 'mean': 1.0, 'sd': 0.1}, cost_rule={'Sq. Ft. Rule': 1.0})
+    result, = simulate(parcel, spec, scenarios=400000, seed=2, batch_size=150000)
+    market = np.array([MIX[optimizer.unit_key(unit['name'])] * unit['rent'] for unit in parcel['units']])
+    mean = annual_profit(parcel, MIX, 'Sq. Ft. Rule')
+    sd = 12 * 0.1 * np.sqrt(np.sum(market ** 2))
+    assert result['mean'] == pytest.approx(mean, abs=0.01 * sd)
+    assert result['p50'] == pytest.approx(mean, abs=0.01 * sd)
+    assert result['p5'] == pytest.approx(mean - 1.6449 * sd, abs=0.02 * sd)
+    assert result['p95'] == pytest.approx(mean + 1.6449 * sd, abs=0.02 * sd)
+
+
+def test_mixes_share_scenarios(parcel):
+    # A mix scaled by two has exactly twice the profit in every scenario
+    spec = {'rent': {'dist': 'uniform', 'low': 0.8, 'high': 1.2},
+            'ami': {'dist': 'triangular', 'low': 0.9, 'mode': 1.0, 'high': 1.1}}
+    double = {unit_type: 2 * quantity for unit_type, quantity in MIX.items()}
+    single, doubled = simulate(parcel, spec, mixes=[MIX, double], scenarios=20000, seed=3)
+    for name in ('p5', 'p50', 'p95', 'mean'):
+        assert doubled[name] == pytest.approx(2 * single[name]), name
+    assert doubled['probability_of_loss'] == single['probability_of_loss']
+
+
+@requires_scipy
+def test_top_mixes_match_enumeration(parcel):
+    import matrix_solver
+
+    # Two unit types on a lot small enough to list every integer mix
+    units = parcel['units'][:2]
+    derived_inputs = optimizer.calculate_derived_inputs(units, optimizer.ami_limits(parcel['ami_incomes'], 60))
+    model = matrix_solver.MatrixModel(derived_inputs, units, 3000, 20)
+    feasible = []
+    for quantities in itertools.product(range(7), repeat=len(model.unit_types)):
+        mix = dict(zip(model.unit_types, map(float, quantities)))
+        if model.is_feasible(mix):
+            feasible.append(float(model.c @ np.append(derived_inputs.quantity_vector(mix), sum(quantities))))
+    # Each next mix is the best at least a dollar below the one before
+    expected = []
+    for value in sorted(feasible, reverse=True):
+        if not expected or value <= expected[-1] - 1.0:
+            expected.append(value)
+
+    assert len(expected) >= 4
+    mixes = montecarlo.top_mixes(model, 4)
+    assert len(mixes) == 4
+    for mix, value in zip(mixes, expected):
+        assert model.is_feasible(mix)
+        x = np.append(derived_inputs.quantity_vector(mix), sum(mix.values()))
+        assert float(model.c @ x) == pytest.approx(value, abs=1e-6)
@@ -0,0 +1,129 @@
+import sys
+
+import pytest
+from pulp import LpSolutionInfeasible, LpSolutionIntegerFeasible, LpSolutionOptimal, LpStatusInfeasible, LpStatusOptimal
+
+import optimizer
+from conftest import requires_scipy
+
+MIX = {'Studio': 10.0, 'Aff_Studio': 3.0, '1BR': 6.0, 'Aff_1BR': 2.0, '2BR': 0.0, 'Aff_2BR': 0.0}
+
+
+def test_solve_parcel_reports_plain_data(parcel):
+    result = optimizer.solve_parcel(parcel)
+    assert result['status'] == 'Optimal'
+    assert set(result['quantities']) == set(MIX)
+    assert result['land_utilization_rate'] <= 100 + 1e-6
+    assert result['annual_profit_best_case'] >= result['annual_profit_worst_case']
+    derived_inputs = optimizer.parcel_derived_inputs(parcel)
+    assert result['min_annual_salary'] == dict(zip(derived_inputs.unit_types, derived_inputs.min_salary.tolist()))
+    assert {'build', 'derived_inputs', 'solve'} <= set(result['diagnostics']['phases'])
+
+
+def cbc_model(parcel, monkeypatch, status, sol_status):
+    # A UnitMixModel whose CBC run ends with the given PuLP status, holding MIX
+    model = optimizer.build_model(optimizer.parcel_derived_inputs(parcel), parcel['units'],
+                                  parcel['net_residential_area'], parcel['set_aside_percentage'], backend='cbc')
+
+    def solve(solver):
+        for unit_type, var in model.unit_vars.items():
+            var.varValue = MIX[unit_type]
+        model.total_units_var.varValue = sum(MIX.values())
+        model.problem.status, model.problem.sol_status = status, sol_status
+
+    monkeypatch.setattr(model.problem, 'solve', solve)
+    return model
+
+
+@pytest.mark.parametrize('status, sol_status, expected', [
+    (LpStatusOptimal, LpSolutionOptimal, 'Optimal'),
+    # CBC stopped on its time limit with an incumbent
+    (LpStatusOptimal, LpSolutionIntegerFeasible, 'Not Solved'),
+    (LpStatusInfeasible, LpSolutionInfeasible, 'Infeasible'),
+])
+def test_cbc_status_mapping(parcel, monkeypatch, status, sol_status, expected):
+    model = cbc_model(parcel, monkeypatch, status, sol_status)
+    result = model.solve(solver=optimizer.make_solver(None))
+    assert result['status'] == result['diagnostics']['solver']['status'] == expected
+    if expected == 'Infeasible':
+        assert 'quantities' not in result
+    else:
+        assert result['quantities'] == MIX
+
+
+@requires_scipy
+@pytest.mark.parametrize('code, expected', [(0, 'Optimal'), (1, 'Not Solved'), (2, 'Infeasible'), (3, 'Unbounded'),
+                                            (9, 'Undefined')])
+def test_highs_status_mapping(parcel, monkeypatch, code, expected):
+    import numpy as np
+    from scipy.optimize import OptimizeResult
+
+    import matrix_solver
+
+    model = optimizer.build_model(optimizer.parcel_derived_inputs(parcel), parcel['units'],
+                                  parcel['net_residential_area'], parcel['set_aside_percentage'], backend='highs')
+    x = np.append(model.derived_inputs.quantity_vector(MIX), sum(MIX.values()))
+    # HiGHS reports a mix when it found one: at the optimum, or the best by its time limit
+    found = code in (0, 1)
+    res = OptimizeResult(status=code, x=x if found else None)
+    monkeypatch.setattr(matrix_solver, 'milp', lambda *args, **kwargs: res)
+    result = model.solve()
+    assert result['status'] == result['diagnostics']['solver']['status'] == expected
+    if found:
+        assert result['quantities'] == MIX
+    else:
+        assert 'quantities' not in result
+
+
+CANDIDATES = {'env': '/env/cbc', 'bundled': '/bundled/cbc', 'path': '/path/cbc', 'search': '/search/cbc',
+              'pulp': '/pulp/cbc'}
+
+
+@pytest.fixture
+def cbc_candidates(monkeypatch):
+    # One stand-in binary per place find_cbc looks; the test says which of them work
+    working = set()
+    probed = []
+
+    def works(path):
+        probed.append(path)
+        return path in working
+
+    monkeypatch.setattr(optimizer, '_found_cbc', None)
+    monkeypatch.setenv('WALNUT_CBC', CANDIDATES['env'])
+    monkeypatch.setattr(optimizer, 'cbc_path', CANDIDATES['bundled'])
+    monkeypatch.setattr(optimizer.shutil, 'which', lambda name: CANDIDATES['path'])
+    monkeypatch.setattr(optimizer, 'CBC_SEARCH_PATH', (CANDIDATES['search'],))
+    monkeypatch.setattr(optimizer, '_pulp_cbc', lambda: CANDIDATES['pulp'])
+    monkeypatch.setattr(optimizer, '_cbc_works', works)
+    return working, probed
+
+
+@pytest.mark.parametrize('found', list(CANDIDATES))
+def test_find_cbc_takes_the_first_working_candidate(cbc_candidates, found):
+    working, probed = cbc_candidates
+    order = list(CANDIDATES)
+    working.update(CANDIDATES[place] for place in order[order.index(found):])
+    assert optimizer.find_cbc() == CANDIDATES[found]
+    assert probed == [CANDIDATES[place] for place in order[:order.index(found) + 1]]
+    # Found once per process
+    assert optimizer.find_cbc() == CANDIDATES[found]
+    assert len(probed) == order.index(found) + 1
+
+
+def test_find_cbc_falls_back_to_cbc_path(cbc_candidates, monkeypatch):
+    _, probed = cbc_candidates
+    monkeypatch.delenv('WALNUT_CBC')
+    assert optimizer.find_cbc() == CANDIDATES['bundled']
+    assert probed == [CANDIDATES[place] for place in ('bundled', 'path', 'search', 'pulp')]
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="needs a POSIX shell")
+@pytest.mark.parametrize('script, mode, expected', [('exit 0', 0o755, True), ('exit 1', 0o755, False),
+                                                     ('exit 0', 0o644, False)])
+def test_cbc_works_runs_the_binary(tmp_path, script, mode, expected):
+    path = tmp_path / 'cbc'
+    path.write_text(f"#!/bin/sh\n{script}\n")
+    path.chmod(mode)
+    assert optimizer._cbc_works(str(path)) is expected
+    assert optimizer._cbc_works(str(tmp_path / 'missing')) is False
@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import optimizer
+from conftest import requires_scipy, synthetic_parcel
+
+pytestmark = requires_scipy
+
+if optimizer.HAS_SCIPY:
+    from scipy import sparse
+    from scipy.optimize import Bounds, LinearConstraint, milp
+
+    import matrix_solver
+    import portfolio
+
+TARGETS = {'set_aside_percentage': 35}
+
+
+def parcels():
+    return [synthetic_parcel(unit_types, seed) for seed, unit_types in enumerate((3, 4, 5, 4))]
+
+
+def monolithic_objective(parcels, targets):
+    # Every parcel's model side by side plus the shared target rows, as one MIP
+    models, target_blocks = [], []
+    for parcel in parcels:
+        derived_inputs = optimizer.parcel_derived_inputs(parcel)
+        models.append(matrix_solver.MatrixModel(derived_inputs, parcel['units'], parcel['net_residential_area'],
+                                                parcel['set_aside_percentage']))
+        G, rhs = portfolio.target_rows(derived_inputs, targets)
+        target_blocks.append(np.hstack([G, np.zeros((len(G), 1))]))
+    A = sparse.block_diag([model.A for model in models])
+    constraints = [LinearConstraint(A, np.concatenate([m.lb for m in models]), np.concatenate([m.ub for m in models])),
+                   LinearConstraint(np.hstack(target_blocks), rhs, np.inf)]
+    c = np.concatenate([model.c for model in models])
+    res = milp(-c, constraints=constraints, integrality=np.ones(len(c)), bounds=Bounds(0, np.inf))
+    assert res.status == 0
+    return -res.fun
+
+
+def test_within_reported_gap_of_monolithic_mip():
+    result = portfolio.solve_portfolio(parcels(), workers=1, tolerance=1e-6, **TARGETS)
+    assert result['status'] in ('Optimal', 'Not Solved')
+    best = monolithic_objective(parcels(), TARGETS)
+    slack = 1e-6 * max(1.0, abs(best))
+    assert result['objective'] <= best + slack
+    assert result['upper_bound'] >= best - slack
+    assert result['objective'] >= best - result['gap'] / 100 * max(1.0, abs(result['objective'])) - slack
+    assert result['affordable_percentage'] >= TARGETS['set_aside_percentage'] - 1e-6
+
+
+def test_failed_pricing_solve_is_skipped(monkeypatch):
+    # Parcel 0 stops being solved once the starting mixes are in, as on a time limit
+    price_parcels = portfolio.price_parcels
+    calls = {'count': 0}
+
+    def flaky(jobs):
+        solved = []
+        for i, status, quantities in price_parcels(jobs):
+            if i == 0:
+                calls['count'] += 1
+                if calls['count'] > 2:
+                    status, quantities = 'Not Solved', None
+            solved.append((i, status, quantities))
+        return solved
+
+    # Threads instead of processes, so the patched function is the one called
+    monkeypatch.setattr(portfolio, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(portfolio, 'price_parcels', flaky)
+    result = portfolio.solve_portfolio(parcels(), workers=1, **TARGETS)
+    assert result['pricing_failures'] > 0
+    assert result['status'] in ('Optimal', 'Not Solved')
+    assert len(result['parcels']) == 4
+
+
+def test_models_do_not_carry_over_between_portfolios(monkeypatch):
+    # Threads share the module's model cache, as forked workers share their parent's
+    monkeypatch.setattr(portfolio, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    first = parcels()
+    second = [synthetic_parcel(unit_types, seed) for seed, unit_types in enumerate((5, 3, 4, 6), start=10)]
+    expected = portfolio.solve_portfolio(second, workers=1, **TARGETS)
+    portfolio.solve_portfolio(first, workers=1, **TARGETS)
+    result = portfolio.solve_portfolio(second, workers=1, **TARGETS)
+    assert result['objective'] == pytest.approx(expected['objective'])
+    assert result['parcels'] == expected['parcels']
+
+
+@pytest.mark.parametrize('status', ['Not Solved', 'Infeasible'])
+def test_first_round_failure_names_only_infeasible_parcels(monkeypatch, status):
+    price_parcels = portfolio.price_parcels
+
+    def failing(jobs):
+        return [(i, status, None) if i == 1 else (i, found, quantities)
+                for i, found, quantities in price_parcels(jobs)]
+
+    monkeypatch.setattr(portfolio, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(portfolio, 'price_parcels', failing)
+    result = portfolio.solve_portfolio(parcels(), workers=1, **TARGETS)
+    assert result['status'] == status
+    if status == 'Infeasible':
+        assert result['infeasible_parcel'] == parcels()[1]['name']
+    else:
+        assert 'infeasible_parcel' not in result
@@ -0,0 +1,123 @@
+import json
+
+import numpy as np
+import pytest
+
+import optimizer
+from conftest import HAS_CBC, requires_scipy, synthetic_parcel
+
+pytestmark = requires_scipy
+
+if optimizer.HAS_SCIPY:
+    import matrix_solver
+    import ranging
+
+SEEDS = [(5, 0), (8, 1), (12, 2)]
+
+
+def model_for(parcel):
+    return matrix_solver.MatrixModel(optimizer.parcel_derived_inputs(parcel), parcel['units'],
+                                     parcel['net_residential_area'], parcel['set_aside_percentage'])
+
+
+def lp_objective(model):
+    result = model.solve(relaxed=True)
+    assert result['status'] == 'Optimal'
+    return result['diagnostics']['solver']['objective']
+
+
+def step(allowable, reference):
+    # Half way into the allowable range, and no further than 10% of the value
+    return 0.5 * min(allowable, max(1.0, 0.1 * abs(reference)))
+
+
+@pytest.mark.parametrize('unit_types, seed', SEEDS)
+def test_shadow_prices_hold_across_rhs_ranges(unit_types, seed):
+    model = model_for(synthetic_parcel(unit_types, seed))
+    report = ranging.ranging_report(model)
+    base = lp_objective(model)
+    checked = 0
+    for i, row in enumerate(report['rhs']):
+        for allowable, sign in ((row['allowable_increase'], 1), (row['allowable_decrease'], -1)):
+            if not allowable > 1e-6:
+                continue
+            delta = sign * step(allowable, row['rhs'])
+            lb, ub = model.lb[i], model.ub[i]
+            if lb == ub:
+                model.lb[i] = model.ub[i] = lb + delta
+            elif np.isfinite(ub):
+                model.ub[i] = ub + delta
+            else:
+                model.lb[i] = lb + delta
+            perturbed = lp_objective(model)
+            model.lb[i], model.ub[i] = lb, ub
+            assert perturbed - base == pytest.approx(row['shadow_price'] * delta, rel=1e-6, abs=1e-4), row['constraint']
+            checked += 1
+    assert checked
+
+
+@pytest.mark.parametrize('unit_types, seed', SEEDS)
+def test_mix_stays_optimal_across_rent_ranges(unit_types, seed):
+    model = model_for(synthetic_parcel(unit_types, seed))
+    report = ranging.ranging_report(model)
+    base = lp_objective(model)
+    for entry in report['objective']:
+        unit_type, rent = entry['unit_type'], float(model.derived_inputs.rent[model.index[entry['unit_type']]])
+        for allowable, sign in ((entry['rent_increase'], 1), (entry['rent_decrease'], -1)):
+            if not allowable > 1e-6:
+                continue
+            delta = sign * step(allowable, rent)
+            model.set_rent(unit_type, rent + delta)
+            perturbed = lp_objective(model)
+            model.set_rent(unit_type, rent)
+            # The same mix stays optimal, so only its own revenue moves
+            assert perturbed - base == pytest.approx(12 * delta * entry['quantity'], rel=1e-6, abs=1e-4), unit_type
+
+
+def test_parametric_area_matches_fresh_solves(parcel):
+    model = model_for(parcel)
+    values = [8000, 12000, 20000, 26000, 40000]
+    for value, result in ranging.parametric(model, 'net_residential_area', values):
+        fresh = model_for(dict(parcel, net_residential_area=value)).solve(relaxed=True)
+        assert result['status'] == fresh['status']
+        if fresh['status'] == 'Optimal':
+            assert result['annual_profit_worst_case'] == pytest.approx(fresh['annual_profit_worst_case'], rel=1e-7)
+    assert model.net_residential_area == parcel['net_residential_area']
+
+
+def test_report_reuses_the_basis_of_the_last_lp_solve(parcel):
+    model = model_for(parcel)
+    assert ranging.last_basis(model) is None
+    model.solve(relaxed=True)
+    basis = ranging.last_basis(model)
+    assert basis is not None
+    assert ranging.ranging_report(model, basis) == ranging.ranging_report(model_for(parcel))
+    # An edited model no longer matches the solve
+    model.set_net_residential_area(10000)
+    assert ranging.last_basis(model) is None
+
+
+def test_worker_report_on_either_backend(parcel):
+    import background
+
+    expected = ranging.ranging_report(model_for(parcel))
+    scenario = {'derived_inputs': optimizer.parcel_derived_inputs(parcel), 'units': parcel['units'],
+                'net_residential_area': parcel['net_residential_area'],
+                'set_aside_percentage': parcel['set_aside_percentage']}
+    for backend in ['highs'] + (['cbc'] if HAS_CBC else []):
+        model, result = background.solve_scenario(None, scenario, relaxed=True, backend=backend)
+        assert result['status'] == 'Optimal'
+        assert background.ranging_report(model, scenario) == expected
+
+
+def test_command_line_writes_strict_json(parcel, tmp_path, capsys):
+    path = tmp_path / 'parcels.json'
+    path.write_text(json.dumps([parcel]))
+    assert ranging.main([str(path)]) == 0
+    report = json.loads(capsys.readouterr().out, parse_constant=lambda name: pytest.fail(f"{name} in the output"))
+    # Unbounded ranges come out as null
+    expected = ranging.ranging_report(model_for(parcel))
+    for output, entry in zip(report['rhs'], expected['rhs']):
+        increase = entry['allowable_increase']
+        assert output['allowable_increase'] == (increase if np.isfinite(increase) else None)
+    assert any(entry['allowable_increase'] is None for entry in report['rhs'])
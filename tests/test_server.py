@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import server
+from conftest import requires_scipy
+
+pytestmark = requires_scipy
+
+
+@pytest.fixture(scope='module')
+def url():
+    service = server.SolveService(workers=1)
+    service.warm_up()
+    httpd = server.Server(('127.0.0.1', 0), service)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+    service.close()
+
+
+def request(url, path, body=None):
+    data = None if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode())
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url + path, data)) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_solve_and_error_metrics(url, parcel):
+    status, result = request(url, '/solve', dict(parcel, sensitivity=True))
+    assert status == 200 and result['status'] == 'Optimal'
+    assert 'shadow_prices' in result['sensitivity']
+    assert request(url, '/solve', b'{not json')[0] == 400
+    assert request(url, '/solve', {'units': []})[0] == 400
+    assert request(url, '/batch', {'parcels': 'none'})[0] == 400
+    bad = dict(parcel, units=[dict(parcel['units'][0], sqft='wide')])
+    assert request(url, '/solve', bad)[0] == 400
+    status, batch = request(url, '/batch', {'parcels': [parcel, {'name': 'empty'}]})
+    assert status == 200
+    assert [result['status'] for result in batch['results']] == ['Optimal', 'Error']
+    assert request(url, '/solve', parcel)[0] == 200
+
+    metrics = request(url, '/metrics')[1]
+    assert metrics['counts']['errors'] == 5
+    assert metrics['counts']['requests'] == 8
+    assert metrics['responses']['400'] == 4
+    assert metrics['counts']['cached'] == 1
+
+
+@pytest.mark.parametrize('relaxed', [False, True])
+def test_sensitivity_solve_keeps_request_settings(monkeypatch, parcel, relaxed):
+    calls = []
+    solve_scenario = server.background.solve_scenario
+
+    def spy(model, scenario, relaxed=False, time_limit=None, mip_gap=None, backend=None, cbc=None, warm_start=None):
+        calls.append((relaxed, time_limit, backend))
+        return solve_scenario(model, scenario, relaxed, time_limit, mip_gap, backend, cbc, warm_start)
+
+    monkeypatch.setattr(server.background, 'solve_scenario', spy)
+    monkeypatch.setattr(server, '_worker_backend', 'highs')
+    monkeypatch.setattr(server, '_worker_model', None)
+    result = server._solve({'parcel': parcel, 'relaxed': relaxed, 'sensitivity': True, 'time_limit': 7})
+    assert {(time_limit, backend) for _, time_limit, backend in calls} == {(7, 'highs')}
+    assert [relaxed for relaxed, _, _ in calls] == ([True] if relaxed else [False, True])
+    sensitivity = result if relaxed else result['sensitivity']
+    assert sensitivity['ranging']['rhs']
+
+
+def test_batch_members_are_timed_from_their_own_start(monkeypatch, parcel):
+    # One worker thread takes both requests in one batch; the slow one runs first
+    def fake_solve(request):
+        time.sleep(request['time_limit'])
+        return {'status': 'Optimal'}
+
+    monkeypatch.setattr(server, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(server, '_init_worker', lambda backend, cbc: None)
+    monkeypatch.setattr(server, '_solve', fake_solve)
+    service = server.SolveService(workers=1, batch_window=0.2)
+    try:
+        slow = {'parcel': parcel, 'time_limit': 1.0}
+        fast = {'parcel': dict(parcel, net_residential_area=10000), 'time_limit': 0.1}
+        futures = [service.submit(slow), service.submit(fast)]
+        assert [service.wait(future, 0.5 + request['time_limit']) for future, request in zip(futures, (slow, fast))] \
+            == [{'status': 'Optimal'}] * 2
+        assert service.metrics.counts['batches'] == 1
+        assert service.metrics.counts['timeouts'] == 0
+    finally:
+        service.close()
@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+
+import pytest
+
+import optimizer
+import sweep
+from conftest import HUD_CSV, requires_cbc, synthetic_parcel
+
+BACKENDS = [pytest.param('highs', marks=pytest.mark.skipif(not optimizer.HAS_SCIPY, reason="SciPy/HiGHS not installed")),
+            pytest.param('cbc', marks=requires_cbc)]
+
+
+def fresh_solve(parcel, point, backend):
+    # The grid point solved on its own, from a model built for it
+    units = [dict(unit) for unit in parcel['units']]
+    for unit in units:
+        unit['min_units'], unit['max_units'] = point['mix'].get(optimizer.unit_key(unit['name']),
+                                                                (unit['min_units'], unit['max_units']))
+    solver = optimizer.make_solver(None, msg=False) if backend == 'cbc' else None
+    return optimizer.solve_parcel(dict(parcel, units=units, ami_percentage=point['ami_percentage'],
+                                       net_residential_area=point['net_residential_area'],
+                                       set_aside_percentage=point['set_aside_percentage']),
+                                  solver=solver, backend=backend)
+
+
+def assert_matches_fresh_solves(parcel, points, backend):
+    rows = sweep.solve_chunk(parcel, points, backend=backend)
+    for point, result in rows:
+        expected = fresh_solve(parcel, point, backend)
+        assert result['status'] == expected['status'], point
+        if expected['status'] == 'Optimal':
+            assert result['annual_profit_worst_case'] == pytest.approx(expected['annual_profit_worst_case'], rel=1e-6), point
+            assert result['land_utilization_rate'] <= 100 + 1e-6
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_shrinking_lot_matches_fresh_solves(parcel, backend):
+    # Each point's mix overfills the next, smaller lot
+    points = sweep.grid_points(parcel, set_aside=[20, 40], area=[20000, 15000, 10000])
+    assert_matches_fresh_solves(parcel, points, backend)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_grid_matches_fresh_solves(backend):
+    parcel = synthetic_parcel(5, seed=3)
+    area = parcel['net_residential_area']
+    unit_name = optimizer.unit_key(parcel['units'][0]['name'])
+    points = sweep.grid_points(parcel, set_aside=[10, 25, 40], ami=[50, 80], area=[area, area * 0.6],
+                               mix={unit_name: [(0, 100), (20, 40)]})
+    assert_matches_fresh_solves(parcel, points, backend)
+
+
+def test_snake_order_changes_one_axis_at_a_time():
+    points = list(sweep.snake_product([[1, 2], [3, 4], [5, 6]]))
+    assert len(set(points)) == 8
+    for a, b in zip(points, points[1:]):
+        assert sum(x != y for x, y in zip(a, b)) == 1
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_ami_area_axis_matches_fresh_solves(parcel, hud_table, backend):
+    points = sweep.grid_points(parcel, set_aside=[20, 40], ami=[60, 80], ami_area=['Springfield', 'Shelbyville'])
+    regional = sweep.regional_inputs(parcel, hud_table, points)
+    rows = sweep.solve_chunk(parcel, points, backend=backend, regional=regional)
+    solver = optimizer.make_solver(None, msg=False) if backend == 'cbc' else None
+    for point, result in rows:
+        # 60% is scaled from the median, 80% is HUD's own limit
+        ami_values = dict(zip([1, 2, 3], hud_table.limits([point['ami_area']], point['ami_percentage'], sizes=[1, 2, 3])[0]))
+        derived_inputs = optimizer.calculate_derived_inputs(parcel['units'], ami_values)
+        expected = optimizer.solve_problem(derived_inputs, parcel['units'], point['net_residential_area'],
+                                           point['set_aside_percentage'], solver=solver, backend=backend)
+        assert result['status'] == expected['status'] == 'Optimal', point
+        assert result['annual_profit_worst_case'] == pytest.approx(expected['annual_profit_worst_case'], rel=1e-6), point
+
+
+def test_ami_area_axis_through_the_command_line(parcel, tmp_path, capsys):
+    path = tmp_path / 'parcels.json'
+    path.write_text(json.dumps([parcel]))
+    limits = tmp_path / 'limits.csv'
+    limits.write_text(HUD_CSV)
+    argv = [str(path), '--ami-table', str(limits), '--ami-area', 'Springfield,Shelbyville', '--ami', '60',
+            '-w', '1', '--cache', str(tmp_path / 'cache.db')]
+    assert sweep.main(argv) == 0
+    first = capsys.readouterr().out
+    rows = list(csv.DictReader(io.StringIO(first)))
+    assert [row['ami_area'] for row in rows] == ['Springfield', 'Shelbyville']
+    assert rows[0]['annual_profit_worst_case'] != rows[1]['annual_profit_worst_case']
+    # The second run is answered from the cache, under the same keys
+    assert sweep.main(argv) == 0
+    captured = capsys.readouterr()
+    assert captured.out == first
+    assert "2 disk hits" in captured.err
+
+    with pytest.raises(SystemExit):
+        sweep.main([str(path), '--ami-area', 'Springfield'])
+    with pytest.raises(SystemExit):
+        sweep.main([str(path), '--ami-table', str(limits), '--ami-area', 'Ogdenville'])
@@ -0,0 +1,62 @@
+import pytest
+
+import batch
+import heuristic
+import montecarlo
+import optimizer
+import sweep
+from conftest import requires_scipy
+
+TIERS = [{'ami_percentage': 50, 'min_share': 5}, {'ami_percentage': 80}]
+
+
+@pytest.fixture
+def tiered(parcel):
+    parcel = dict(parcel, ami_tiers=TIERS, income_average=60)
+    del parcel['ami_percentage']
+    return parcel
+
+
+def test_repeated_tier_is_rejected(tiered):
+    tiered['ami_tiers'] = [{'ami_percentage': 50}, {'ami_percentage': 50.0}]
+    with pytest.raises(ValueError, match="repeat 50% AMI"):
+        optimizer.parcel_derived_inputs(tiered)
+    with pytest.raises(ValueError, match="repeat"):
+        batch.parse_ami_tiers("60;60:10")
+
+
+def test_parse_ami_tiers():
+    assert batch.parse_ami_tiers("30:10; 60") == [{'ami_percentage': 30.0, 'min_share': 10.0}, {'ami_percentage': 60.0}]
+
+
+@requires_scipy
+def test_sweep_matches_fresh_solves(tiered):
+    points = sweep.grid_points(tiered, set_aside=[20, 40], area=[20000, 10000])
+    for point, result in sweep.solve_chunk(tiered, points):
+        expected = optimizer.solve_parcel(dict(tiered, net_residential_area=point['net_residential_area'],
+                                               set_aside_percentage=point['set_aside_percentage']))
+        assert result['status'] == expected['status'] == 'Optimal'
+        assert result['annual_profit_worst_case'] == pytest.approx(expected['annual_profit_worst_case'])
+
+
+def test_sweep_rejects_ami_axis(tiered):
+    with pytest.raises(ValueError, match="single-level"):
+        sweep.grid_points(tiered, ami=[50, 60])
+
+
+@requires_scipy
+def test_fixed_inputs_reproduce_worst_case_profit(tiered):
+    result = optimizer.solve_parcel(tiered)
+    spec = {'cost_rule': {'Max': 1.0}}
+    risk, = montecarlo.simulate(tiered['units'], tiered['ami_incomes'], None, [result['quantities']], spec=spec,
+                                scenarios=1000, seed=0, ami_tiers=TIERS)
+    assert risk['p50'] == pytest.approx(result['annual_profit_worst_case'])
+
+
+@requires_scipy
+def test_round_mix_rejects_tiers(tiered):
+    derived_inputs = optimizer.parcel_derived_inputs(tiered)
+    lp = optimizer.solve_parcel(tiered, relaxed=True)
+    with pytest.raises(ValueError, match="AMI tiers"):
+        heuristic.round_mix(derived_inputs, tiered['units'], tiered['net_residential_area'],
+                            tiered['set_aside_percentage'], lp['quantities'])